@@ -0,0 +1,248 @@
+# alert_state.py
+# وظیفه: وضعیت آخرین هشدار هر نماد (زمان، امتیاز، قیمت) برای جلوگیری از ارسال تکراری هشدارها
+
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime, time as dt_time, timedelta
+from zoneinfo import ZoneInfo
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# --- کلیدهای Redis ---
+# وضعیت برای هر (چت، نماد) جداگانه نگه داشته می‌شود (فیلد: "chat_id:نماد") تا ارسال ناموفق به یک مشترک،
+# Cooldown مشترکین دیگر را تعیین نکند
+# HASH: چت:نماد -> JSON {'ts', 'score', 'price'} آخرین هشدار ارسال‌شده
+ALERT_STATE_KEY = "alerts:state"
+# HASH: چت:نماد -> زمان (epoch) ورود هشدار به صف ارسال؛ تا تأیید/شکست ارسال، هشدار تکراری در صف قرار نمی‌گیرد
+ALERT_PENDING_KEY = "alerts:pending"
+# وضعیت‌ها نیمه‌شب (به وقت تهران) منقضی می‌شوند تا هر روز معاملاتی از صفر شروع شود
+TEHRAN_TZ = ZoneInfo("Asia/Tehran")
+
+# --- تنظیمات ---
+# بعد از ارسال هشدار یک نماد به یک چت، تا این مدت هشدار تکراری ارسال نمی‌شود...
+ALERT_COOLDOWN_SECONDS = int(os.getenv("ALERT_COOLDOWN_SECONDS", 1800))
+# ...مگر اینکه امتیاز حداقل به این اندازه (از ۱۰) تغییر کند
+ALERT_SCORE_DELTA = float(os.getenv("ALERT_SCORE_DELTA", 1.0))
+# ...یا قیمت حداقل این درصد نسبت به قیمت آخرین هشدار جابجا شود
+ALERT_PRICE_DELTA_PERCENT = float(os.getenv("ALERT_PRICE_DELTA_PERCENT", 2.0))
+# حداکثر عمر وضعیت «در صف ارسال» (باید از بدترین زمان ارسال با retry_after و تلاش‌های مجدد بیشتر باشد)؛
+# اگر نتیجه ارسال هیچ‌وقت ثبت نشود (مثلاً خروج برنامه)، بعد از این مدت هشدار دوباره قابل ارسال است
+ALERT_PENDING_TTL_SECONDS = float(os.getenv("ALERT_PENDING_TTL_SECONDS", 300))
+
+# نسخه درون‌پردازه‌ای وضعیت‌ها؛ همیشه همراه Redis به‌روز می‌شود و در زمان قطعی Redis استفاده می‌شود
+_memory_state: Dict[str, Dict[str, float]] = {}
+_memory_pending: Dict[str, float] = {}
+_memory_lock = threading.Lock()
+
+
+def reset_state():
+    """نسخه درون‌پردازه‌ای وضعیت‌ها را پاک می‌کند (وضعیت Redis دست نمی‌خورد)."""
+    with _memory_lock:
+        _memory_state.clear()
+        _memory_pending.clear()
+
+
+def _alert_key(chat_id: str, alert: Dict[str, Any]) -> str:
+    return f"{chat_id}:{alert.get('symbol_name') or alert.get('symbol_id')}"
+
+
+def _keys(alerts_by_chat: Dict[str, List[Dict[str, Any]]]) -> List[str]:
+    return [_alert_key(chat_id, alert) for chat_id, alerts in alerts_by_chat.items() for alert in alerts]
+
+
+# ---------------------------------------------------------
+# خواندن و نوشتن وضعیت
+# ---------------------------------------------------------
+def load_alert_state(client, keys: Iterable[str]) -> Dict[str, Dict[str, float]]:
+    """
+    وضعیت آخرین هشدار هر کلید چت:نماد (به همراه 'pending_at' اگر هشدار در صف ارسال باشد)؛
+    اگر Redis در دسترس نباشد از نسخه درون‌پردازه‌ای خوانده می‌شود.
+    """
+    keys = list(keys)
+    if not keys:
+        return {}
+    if client is not None:
+        try:
+            pipe = client.pipeline()
+            pipe.hmget(ALERT_STATE_KEY, keys)
+            pipe.hmget(ALERT_PENDING_KEY, keys)
+            values, pending = pipe.execute()
+            states = {key: json.loads(raw) for key, raw in zip(keys, values) if raw}
+            for key, pending_at in zip(keys, pending):
+                if pending_at:
+                    states.setdefault(key, {})['pending_at'] = float(pending_at)
+            return states
+        except Exception as e:
+            logger.warning(f"⚠️ Alert state unavailable in Redis ({e}). Using in-memory state.")
+    with _memory_lock:
+        states = {key: dict(_memory_state[key]) for key in keys if key in _memory_state}
+        for key in keys:
+            if key in _memory_pending:
+                states.setdefault(key, {})['pending_at'] = _memory_pending[key]
+        return states
+
+
+def _next_midnight() -> int:
+    """زمان (epoch) نیمه‌شب بعدی به وقت تهران؛ بر خلاف expire با هر نوشتن جلو نمی‌رود."""
+    tomorrow = datetime.now(TEHRAN_TZ).date() + timedelta(days=1)
+    return int(datetime.combine(tomorrow, dt_time.min, tzinfo=TEHRAN_TZ).timestamp())
+
+
+def _write_state(client, states: Dict[str, Dict[str, float]], pending: Dict[str, float], settled: List[str]):
+    """
+    یک Pipeline برای ثبت وضعیت‌ها: states (آخرین هشدار ارسال‌شده)، pending (ورود به صف ارسال)
+    و settled (کلیدهایی که وضعیت «در صف» آن‌ها پاک می‌شود).
+    """
+    with _memory_lock:
+        _memory_state.update(states)
+        _memory_pending.update(pending)
+        for key in settled:
+            _memory_pending.pop(key, None)
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline()
+        if states:
+            pipe.hset(ALERT_STATE_KEY, mapping={key: json.dumps(state) for key, state in states.items()})
+            pipe.expireat(ALERT_STATE_KEY, _next_midnight())
+        if pending:
+            pipe.hset(ALERT_PENDING_KEY, mapping=pending)
+            # فیلدهای قدیمی‌تر از ALERT_PENDING_TTL_SECONDS بی‌اثرند؛ Hash بعد از این مدت بدون هشدار جدید حذف می‌شود
+            pipe.expire(ALERT_PENDING_KEY, int(ALERT_PENDING_TTL_SECONDS))
+        if settled:
+            pipe.hdel(ALERT_PENDING_KEY, *settled)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to persist alert state to Redis ({e}). Kept in memory only.")
+
+
+def _sent_state(alert: Dict[str, Any], now: float) -> Dict[str, float]:
+    return {'ts': now, 'score': float(alert.get('score') or 0), 'price': float(alert.get('last_price') or 0)}
+
+
+def mark_pending(client, alerts_by_chat: Dict[str, List[Dict[str, Any]]], now: Optional[float] = None):
+    """هشدارهایی که در صف ارسال قرار گرفته‌اند را «در صف» علامت می‌زند (تا چرخه‌های بعدی آن‌ها را تکرار نکنند)."""
+    keys = _keys(alerts_by_chat)
+    if not keys:
+        return
+    now = now or time.time()
+    _write_state(client, {}, {key: now for key in keys}, [])
+
+
+def settle_alerts(
+    client,
+    alerts: List[Dict[str, Any]],
+    delivered: Iterable[str],
+    failed: Iterable[str],
+    now: Optional[float] = None,
+):
+    """
+    نتیجه ارسال یک پیام به گروهی از چت‌ها در یک Pipeline ثبت می‌شود:
+    برای چت‌های delivered آخرین هشدار ثبت و برای چت‌های failed وضعیت «در صف» پاک می‌شود
+    (تا هشدار در چرخه بعد فقط برای همان چت‌ها دوباره ارسال شود).
+    """
+    now = now or time.time()
+    states = {_alert_key(chat_id, alert): _sent_state(alert, now) for chat_id in delivered for alert in alerts}
+    settled = list(states) + [_alert_key(chat_id, alert) for chat_id in failed for alert in alerts]
+    if settled:
+        _write_state(client, states, {}, settled)
+
+
+def clear_pending(client, alerts_by_chat: Dict[str, List[Dict[str, Any]]]):
+    """ارسال ناموفق: وضعیت «در صف» پاک می‌شود تا هشدار در چرخه بعد دوباره ارسال شود."""
+    keys = _keys(alerts_by_chat)
+    if keys:
+        _write_state(client, {}, {}, keys)
+
+
+# ---------------------------------------------------------
+# تصمیم ارسال / حذف هشدار تکراری
+# ---------------------------------------------------------
+def should_alert(
+    alert: Dict[str, Any],
+    state: Optional[Dict[str, float]],
+    now: float,
+    cooldown_seconds: float = ALERT_COOLDOWN_SECONDS,
+    score_delta: float = ALERT_SCORE_DELTA,
+    price_delta_percent: float = ALERT_PRICE_DELTA_PERCENT,
+) -> Tuple[bool, str]:
+    """خروجی: (ارسال شود؟، دلیل) — دلیل فقط برای لاگ است."""
+    if not state:
+        return True, "new"
+    if now - state.get('pending_at', 0) < ALERT_PENDING_TTL_SECONDS:
+        # هشدار قبلی هنوز در صف ارسال است (یا منتظر retry_after تلگرام)
+        return False, "pending"
+    if 'ts' not in state:
+        return True, "new"
+    if now - state.get('ts', 0) >= cooldown_seconds:
+        return True, "cooldown_expired"
+
+    score = float(alert.get('score') or 0)
+    if abs(score - state.get('score', 0)) >= score_delta:
+        return True, "score_moved"
+
+    price = float(alert.get('last_price') or 0)
+    last_price = state.get('price', 0)
+    if last_price > 0 and abs(price - last_price) / last_price * 100 >= price_delta_percent:
+        return True, "price_moved"
+
+    return False, "cooldown"
+
+
+def filter_alerts(
+    client,
+    alerts_by_chat: Dict[str, List[Dict[str, Any]]],
+    now: Optional[float] = None,
+) -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[str, List[Dict[str, Any]]]]:
+    """
+    هشدارهای هر چت ({chat_id: [هشدارها]}) را به دو دسته تقسیم می‌کند:
+    (قابل ارسال، حذف‌شده به دلیل Cooldown یا در صف بودن) — هر دو به شکل {chat_id: [هشدارها]}.
+    وضعیت همه چت‌ها با یک درخواست خوانده می‌شود و اینجا تغییر نمی‌کند؛ هنگام ورود به صف mark_pending
+    و بعد از نتیجه ارسال settle_alerts (یا clear_pending) صدا زده می‌شود.
+    """
+    if not alerts_by_chat:
+        return {}, {}
+    now = now or time.time()
+    states = load_alert_state(client, _keys(alerts_by_chat))
+
+    to_send: Dict[str, List[Dict[str, Any]]] = {}
+    suppressed: Dict[str, List[Dict[str, Any]]] = {}
+    for chat_id, alerts in alerts_by_chat.items():
+        for alert in alerts:
+            key = _alert_key(chat_id, alert)
+            send, reason = should_alert(alert, states.get(key), now)
+            if send:
+                to_send.setdefault(chat_id, []).append(alert)
+            else:
+                suppressed.setdefault(chat_id, []).append(alert)
+                logger.debug(f"🔕 Suppressed repeat alert for {key} ({reason}).")
+    return to_send, suppressed
+
+
+# --- (بخش تست دستی) ---
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+    t0 = 1_000_000.0
+    first = {'desk-a': [{'symbol_name': 'خودرو', 'score': 7.0, 'last_price': 2000}]}
+    first['desk-b'] = first['desk-a']
+    sent, skipped = filter_alerts(None, first, now=t0)
+    print("first cycle:", {chat: len(a) for chat, a in sent.items()}, "sent")
+    mark_pending(None, sent, now=t0)
+    print("next cycle while queued:", [len(x) for x in filter_alerts(None, first, now=t0 + 5)])
+    # desk-a دریافت کرد، ارسال به desk-b ناموفق بود: فقط desk-b در چرخه بعد دوباره دریافت می‌کند
+    settle_alerts(None, first['desk-a'], delivered=['desk-a'], failed=['desk-b'], now=t0)
+    print("after partial failure:", {chat: len(a) for chat, a in filter_alerts(None, first, now=t0 + 10)[0].items()})
+
+    same = {'desk-a': [{'symbol_name': 'خودرو', 'score': 7.5, 'last_price': 2010}]}
+    print("same signal 5 min later:", [len(x) for x in filter_alerts(None, same, now=t0 + 300)])
+    jump = {'desk-a': [{'symbol_name': 'خودرو', 'score': 8.5, 'last_price': 2010}]}
+    print("score jump:", [len(x) for x in filter_alerts(None, jump, now=t0 + 300)])
+    print("after cooldown:", [len(x) for x in filter_alerts(None, same, now=t0 + ALERT_COOLDOWN_SECONDS)])
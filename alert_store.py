@@ -0,0 +1,248 @@
+# alert_store.py
+# وظیفه: ذخیره فشرده و افزایشی (Append-only) نتایج هر اجرای تحلیل در یک فایل JSONL روزانه
+# (جایگزین فایل‌های phase2_alerts_YYYYMMDD_HHMM.json با indent=2 و دیتای خام کامل)
+
+import os
+import gzip
+import json
+import time
+import glob
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Iterator
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+# --- تنظیمات ---
+TEHRAN_TZ = ZoneInfo("Asia/Tehran")
+LOG_DIR = "logs"
+# فایل‌های روزهای قبل بعد از این مدت حذف می‌شوند (شامل فایل‌های قدیمی phase2_alerts_*.json)
+ALERT_STORE_RETENTION_DAYS = int(os.getenv("ALERT_STORE_RETENTION_DAYS", 30))
+# فایل روزهای گذشته هنگام چرخش روز فشرده (gzip) می‌شوند
+ALERT_STORE_COMPRESS_OLD = os.getenv("ALERT_STORE_COMPRESS_OLD", "1") == "1"
+
+ALERT_FILE_PREFIX = "alerts_"
+LEGACY_FILE_PATTERN = "phase2_alerts_*.json"
+
+# فیلدهای هر هشدار که ذخیره می‌شوند؛ raw_live و phase1 ذخیره نمی‌شوند و از طریق snapshot_version
+# (و تاریخچه market:history در Redis) قابل ارجاع هستند
+ALERT_FIELDS = (
+    'symbol_id', 'symbol_name', 'source_table', 'score', 'is_strong_buy', 'reasons',
+    'power_ratio', 'volume_ratio', 'rsi', 'last_price', 'percent_change',
+    'entry', 'target', 'stop', 'risk_reward',
+)
+
+_write_lock = threading.Lock()
+# آخرین روزی که چرخش/پاکسازی برای آن انجام شده (یکبار در هر روز)
+_maintained_day: Optional[str] = None
+
+
+def day_file(day: str, log_dir: str = LOG_DIR) -> str:
+    """مسیر فایل روز (day به شکل YYYYMMDD)."""
+    return os.path.join(log_dir, f"{ALERT_FILE_PREFIX}{day}.jsonl")
+
+
+def slim_alert(alert: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: alert.get(field) for field in ALERT_FIELDS if field in alert}
+
+
+# ---------------------------------------------------------
+# نوشتن (main.py)
+# ---------------------------------------------------------
+def build_run_record(
+    alerts: List[Dict[str, Any]],
+    snapshot_version: Optional[int] = None,
+    now: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """رکورد خلاصه یک اجرای تحلیل (همان رکورد در فایل روزانه و در Redis برای داشبورد زنده ذخیره می‌شود)."""
+    now = now or datetime.now(TEHRAN_TZ)
+    return {
+        "timestamp": now.strftime('%Y-%m-%d %H:%M:%S'),
+        "epoch": round(now.timestamp(), 3),
+        "snapshot_version": snapshot_version,
+        "alerts_count": len(alerts),
+        "alerts": [slim_alert(alert) for alert in alerts],
+    }
+
+
+def encode_run_record(record: Dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def append_run(
+    alerts: List[Dict[str, Any]],
+    snapshot_version: Optional[int] = None,
+    now: Optional[datetime] = None,
+    log_dir: str = LOG_DIR,
+) -> str:
+    """
+    یک خط برای این اجرای تحلیل به فایل امروز اضافه می‌کند (حتی اگر هشداری نباشد،
+    تا داشبورد بداند تحلیل امروز اجرا شده است). خروجی: مسیر فایل.
+    """
+    return append_record(build_run_record(alerts, snapshot_version, now), log_dir)
+
+
+def append_record(record: Dict[str, Any], log_dir: str = LOG_DIR) -> str:
+    """رکورد ساخته‌شده با build_run_record را به فایل روز خودش اضافه می‌کند. خروجی: مسیر فایل."""
+    day = datetime.fromtimestamp(record["epoch"], TEHRAN_TZ).strftime('%Y%m%d')
+    line = encode_run_record(record) + "\n"
+
+    os.makedirs(log_dir, exist_ok=True)
+    path = day_file(day, log_dir)
+    with _write_lock:
+        _maintain(day, log_dir)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+    return path
+
+
+def _maintain(today: str, log_dir: str):
+    """یکبار در روز: فشرده‌سازی فایل‌های روزهای قبل و حذف فایل‌های قدیمی‌تر از دوره نگهداری."""
+    global _maintained_day
+    if _maintained_day == today:
+        return
+    _maintained_day = today
+
+    cutoff = (datetime.strptime(today, '%Y%m%d') - timedelta(days=ALERT_STORE_RETENTION_DAYS)).strftime('%Y%m%d')
+    for path in glob.glob(os.path.join(log_dir, f"{ALERT_FILE_PREFIX}*.jsonl*")):
+        day = _file_day(path)
+        if day is None or day >= today:
+            continue
+        try:
+            if day < cutoff:
+                os.remove(path)
+                logger.info(f"🧹 Removed expired alert log: {path}")
+            elif ALERT_STORE_COMPRESS_OLD and path.endswith(".jsonl"):
+                _compress(path)
+        except OSError as e:
+            logger.warning(f"⚠️ Alert log maintenance failed for {path}: {e}")
+
+    # فایل‌های قالب قدیمی (یک فایل در هر دقیقه) فقط حذف می‌شوند
+    legacy_cutoff = time.time() - ALERT_STORE_RETENTION_DAYS * 86400
+    for path in glob.glob(os.path.join(log_dir, LEGACY_FILE_PATTERN)):
+        try:
+            if os.path.getmtime(path) < legacy_cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def _compress(path: str):
+    with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+        dst.write(src.read())
+    os.remove(path)
+    logger.info(f"🗜️ Compressed alert log: {path}.gz")
+
+
+def _file_day(path: str) -> Optional[str]:
+    name = os.path.basename(path)[len(ALERT_FILE_PREFIX):].split('.', 1)[0]
+    return name if len(name) == 8 and name.isdigit() else None
+
+
+# ---------------------------------------------------------
+# خواندن (داشبورد و ابزارها)
+# ---------------------------------------------------------
+def _day_path(day: str, log_dir: str) -> Optional[str]:
+    path = day_file(day, log_dir)
+    if os.path.exists(path):
+        return path
+    if os.path.exists(path + ".gz"):
+        return path + ".gz"
+    return None
+
+
+def _iter_lines(path: str) -> Iterator[Dict[str, Any]]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # خط ناقص (مثلاً در حال نوشتن یا قطع برق) نادیده گرفته می‌شود
+                continue
+
+
+def _read_last_line(path: str, chunk_size: int = 65536) -> Optional[Dict[str, Any]]:
+    """آخرین خط کامل فایل (بدون خواندن کل فایل)."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        buffer = b""
+        position = end
+        while position > 0:
+            step = min(chunk_size, position)
+            position -= step
+            f.seek(position)
+            buffer = f.read(step) + buffer
+            lines = buffer.rstrip(b"\n").split(b"\n")
+            if len(lines) > 1 or position == 0:
+                for raw in reversed(lines):
+                    try:
+                        return json.loads(raw.decode("utf-8"))
+                    except ValueError:
+                        continue
+                return None
+    return None
+
+
+def read_latest_run(day: Optional[str] = None, log_dir: str = LOG_DIR) -> Optional[Dict[str, Any]]:
+    """آخرین اجرای ثبت‌شده در روز مشخص (پیش‌فرض: امروز به وقت تهران)."""
+    day = day or datetime.now(TEHRAN_TZ).strftime('%Y%m%d')
+    path = _day_path(day, log_dir)
+    if path is None:
+        return None
+    if path.endswith(".gz"):
+        latest = None
+        for latest in _iter_lines(path):
+            pass
+        return latest
+    return _read_last_line(path)
+
+
+def read_runs(start: datetime, end: Optional[datetime] = None, log_dir: str = LOG_DIR) -> Iterator[Dict[str, Any]]:
+    """همه اجراهای ثبت‌شده بین start و end (به ترتیب زمان)."""
+    end = end or datetime.now(TEHRAN_TZ)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=TEHRAN_TZ)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=TEHRAN_TZ)
+    start_epoch, end_epoch = start.timestamp(), end.timestamp()
+
+    day = start.astimezone(TEHRAN_TZ).date()
+    last_day = end.astimezone(TEHRAN_TZ).date()
+    while day <= last_day:
+        path = _day_path(day.strftime('%Y%m%d'), log_dir)
+        if path is not None:
+            for run in _iter_lines(path):
+                if start_epoch <= run.get("epoch", 0) <= end_epoch:
+                    yield run
+        day += timedelta(days=1)
+
+
+def read_alerts(start: datetime, end: Optional[datetime] = None, log_dir: str = LOG_DIR) -> Iterator[Dict[str, Any]]:
+    """هشدارهای بازه زمانی به صورت مسطح (هر هشدار همراه timestamp و snapshot_version اجرای خود)."""
+    for run in read_runs(start, end, log_dir):
+        for alert in run.get("alerts", []):
+            yield {**alert, "timestamp": run.get("timestamp"), "snapshot_version": run.get("snapshot_version")}
+
+
+# --- (بخش تست دستی) ---
+if __name__ == "__main__":
+    import tempfile
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    tmp_dir = tempfile.mkdtemp()
+    base = datetime(2024, 5, 1, 9, 0, tzinfo=TEHRAN_TZ)
+    sample = {'symbol_name': 'فولاد', 'score': 8.5, 'reasons': ['GoldenKey ⭐ (85)'], 'raw_live': {'big': 'x' * 1000}}
+    for minute in range(0, 240, 2):
+        append_run([sample] if minute % 10 == 0 else [], snapshot_version=minute, now=base + timedelta(minutes=minute), log_dir=tmp_dir)
+    append_run([sample], snapshot_version=999, now=base + timedelta(days=1), log_dir=tmp_dir)
+
+    print("files:", sorted(os.listdir(tmp_dir)))
+    print("latest (day 1):", read_latest_run("20240501", log_dir=tmp_dir)["snapshot_version"])
+    print("latest (day 2):", read_latest_run("20240502", log_dir=tmp_dir)["snapshot_version"])
+    window = list(read_alerts(base + timedelta(hours=1), base + timedelta(hours=2), log_dir=tmp_dir))
+    print("alerts 10:00-11:00:", len(window), "| raw_live stored:", 'raw_live' in window[0])
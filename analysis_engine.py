@@ -2,8 +2,9 @@
 # وظیفه: ترکیب داده‌های لحظه‌ای بازار با داده‌های تکنیکال دیتابیس و محاسبه امتیاز خرید
 
 import math
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Sequence, Tuple
 import logging
+import numpy as np
 from db_connector import get_symbol_name_by_id
 
 logger = logging.getLogger(__name__)
@@ -260,3 +261,192 @@ def analyze_symbol_combined(live: Dict[str, Any], phase1: Dict[str, Any]) -> Dic
         "raw_live": live, 
         "phase1": phase1
     }
+
+
+# --------------------------------------------------------------------------
+# 💡 امتیازدهی دسته‌ای (Vectorized) برای کل بازار
+# --------------------------------------------------------------------------
+BULLISH_PATTERNS = ['hammer', 'engulfing', 'morning', 'piercing']
+
+
+def _float_matrix(values: List[Tuple[Any, ...]]) -> np.ndarray:
+    """
+    معادل برداری to_float_or_zero روی سطرهای چند ستونی: خروجی ماتریس (تعداد سطر × تعداد ستون).
+    مسیر سریع تبدیل مستقیم NumPy است؛ فقط خانه‌های NaN (که ممکن است None بوده باشند) دوباره بررسی می‌شوند.
+    """
+    try:
+        matrix = np.array(values, dtype=float)
+    except (TypeError, ValueError):
+        return np.array([[to_float_or_zero(v) for v in row] for row in values], dtype=float)
+    for i, j in np.argwhere(np.isnan(matrix)).tolist():
+        value = values[i][j]
+        matrix[i, j] = 0.0 if value is None else to_float_or_zero(value)
+    return matrix
+
+
+def _safe_div_column(a: np.ndarray, b: np.ndarray, default: float) -> np.ndarray:
+    """معادل برداری safe_div."""
+    out = np.full(a.shape, default, dtype=float)
+    np.divide(a, b, out=out, where=(b != 0))
+    return out
+
+
+def score_symbols_batch(live_rows: Sequence[Dict[str, Any]], phase1_rows: Sequence[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """
+    همان قواعد امتیازدهی analyze_symbol_combined را به صورت برداری روی همه سطرها اجرا می‌کند.
+    live_rows[i] و phase1_rows[i] متعلق به یک نماد هستند.
+    خروجی: آرایه‌های score, power_ratio, volume_ratio و is_strong_buy (هم‌ترتیب با ورودی).
+    """
+    # همان کلیدها و زنجیره‌های `or` مسیر تکی
+    tvol, bvol, pf, py, buy_i_vol, buy_i_count, sell_i_vol, sell_i_count = _float_matrix([
+        (
+            row.get('volume'),
+            row.get('base_volume') or row.get('bvol') or 1,
+            row.get('open_price'),
+            row.get('yesterday_price'),
+            row.get('individual_buy_vol'),
+            row.get('individual_buy_count'),
+            row.get('individual_sell_vol'),
+            row.get('individual_sell_count'),
+        )
+        for row in live_rows
+    ]).T
+    golden_key_score, rsi_val, halftrend = _float_matrix([
+        (
+            row.get('golden_key_score') or row.get('score'),
+            row.get('RSI') or 50,
+            row.get('halftrend_signal') or 0,
+        )
+        for row in phase1_rows
+    ]).T
+    halftrend = np.trunc(halftrend)
+
+    # تعداد الگوهای متمایز کم است؛ بررسی رشته‌ای برای هر الگو فقط یکبار انجام می‌شود
+    pattern_cache: Dict[Any, bool] = {}
+    bullish_pattern = np.empty(len(phase1_rows), dtype=bool)
+    for i, row in enumerate(phase1_rows):
+        pattern = row.get('pattern_name')
+        if pattern not in pattern_cache:
+            name = str(pattern or '').lower()
+            pattern_cache[pattern] = any(p in name for p in BULLISH_PATTERNS)
+        bullish_pattern[i] = pattern_cache[pattern]
+
+    # قدرت خریدار (compute_power_ratio)
+    buy_avg = _safe_div_column(buy_i_vol, buy_i_count, 0.0)
+    sell_avg = _safe_div_column(sell_i_vol, sell_i_count, 1.0)
+    power_ratio = np.round(_safe_div_column(buy_avg, sell_avg, 0.0), 2)
+    # np.round و round پایتون فقط در حالت‌های مرزی (نیمه‌ها) ممکن است متفاوت باشند؛
+    # مقادیر نزدیک آستانه‌ها دوباره با round پایتون محاسبه می‌شوند تا نتیجه دقیقاً مثل مسیر تکی باشد
+    near_threshold = np.flatnonzero(
+        (np.abs(power_ratio - MIN_POWER_RATIO) <= 0.01) | (np.abs(power_ratio - 1.5) <= 0.01)
+    )
+    for i in near_threshold.tolist():
+        power_ratio[i] = round(buy_avg[i].item() / sell_avg[i].item(), 2) if sell_avg[i] != 0 else 0.0
+    power_ratio = np.where(sell_avg == 0, np.where(buy_avg > 0, 100.0, 0.0), power_ratio)
+
+    volume_ratio = _safe_div_column(tvol, bvol, 0.0)
+    gap_positive = (pf > 0) & (py > 0) & (pf > py)
+
+    # همه اجزای امتیاز مضرب 0.5 هستند، پس ترتیب جمع روی نتیجه اثری ندارد
+    score = np.zeros(len(live_rows), dtype=float)
+    score += np.where(golden_key_score >= 80, 3.0, np.where(golden_key_score >= 50, 1.5, 0.0))
+    score += np.where(power_ratio >= MIN_POWER_RATIO, 2.5, np.where(power_ratio >= 1.5, 1.0, 0.0))
+    score += np.where(volume_ratio >= 2.0, 2.0, np.where(volume_ratio >= 1.0, 1.0, 0.0))
+    score += np.where(halftrend == 1, 1.0, 0.0)
+    score += np.where(rsi_val < 30, 1.0, 0.0)
+    score += np.where(bullish_pattern, 1.0, 0.0)
+    score += np.where(gap_positive, 0.5, 0.0)
+    score = np.minimum(score, 10.0)
+
+    is_strong_buy = (
+        (score >= SCORE_THRESHOLD) &
+        (power_ratio >= 1.5) &
+        (volume_ratio >= MIN_VOLUME_TO_BASE_PERCENT)
+    )
+    return {
+        'score': score,
+        'power_ratio': power_ratio,
+        'volume_ratio': volume_ratio,
+        'is_strong_buy': is_strong_buy,
+    }
+
+
+def analyze_symbols_batch(
+    live_rows: Sequence[Dict[str, Any]],
+    phase1_rows: Sequence[Dict[str, Any]],
+) -> Tuple[List[float], List[Dict[str, Any]]]:
+    """
+    نسخه دسته‌ای analyze_symbol_combined برای کل بازار.
+    - امتیاز همه نمادها به صورت برداری محاسبه می‌شود.
+    - دیکشنری کامل نتیجه (دلایل، حد سود/ضرر، ...) فقط برای نمادهای واجد شرایط ساخته می‌شود؛
+      این دیکشنری‌ها با همان analyze_symbol_combined ساخته می‌شوند تا خروجی دقیقاً یکسان بماند.
+
+    خروجی: (لیست امتیازها هم‌ترتیب با ورودی، لیست نتایج Strong Buy به ترتیب ورودی)
+    """
+    if not live_rows:
+        return [], []
+
+    batch = score_symbols_batch(live_rows, phase1_rows)
+    # همان round(score, 1) مسیر تکی (امتیازها مضرب 0.5 هستند)
+    scores = [round(score, 1) for score in batch['score'].tolist()]
+    strong_buys = [
+        analyze_symbol_combined(live_rows[i], phase1_rows[i])
+        for i in np.flatnonzero(batch['is_strong_buy']).tolist()
+    ]
+    return scores, strong_buys
+
+
+# --- (بخش تست دستی) ---
+if __name__ == "__main__":
+    # مقایسه خروجی مسیر دسته‌ای با مسیر تکی روی داده تصادفی (همراه با مقادیر None و صفر) و مقایسه سرعت
+    import random
+    import time
+
+    rng = random.Random(7)
+    # حدود ۱۰٪ مقادیر None یا صفر هستند تا مسیرهای پیش‌فرض هم بررسی شوند
+    maybe = lambda value: value if rng.random() < 0.9 else rng.choice([None, 0])
+    live_rows, phase1_rows = [], []
+    for i in range(5000):
+        live_rows.append({
+            'symbol': f"S{i}",
+            'last_price': rng.uniform(1_000, 50_000),
+            'volume': maybe(rng.randint(0, 5_000_000)),
+            'base_volume': maybe(rng.randint(100_000, 2_000_000)),
+            'open_price': maybe(rng.uniform(1_000, 50_000)),
+            'yesterday_price': maybe(rng.uniform(1_000, 50_000)),
+            'high_price': rng.uniform(1_000, 50_000),
+            'low_price': rng.uniform(1_000, 50_000),
+            'individual_buy_vol': maybe(rng.uniform(0, 1e6)),
+            'individual_buy_count': maybe(rng.randint(0, 500)),
+            'individual_sell_vol': maybe(rng.uniform(0, 1e6)),
+            'individual_sell_count': maybe(rng.randint(0, 500)),
+        })
+        phase1_rows.append({
+            'symbol_id': str(i),
+            'symbol_name': f"S{i}",
+            'golden_key_score': maybe(rng.uniform(0, 100)),
+            'RSI': maybe(rng.uniform(5, 95)),
+            'halftrend_signal': maybe(rng.choice([-1, 1])),
+            'pattern_name': maybe(rng.choice(['Hammer', 'doji', 'Bullish Engulfing', 'shooting star'])),
+            'source_table': rng.choice(['GoldenKey', 'BuyQueue', 'Watchlist']),
+        })
+
+    scalar = [analyze_symbol_combined(l, p) for l, p in zip(live_rows, phase1_rows)]
+    scores, strong_buys = analyze_symbols_batch(live_rows, phase1_rows)
+    assert scores == [r['score'] for r in scalar], "score mismatch"
+    assert strong_buys == [r for r in scalar if r['is_strong_buy']], "strong buy mismatch"
+    print(f"✅ Parity OK for {len(scores)} symbols ({len(strong_buys)} strong buys).")
+
+    def best_of(func, repeat=5) -> float:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return min(timings)
+
+    scalar_ms = best_of(lambda: [analyze_symbol_combined(l, p) for l, p in zip(live_rows, phase1_rows)])
+    score_ms = best_of(lambda: score_symbols_batch(live_rows, phase1_rows))
+    batch_ms = best_of(lambda: analyze_symbols_batch(live_rows, phase1_rows))
+    print(f"⏱️ scalar: {scalar_ms:.1f} ms | batch scores: {score_ms:.1f} ms (x{scalar_ms / score_ms:.1f}) "
+          f"| batch + strong-buy results: {batch_ms:.1f} ms (x{scalar_ms / batch_ms:.1f})")
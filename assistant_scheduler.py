@@ -1,5 +1,9 @@
 # assistant_scheduler.py
 # وظیفه: ارسال درخواست به سرور Flask برای اجرای تحلیل (Trigger)
+# 💡 اجرای اصلی رویدادمحور است (snapshot_trigger در main.py)؛ این زمان‌بند فقط پشتیبان است
+# و اگر Snapshot فعلی قبلاً تحلیل شده باشد، سرور اجرا را رد می‌کند (status = skipped).
+# 💡 درخواست به صورت ناهمگام (?async=1) ارسال می‌شود و نتیجه از /run/<job_id> خوانده می‌شود؛
+# بنابراین Timeout درخواست HTTP به زمان تحلیل و ارسال تلگرام وابسته نیست.
 
 import time
 import logging
@@ -10,7 +14,10 @@ from zoneinfo import ZoneInfo
 # --- تنظیمات ---
 TEHRAN_TZ = ZoneInfo("Asia/Tehran")
 SERVER_URL = "http://localhost:5000/run"  # آدرس سرور Flask
-POLL_INTERVAL_SECONDS = 220 # هر 220 ثانیه یکبار تحلیل کن
+REQUEST_TIMEOUT_SECONDS = 10 # Timeout هر درخواست HTTP (ثبت Job و خواندن وضعیت)
+JOB_POLL_SECONDS = 2 # فاصله خواندن وضعیت Job
+JOB_MAX_WAIT_SECONDS = 180 # حداکثر انتظار برای پایان Job
+POLL_INTERVAL_SECONDS = 220 # هر 220 ثانیه یکبار تحلیل کن (پشتیبان Trigger رویدادمحور)
 MARKET_START_HOUR = 9
 MARKET_END_HOUR = 16
 
@@ -25,6 +32,21 @@ def is_market_time():
     # بازه تقریبی ۹ تا ۱۳:۳۰
     return MARKET_START_HOUR <= current_hour <= MARKET_END_HOUR
 
+def wait_for_job(job_id):
+    """وضعیت Job را تا پایان (done / error) یا رسیدن به JOB_MAX_WAIT_SECONDS می‌خواند."""
+    deadline = time.monotonic() + JOB_MAX_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        response = requests.get(f"{SERVER_URL}/{job_id}", timeout=REQUEST_TIMEOUT_SECONDS)
+        if response.status_code != 200:
+            logger.warning(f"⚠️ Job {job_id} status error: {response.status_code}")
+            return None
+        job = response.json()
+        if job.get("status") in ("done", "error"):
+            return job
+        time.sleep(JOB_POLL_SECONDS)
+    logger.warning(f"⌛ Job {job_id} still running after {JOB_MAX_WAIT_SECONDS}s. Not waiting any longer.")
+    return None
+
 def run_scheduler_client():
     logger.info(f"📡 Scheduler started. Targeting: {SERVER_URL}")
     
@@ -36,14 +58,23 @@ def run_scheduler_client():
             if is_market_time():
                 logger.info("⏰ Triggering analysis...")
                 
-                # ارسال درخواست به main.py
-                response = requests.get(SERVER_URL, timeout=60)
+                # ثبت Job در main.py (اگر تحلیلی در حال اجرا باشد، به همان متصل می‌شود)
+                response = requests.post(SERVER_URL, params={"async": "1"}, timeout=REQUEST_TIMEOUT_SECONDS)
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    status = data.get("status")
-                    alerts = data.get("alerts_generated", 0)
-                    logger.info(f"✅ Success: {status} | Alerts Sent: {alerts}")
+                if response.status_code == 202:
+                    job_id = response.json().get("job_id")
+                    job = wait_for_job(job_id)
+                    # job = None یعنی خطا/انتظار طولانی که در wait_for_job لاگ شده است
+                    if job and job.get("status") == "error":
+                        logger.warning(f"⚠️ Job {job_id} failed: {job.get('error')}")
+                    elif job:
+                        data = job.get("result") or {}
+                        status = data.get("status")
+                        alerts = data.get("alerts_sent", 0)
+                        if status == "skipped":
+                            logger.info(f"⏭️ Skipped: {data.get('message')}")
+                        else:
+                            logger.info(f"✅ Success: {status} | Alerts Sent: {alerts} | Suppressed: {data.get('alerts_suppressed', 0)}")
                 else:
                     logger.warning(f"⚠️ Server Error: {response.status_code}")
                 
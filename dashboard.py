@@ -1,18 +1,25 @@
 import streamlit as st
-import json
-import glob
 import os
-import pandas as pd
 from datetime import datetime
 import plotly.express as px
 import numpy as np
+from dashboard_data import today_log_path, file_signature, load_latest_run, load_live_state
 # 💡 ایمپورت کتابخانه رفرش خودکار
 from streamlit_autorefresh import st_autorefresh 
 
+# --- حالت زنده ---
+# با DASHBOARD_LIVE_MODE=1 نتیجه هر اجرا مستقیماً از Redis خوانده می‌شود (بدون فایل لاگ) و فقط
+# بخش نتایج هر DASHBOARD_LIVE_POLL_SECONDS ثانیه به‌روز می‌شود (بدون اجرای مجدد کل صفحه)
+LIVE_MODE = os.getenv("DASHBOARD_LIVE_MODE", "0") == "1"
+LIVE_POLL_SECONDS = float(os.getenv("DASHBOARD_LIVE_POLL_SECONDS", 1.0))
+# Snapshot قدیمی‌تر از این مقدار (ثانیه) با هشدار نمایش داده می‌شود
+SNAPSHOT_STALE_SECONDS = 120
+
 # --- تنظیمات رفرش خودکار ---
 # هر 60 ثانیه رفرش شود (60 * ۱۰۰۰ میلی‌ثانیه)
-# این خط، کل صفحه داشبورد را به صورت خودکار رفرش می‌کند.
-count = st_autorefresh(interval=60000, key="data_refresher") 
+# این خط، کل صفحه داشبورد را به صورت خودکار رفرش می‌کند (در حالت زنده لازم نیست).
+if not LIVE_MODE:
+    count = st_autorefresh(interval=60000, key="data_refresher") 
 
 # تنظیمات صفحه
 st.set_page_config(page_title="TSE Trader Dashboard", layout="wide")
@@ -24,117 +31,113 @@ st.markdown("---")
 LOG_DIR = "logs"
 os.makedirs(LOG_DIR, exist_ok=True) 
 
-# پیدا کردن آخرین JSON لاگ
-# جستجو در داخل پوشه logs
-logs = glob.glob(os.path.join(LOG_DIR, "phase2_alerts_*.json"))
-# 💡 اصلاح: فیلتر کردن لاگ‌ها بر اساس تاریخ امروز
-today_date_str = datetime.now().strftime('%Y%m%d')
-
-# فقط فایل‌هایی را که تاریخ امروز را در نام خود دارند (YYYYMMDD) در نظر بگیرید.
-today_logs = [log for log in logs if today_date_str in os.path.basename(log)]
+def render_run(df, timestamp, caption):
+    """جدول، چارت و Metric های هشدارهای یک اجرا (مشترک بین حالت فایل و حالت زنده)."""
+    if df is None:
+        st.warning("هیچ هشداری در این اجرا یافت نشد.")
+        return
+
+    st.subheader("📊 لیست هشدارهای اخیر")
+
+    # نمایش جدول با ستون‌های به‌روز شده
+    # 💡 اصلاح: نمایش 'نماد' (فارسی) به جای 'نماد (کد)'
+    st.dataframe(
+        df[['نماد', 'امتیاز', 'قدرت خریدار', 'نسبت حجم', 'ورود (قیمت)', 'هدف (قیمت)', 'حد ضرر (قیمت)', 'دلایل', 'خرید قوی', 'نماد (کد)']], 
+        width='stretch', 
+        height=350 
+    )
+
+    # چارت امتیازها
+    # 💡 اصلاح: استفاده از 'نماد' برای محور X
+    fig = px.bar(
+        df, 
+        x='نماد', 
+        y='امتیاز', 
+        title="امتیازهای هشدارها (به ترتیب نزولی)", 
+        color='امتیاز', 
+        color_continuous_scale='viridis',
+        height=400
+    )
+    st.plotly_chart(fig, use_container_width=True) # width='stretch' در اینجا با use_container_width=True جایگزین شد
+
+    # Metricها برای top alert
+    top_alert = df.iloc[0] if not df.empty else None
+
+    # 💡 اصلاح خطای 'The truth value of a Series is ambiguous'
+    if top_alert is not None:
+        # محاسبه دلتا
+        entry_price = top_alert['ورود (قیمت)']
+        target_price = top_alert['هدف (قیمت)']
+
+        delta_value = target_price - entry_price
+
+        # 💡 بهبود پایداری: بررسی برای جلوگیری از تقسیم بر صفر
+        if entry_price and entry_price != 0:
+            delta_percent = (delta_value / entry_price) * 100 
+        else:
+            delta_percent = 0
+
+        col1, col2, col3, col4 = st.columns(4)
+        # 💡 اصلاح: نمایش نام فارسی در metric اول
+        col1.metric("نماد برتر", top_alert['نماد']) 
+        col2.metric("امتیاز", top_alert['امتیاز'])
+        col3.metric("ورود پیشنهادی", f"{entry_price:,}")
+        # محاسبه دلتا و نمایش آن
+        col4.metric(
+            "هدف قیمتی", 
+            f"{target_price:,}", 
+            delta=f"{delta_percent:.1f}% ({delta_value:,.0f} ریال)",
+            delta_color="normal"
+        )
 
-if today_logs:
-    # از بین لاگ‌های امروز، جدیدترین را انتخاب کنید.
-    latest_log = max(today_logs, key=os.path.getctime) 
-    
+    st.info(f"آخرین به‌روزرسانی: {timestamp} | {caption}")
+    st.download_button(
+        "⬇️ دانلود CSV", 
+        df.to_csv(index=False).encode('utf-8'), # Encode برای utf-8
+        f"alerts_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv", 
+        "text/csv;charset=utf-8"
+    )
+
+
+if LIVE_MODE:
+    @st.fragment(run_every=LIVE_POLL_SECONDS)
+    def live_results():
+        try:
+            state = load_live_state()
+        except Exception as e:
+            st.error(f"خطا در اتصال به Redis: {e}")
+            return
+
+        age = state['snapshot_age_seconds']
+        if age is None:
+            st.warning("⚠️ Snapshot بازار در Redis یافت نشد (realtime_writer اجرا نشده است).")
+        elif age > SNAPSHOT_STALE_SECONDS:
+            st.warning(f"⚠️ Snapshot بازار {age:,.0f} ثانیه است که به‌روز نشده است.")
+        else:
+            st.caption(f"🟢 حالت زنده | سن Snapshot بازار: {age:,.1f} ثانیه")
+
+        run = state['run']
+        if run is None:
+            st.warning("⚠️ هنوز نتیجه‌ای از main.py در Redis منتشر نشده است.")
+            return
+        render_run(run['frame'], run['timestamp'], f"نسخه Snapshot: {run['snapshot_version']}")
+
+    live_results()
+else:
+    # 💡 لایه داده (dashboard_data): فقط اجراهای جدید فایل امروز خوانده می‌شوند و تا وقتی فایل
+    # (mtime / size) تغییر نکند، DataFrame آماده از کش برگردانده می‌شود
+    log_path = today_log_path(LOG_DIR)
+    signature = file_signature(log_path)
     try:
-        with open(latest_log, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        alerts = data.get('alerts', [])
-        timestamp = data['timestamp']
+        latest_run = load_latest_run(log_path, *signature) if signature else None
     except Exception as e:
-        st.error(f"خطا در خواندن یا پردازش فایل لاگ ({latest_log}): {e}")
-        alerts = []
-        timestamp = "نامشخص"
-
-    if alerts:
-        # تبدیل alerts به DataFrame
-        df = pd.DataFrame(alerts)
-
-        # 💡 اصلاح: نگاشت فیلدهای JSON به نام‌های فارسی برای نمایش در داشبورد
-        df = df.rename(columns={
-            'symbol_id': 'نماد (کد)', # نگهداری کد عددی
-            'symbol_name': 'نماد',    # 👈 استفاده از نام نماد فارسی
-            'score': 'امتیاز',
-            'reasons': 'دلایل',
-            'entry': 'ورود (قیمت)',
-            'target': 'هدف (قیمت)',
-            'stop': 'حد ضرر (قیمت)',
-            'power_ratio': 'قدرت خریدار',
-            'volume_ratio': 'نسبت حجم',
-            'is_strong_buy': 'خرید قوی'
-        })
-        
-        # مرتب‌سازی بر اساس امتیاز
-        df = df.sort_values(by='امتیاز', ascending=False)
-
-        # تبدیل لیست دلایل به رشته برای نمایش در جدول
-        df['دلایل'] = df['دلایل'].apply(lambda x: ", ".join(x) if isinstance(x, list) else x)
-
-        st.subheader("📊 لیست هشدارهای اخیر")
-        
-        # نمایش جدول با ستون‌های به‌روز شده
-        # 💡 اصلاح: نمایش 'نماد' (فارسی) به جای 'نماد (کد)'
-        st.dataframe(
-            df[['نماد', 'امتیاز', 'قدرت خریدار', 'نسبت حجم', 'ورود (قیمت)', 'هدف (قیمت)', 'حد ضرر (قیمت)', 'دلایل', 'خرید قوی', 'نماد (کد)']], 
-            width='stretch', 
-            height=350 
-        )
+        st.error(f"خطا در خواندن یا پردازش فایل لاگ ({log_path}): {e}")
+        latest_run = {'frame': None, 'timestamp': "نامشخص", 'runs_count': 0}
 
-        # چارت امتیازها
-        # 💡 اصلاح: استفاده از 'نماد' برای محور X
-        fig = px.bar(
-            df, 
-            x='نماد', 
-            y='امتیاز', 
-            title="امتیازهای هشدارها (به ترتیب نزولی)", 
-            color='امتیاز', 
-            color_continuous_scale='viridis',
-            height=400
-        )
-        st.plotly_chart(fig, use_container_width=True) # width='stretch' در اینجا با use_container_width=True جایگزین شد
-
-        # Metricها برای top alert
-        top_alert = df.iloc[0] if not df.empty else None
-        
-        # 💡 اصلاح خطای 'The truth value of a Series is ambiguous'
-        if top_alert is not None:
-            # محاسبه دلتا
-            entry_price = top_alert['ورود (قیمت)']
-            target_price = top_alert['هدف (قیمت)']
-            
-            delta_value = target_price - entry_price
-            
-            # 💡 بهبود پایداری: بررسی برای جلوگیری از تقسیم بر صفر
-            if entry_price and entry_price != 0:
-                delta_percent = (delta_value / entry_price) * 100 
-            else:
-                delta_percent = 0
-
-            col1, col2, col3, col4 = st.columns(4)
-            # 💡 اصلاح: نمایش نام فارسی در metric اول
-            col1.metric("نماد برتر", top_alert['نماد']) 
-            col2.metric("امتیاز", top_alert['امتیاز'])
-            col3.metric("ورود پیشنهادی", f"{entry_price:,}")
-            # محاسبه دلتا و نمایش آن
-            col4.metric(
-                "هدف قیمتی", 
-                f"{target_price:,}", 
-                delta=f"{delta_percent:.1f}% ({delta_value:,.0f} ریال)",
-                delta_color="normal"
-            )
-
-        st.info(f"آخرین به‌روزرسانی: {timestamp}")
-        st.download_button(
-            "⬇️ دانلود CSV", 
-            df.to_csv(index=False).encode('utf-8'), # Encode برای utf-8
-            f"alerts_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv", 
-            "text/csv;charset=utf-8"
-        )
+    if latest_run:
+        render_run(latest_run['frame'], latest_run['timestamp'], f"تعداد اجراهای امروز: {latest_run['runs_count']}")
     else:
-        st.warning("هیچ هشداری در این اجرا یافت نشد.")
-else:
-    st.warning("⚠️ فایل لاگ هشدار یافت نشد. لطفاً ابتدا اسکریپت اصلی (main.py) را اجرا کنید.")
+        st.warning("⚠️ فایل لاگ هشدار یافت نشد. لطفاً ابتدا اسکریپت اصلی (main.py) را اجرا کنید.")
 
 # دکمه رفرش دستی
 if st.button("🔄 رفرش دستی داده‌ها"):
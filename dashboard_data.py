@@ -0,0 +1,181 @@
+# dashboard_data.py
+# وظیفه: لایه داده داشبورد — خواندن افزایشی فایل روزانه هشدارها و ساخت DataFrame فقط برای اجرای جدید
+
+import os
+import json
+import time
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+import pandas as pd
+import streamlit as st
+
+from alert_store import TEHRAN_TZ, day_file
+from realtime_cache import read_live_state
+from redis_pool import get_redis_client
+
+REDIS_POOL_NAME = "dashboard"
+
+# نگاشت فیلدهای JSON به نام‌های فارسی برای نمایش در داشبورد
+COLUMN_LABELS = {
+    'symbol_id': 'نماد (کد)', # نگهداری کد عددی
+    'symbol_name': 'نماد',    # 👈 استفاده از نام نماد فارسی
+    'score': 'امتیاز',
+    'reasons': 'دلایل',
+    'entry': 'ورود (قیمت)',
+    'target': 'هدف (قیمت)',
+    'stop': 'حد ضرر (قیمت)',
+    'power_ratio': 'قدرت خریدار',
+    'volume_ratio': 'نسبت حجم',
+    'is_strong_buy': 'خرید قوی'
+}
+
+
+class RunIndex:
+    """
+    فهرست (Manifest) اجراهای ثبت‌شده در یک فایل روزانه alerts_YYYYMMDD.jsonl.
+    موقعیت خوانده‌شده فایل (offset) نگه داشته می‌شود و در هر refresh فقط بایت‌های جدید خوانده می‌شوند؛
+    بنابراین هزینه هر رفرش به تعداد اجراهای قبلی بستگی ندارد.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.offset = 0
+        # برای هر اجرا فقط اطلاعات خلاصه نگه داشته می‌شود (نه هشدارها)
+        self.runs: List[Dict[str, Any]] = []
+        self.latest: Optional[Dict[str, Any]] = None
+
+    def refresh(self) -> int:
+        """اجراهای جدید را می‌خواند؛ خروجی: تعداد اجراهای جدید."""
+        with self._lock:
+            try:
+                size = os.path.getsize(self.path)
+            except OSError:
+                self._reset()
+                return 0
+            if size < self.offset:
+                # فایل کوتاه‌تر شده (جایگزین/فشرده شده)؛ از ابتدا خوانده می‌شود
+                self._reset()
+            if size == self.offset:
+                return 0
+
+            with open(self.path, 'rb') as f:
+                f.seek(self.offset)
+                chunk = f.read(size - self.offset)
+            # فقط خطوط کامل؛ خطی که در حال نوشتن است در رفرش بعدی خوانده می‌شود
+            end = chunk.rfind(b"\n")
+            if end < 0:
+                return 0
+
+            added = 0
+            line_offset = self.offset
+            for raw in chunk[:end].split(b"\n"):
+                line_start = line_offset
+                line_offset += len(raw) + 1
+                if not raw.strip():
+                    continue
+                try:
+                    run = json.loads(raw.decode('utf-8'))
+                except ValueError:
+                    continue
+                self.runs.append({
+                    'timestamp': run.get('timestamp'),
+                    'snapshot_version': run.get('snapshot_version'),
+                    'alerts_count': run.get('alerts_count', len(run.get('alerts', []))),
+                    'offset': line_start,
+                })
+                self.latest = run
+                added += 1
+            self.offset += end + 1
+            return added
+
+
+def file_signature(path: str) -> Optional[Tuple[int, int]]:
+    """(mtime_ns, size) فایل؛ کلید کش داده‌های داشبورد. اگر فایل وجود نداشته باشد None."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def today_log_path(log_dir: str) -> str:
+    return day_file(datetime.now(TEHRAN_TZ).strftime('%Y%m%d'), log_dir)
+
+
+def build_alerts_frame(alerts: List[Dict[str, Any]]) -> pd.DataFrame:
+    """DataFrame نمایشی هشدارهای یک اجرا (ستون‌های فارسی، مرتب بر اساس امتیاز)."""
+    df = pd.DataFrame(alerts).rename(columns=COLUMN_LABELS)
+    for column in COLUMN_LABELS.values():
+        if column not in df.columns:
+            df[column] = None
+
+    # مرتب‌سازی بر اساس امتیاز
+    df = df.sort_values(by='امتیاز', ascending=False)
+
+    # تبدیل لیست دلایل به رشته برای نمایش در جدول
+    df['دلایل'] = df['دلایل'].apply(lambda x: ", ".join(x) if isinstance(x, list) else x)
+    return df
+
+
+# ---------------------------------------------------------
+# لایه کش Streamlit
+# ---------------------------------------------------------
+@st.cache_resource(max_entries=2)
+def _run_index(path: str) -> RunIndex:
+    # یک Index برای هر فایل روزانه در کل پردازه (بین Session ها و رفرش‌ها مشترک)؛ فقط فایل امروز و دیروز نگه داشته می‌شوند
+    return RunIndex(path)
+
+
+@st.cache_data(max_entries=4)
+def load_latest_run(path: str, mtime_ns: int, size: int) -> Optional[Dict[str, Any]]:
+    """
+    آخرین اجرای فایل به همراه DataFrame آماده نمایش و تعداد اجراهای امروز.
+    mtime_ns و size فقط کلید کش هستند: تا وقتی فایل تغییر نکند، این تابع دوباره اجرا نمی‌شود
+    و با تغییر فایل فقط اجراهای جدید خوانده می‌شوند و DataFrame یکبار ساخته می‌شود.
+    """
+    index = _run_index(path)
+    index.refresh()
+    if index.latest is None:
+        return None
+    latest = index.latest
+    alerts = latest.get('alerts', [])
+    return {
+        'timestamp': latest.get('timestamp', "نامشخص"),
+        'snapshot_version': latest.get('snapshot_version'),
+        'frame': build_alerts_frame(alerts) if alerts else None,
+        'runs_count': len(index.runs),
+    }
+
+
+# ---------------------------------------------------------
+# حالت زنده: خواندن مستقیم از Redis (بدون فایل)
+# ---------------------------------------------------------
+@st.cache_data(max_entries=4)
+def _parse_live_run(payload: bytes) -> Dict[str, Any]:
+    # کلید کش خود JSON خام است؛ تا وقتی اجرای جدیدی منتشر نشود، Parse و ساخت DataFrame تکرار نمی‌شود
+    run = json.loads(payload)
+    alerts = run.get('alerts', [])
+    return {
+        'timestamp': run.get('timestamp', "نامشخص"),
+        'snapshot_version': run.get('snapshot_version'),
+        'frame': build_alerts_frame(alerts) if alerts else None,
+        'alerts_count': run.get('alerts_count', len(alerts)),
+    }
+
+
+def load_live_state() -> Dict[str, Any]:
+    """
+    آخرین اجرای تحلیل منتشرشده توسط main.py و سن Snapshot بازار (ثانیه) با یک MGET.
+    خروجی: {'run': ... یا None, 'snapshot_age_seconds': ... یا None}
+    """
+    raw_run, updated_at = read_live_state(get_redis_client(REDIS_POOL_NAME))
+    return {
+        'run': _parse_live_run(raw_run) if raw_run else None,
+        'snapshot_age_seconds': (time.time() - updated_at) if updated_at else None,
+    }
@@ -0,0 +1,499 @@
+# data_sources.py
+# وظیفه: منابع داده لحظه‌ای قابل تعویض برای Orchestrator (TSETMC زنده، ضبط و بازپخش جلسه معاملاتی)
+
+import os
+import gzip
+import json
+import time
+import bisect
+import glob
+import random
+import zlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from typing import Dict, Any, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# --- تنظیمات ---
+TEHRAN_TZ = ZoneInfo("Asia/Tehran")
+# منبع داده: 'tsetmc' (زنده) یا 'replay' (بازپخش فایل ضبط‌شده)
+DATA_SOURCE = os.getenv("DATA_SOURCE", "tsetmc")
+# ضبط همه Snapshot های نگاشت‌شده در فایل‌های فشرده Append-only
+RECORD_SESSION = os.getenv("RECORD_SESSION", "0") == "1"
+RECORDINGS_DIR = os.getenv("RECORDINGS_DIR", "recordings")
+# فایل (یا الگوی glob) ضبط‌شده برای بازپخش و سرعت آن: 1 = واقعی، 10 = ده برابر، 0 = حداکثر سرعت
+REPLAY_FILE = os.getenv("REPLAY_FILE", "")
+REPLAY_SPEED = float(os.getenv("REPLAY_SPEED", 1))
+# منبع داده مصنوعی (DATA_SOURCE=synthetic): Seed و تأخیر شبیه‌سازی‌شده هر درخواست
+SYNTHETIC_SEED = int(os.getenv("SYNTHETIC_SEED", 42))
+SYNTHETIC_LATENCY_MS = float(os.getenv("SYNTHETIC_LATENCY_MS", 0))
+
+
+class SymbolUnavailableError(Exception):
+    """داده لحظه‌ای نماد موجود نیست (نماد متوقف یا قدیمی)؛ برای Circuit Breaker اهمیت دارد."""
+
+
+class LiveDataSource(ABC):
+    """
+    رابط منبع داده لحظه‌ای. خروجی fetch همان دیکشنری نگاشت‌شده‌ای است که در Redis ذخیره می‌شود.
+    - اگر داده نماد موجود نباشد (متوقف/قدیمی) SymbolUnavailableError پرتاب می‌شود.
+    - در صورت خطای دیگر None برمی‌گردد.
+    """
+    # منبع زنده تابع ساعات بازار است؛ بازپخش در هر زمانی قابل اجراست
+    is_live = True
+    # ضریب فاصله بین سیکل‌ها در realtime_writer (بازپخش سریع‌تر از زمان واقعی کوچکتر از 1 است)
+    poll_interval_scale = 1.0
+
+    @abstractmethod
+    def fetch(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """Snapshot نگاشت‌شده یک نماد."""
+
+    def flush(self):
+        """در پایان هر سیکل صدا زده می‌شود (ذخیره کش‌ها، نوشتن بافر ضبط و ...)."""
+
+    def universe(self) -> Optional[List[str]]:
+        """لیست نمادها اگر منبع داده خودش آن را تعیین کند (مثل بازپخش)؛ در غیر این صورت از دیتابیس خوانده می‌شود."""
+        return None
+
+    @property
+    def exhausted(self) -> bool:
+        """برای منابع محدود (بازپخش): آیا داده‌ای باقی نمانده است؟"""
+        return False
+
+
+# =========================================================
+# منبع زنده: TSETMC از طریق pytse-client
+# =========================================================
+class TsetmcDataSource(LiveDataSource):
+    """واکشی داده لحظه‌ای از TSETMC با بازاستفاده از Ticker ها و متادیتای روزانه."""
+
+    def __init__(self):
+        # import تنبل تا بازپخش بدون pytse-client هم قابل اجرا باشد
+        from ticker_metadata_cache import TickerMetadataCache
+        # کش روزانه Ticker ها و متادیتای ایستا (عنوان، حجم مبنا)
+        self.ticker_cache = TickerMetadataCache()
+
+    def fetch(self, symbol: str) -> Optional[Dict[str, Any]]:
+        # آبجکت Ticker و متادیتای ایستا از کش روزانه خوانده می‌شوند
+        ticker = self.ticker_cache.get_ticker(symbol)
+        metadata = self.ticker_cache.get_metadata(ticker)
+
+        # واکشی دیتای مپ شده (تنها درخواست شبکه در هر سیکل)
+        return self._map_live_data(ticker, metadata)
+
+    def flush(self):
+        # متادیتای جدید (در صورت وجود) روی دیسک ذخیره می‌شود
+        self.ticker_cache.flush()
+
+    # ---------------------------------------------------------
+    # تابع کمکی جدید: دریافت مطمئن داده‌های حقیقی/حقوقی
+    # ---------------------------------------------------------
+    def _safe_get_trade_summary(self, rt_data, summary_type: str) -> Dict[str, Any]:
+        """
+        💡 اصلاح شده: اطمینان حاصل می‌کند که مقادیر همیشه float یا int هستند تا خطای NoneType در عملیات ریاضی رخ ندهد.
+        """
+        attr_name = f'{summary_type}_trade_summary'
+        summary = getattr(rt_data, attr_name, None)
+    
+        # مقادیر پیش‌فرض را به صورت Dictionary آماده می‌کنیم
+        default_values = {
+            f'{summary_type}_buy_vol': 0.0,
+            f'{summary_type}_buy_count': 0,
+            f'{summary_type}_sell_vol': 0.0,
+            f'{summary_type}_sell_count': 0,
+        }
+    
+        # بررسی می‌کنیم که summary وجود داشته باشد و attributeهای لازم را داشته باشد.
+        if summary and hasattr(summary, 'buy_vol') and hasattr(summary, 'sell_vol'):
+            # ❗ تبدیل صریح به float و int برای اطمینان از نوع داده
+            # از float() و int() استفاده می‌کنیم تا هر مقدار غیر عددی (مثل None) که با or 0.0 به صفر تبدیل شده، 
+            # به نوع درستی تبدیل شود.
+            buy_vol = float(summary.buy_vol or 0.0)
+            buy_count = int(summary.buy_count or 0)
+            sell_vol = float(summary.sell_vol or 0.0)
+            sell_count = int(summary.sell_count or 0)
+        
+            return {
+                f'{summary_type}_buy_vol': buy_vol, 
+                f'{summary_type}_buy_count': buy_count,
+                f'{summary_type}_sell_vol': sell_vol,
+                f'{summary_type}_sell_count': sell_count,
+            }
+        else:
+            # در صورت عدم وجود آبجکت summary، مقادیر پیش‌فرض را برمی‌گرداند.
+            return default_values
+
+    # ---------------------------------------------------------
+    # 1) یکپارچه‌سازی داده‌های لحظه‌ای (Live Data Mapper)
+    # ---------------------------------------------------------
+    def _map_live_data(self, ticker, metadata: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        داده‌های لحظه‌ای را با استفاده از متد get_ticker_real_time_info_response استخراج می‌کند 
+        و مقادیر Null را ایمن‌سازی می‌کند.
+        فیلدهای ایستا (عنوان و حجم مبنا) از metadata کش‌شده خوانده می‌شوند، نه از TSETMC.
+        """
+        try:
+            # طبق مستندات: دریافت آبجکت لحظه‌ای
+            rt_data = ticker.get_ticker_real_time_info_response()
+            
+            # بررسی وضعیت مجاز/ممنوع (State)
+            # معمولاً state یه استرینگ است. اگر نیاز به فیلتر وضعیت دارید اینجا اضافه کنید.
+            
+            result = {
+                'symbol': ticker.symbol,  # نام نماد (مثل فولاد)
+                'symbol_name': metadata['title'], # نام کامل شرکت
+                
+                # --- قیمت‌ها و حجم‌های اصلی: با استفاده از 'or 0.0' ایمن‌سازی می‌شوند ---
+                'last_price': rt_data.last_price or 0.0,      # قیمت آخرین معامله
+                'adj_close': rt_data.adj_close or 0.0,        # قیمت پایانی
+                'open_price': rt_data.open_price or 0.0,
+                'yesterday_price': rt_data.yesterday_price or 0.0,
+                'high_price': rt_data.high_price or 0.0,
+                'low_price': rt_data.low_price or 0.0,
+                'volume': rt_data.volume or 0,               # حجم معاملات لحظه‌ای
+                'value': rt_data.value or 0.0,                 # ارزش معاملات
+                'base_volume': metadata['base_volume'] or 0, # حجم مبنا از کش روزانه متادیتا گرفته می‌شود
+                'count': rt_data.count or 0,                 # تعداد معاملات
+                
+                # --- اطلاعات تابلوخوانی (بهترین عرضه و تقاضا) ---
+                'best_demand_price': rt_data.best_demand_price or 0.0, # قیمت بهترین خرید (سرخط)
+                'best_demand_vol': rt_data.best_demand_vol or 0,       # حجم بهترین خرید
+                'best_supply_price': rt_data.best_supply_price or 0.0, # قیمت بهترین فروش
+                'best_supply_vol': rt_data.best_supply_vol or 0,       # حجم بهترین فروش
+                
+                # --- حقیقی / حقوقی (با استفاده از تابع کمکی ایمن) ---
+                # طبق مستندات، این آبجکت‌ها داخل individual_trade_summary و corporate_trade_summary هستند
+            }
+            
+            # نگاشت داده‌های حقیقی (Individual)
+            result.update(self._safe_get_trade_summary(rt_data, 'individual'))
+
+            # نگاشت داده‌های حقوقی (Corporate)
+            result.update(self._safe_get_trade_summary(rt_data, 'corporate'))
+
+            # محاسبه قدرت خریدار حقیقی (Optional - محاسبه در لحظه)
+            # اگر بخواهید همینجا محاسبه کنید:
+            # buy_power = (ind_buy_vol / ind_buy_count) if ind_buy_count > 0 else 0
+            
+            return result
+
+        except RuntimeError:
+            # این ارور طبق مستندات یعنی دیتای لحظه‌ای موجود نیست (نماد بسته یا قدیمی)
+            logger.warning(f"⚠️ Real-time data not available for {ticker.symbol} (Stopped or Old).")
+            # تصمیم درباره تلاش مجدد با Circuit Breaker در Orchestrator است
+            raise SymbolUnavailableError(ticker.symbol)
+        except Exception as e:
+            # خطای 'unsupported operand type(s) for *: 'NoneType' and 'float'' دیگر نباید اینجا رخ دهد، 
+            # بلکه در مراحل بعدی تحلیل (فاز 2) که از این داده‌ها استفاده می‌کند، رخ می‌دهد.
+            logger.error(f"❌ Error mapping data for {ticker.symbol}: {e}")
+            return None
+
+
+# =========================================================
+# ضبط جلسه معاملاتی (Recording)
+# =========================================================
+class RecordingDataSource(LiveDataSource):
+    """
+    هر منبع داده دیگری را می‌پوشاند و همه Snapshot های نگاشت‌شده را به همراه زمان سیکل
+    در فایل روزانه recordings/session_YYYYMMDD.jsonl.gz ذخیره می‌کند.
+    همه رکوردهای یک سیکل (Sweep) یک زمان مشترک دارند تا بازپخش، سیکل به سیکل جلو برود نه نماد به نماد.
+    هر سیکل یک عضو (member) gzip جدید به انتهای فایل اضافه می‌کند؛ فایل همیشه Append-only و قابل خواندن است.
+    """
+
+    def __init__(self, source: LiveDataSource, recordings_dir: str = RECORDINGS_DIR):
+        self.source = source
+        self.is_live = source.is_live
+        self.poll_interval_scale = source.poll_interval_scale
+        self.recordings_dir = recordings_dir
+        os.makedirs(recordings_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._buffer: List[Dict[str, Any]] = []
+        # زمان اولین واکشی سیکل جاری؛ در flush به همه رکوردهای سیکل داده می‌شود
+        self._cycle_time: Optional[float] = None
+
+    def _append(self, line: Dict[str, Any]):
+        with self._lock:
+            if self._cycle_time is None:
+                self._cycle_time = time.time()
+            self._buffer.append(line)
+
+    def fetch(self, symbol: str) -> Optional[Dict[str, Any]]:
+        try:
+            record = self.source.fetch(symbol)
+        except SymbolUnavailableError:
+            self._append({'s': symbol, 'u': 1})
+            raise
+        if record:
+            self._append({'s': symbol, 'r': record})
+        return record
+
+    def recording_path(self) -> str:
+        day = datetime.now(TEHRAN_TZ).strftime('%Y%m%d')
+        return os.path.join(self.recordings_dir, f"session_{day}.jsonl.gz")
+
+    def flush(self):
+        self.source.flush()
+        with self._lock:
+            entries, self._buffer = self._buffer, []
+            cycle_time, self._cycle_time = self._cycle_time, None
+        if not entries:
+            return
+        lines = [json.dumps({'t': cycle_time, **entry}, ensure_ascii=False) for entry in entries]
+        try:
+            with gzip.open(self.recording_path(), 'ab') as f:
+                f.write(("\n".join(lines) + "\n").encode('utf-8'))
+        except Exception as e:
+            logger.error(f"❌ Failed to append session recording: {e}")
+
+    def universe(self) -> Optional[List[str]]:
+        return self.source.universe()
+
+    @property
+    def exhausted(self) -> bool:
+        return self.source.exhausted
+
+
+# =========================================================
+# بازپخش جلسه ضبط‌شده (Replay)
+# =========================================================
+class ReplayDataSource(LiveDataSource):
+    """
+    فایل(های) ضبط‌شده را با ساعت مجازی بازپخش می‌کند.
+    speed=1 زمان واقعی، speed=10 ده برابر سریع‌تر و speed=0 حداکثر سرعت است
+    (در حالت حداکثر سرعت، هر سیکل Orchestrator ساعت مجازی را به سیکل ضبط‌شده بعدی می‌برد).
+    fetch آخرین Snapshot هر نماد تا لحظه فعلی ساعت مجازی را برمی‌گرداند.
+    """
+    is_live = False
+
+    def __init__(self, path_pattern: str = REPLAY_FILE, speed: float = REPLAY_SPEED):
+        self.speed = max(0.0, speed)
+        self.poll_interval_scale = (1.0 / self.speed) if self.speed > 0 else 0.0
+
+        # برای هر نماد: لیست زمان‌ها و لیست رکوردها (None یعنی نماد در آن لحظه در دسترس نبوده)
+        self._times: Dict[str, List[float]] = {}
+        self._records: Dict[str, List[Optional[Dict[str, Any]]]] = {}
+        self._load(path_pattern)
+
+        all_times = sorted({t for times in self._times.values() for t in times})
+        self._timeline = all_times
+        self._session_start = all_times[0] if all_times else 0.0
+        self._session_end = all_times[-1] if all_times else 0.0
+
+        self._virtual_now = self._session_start
+        self._wall_start: Optional[float] = None
+
+    def _load(self, path_pattern: str):
+        paths = sorted(glob.glob(path_pattern))
+        if not paths:
+            raise FileNotFoundError(f"No recording matches REPLAY_FILE='{path_pattern}'")
+
+        entries: List[Tuple[float, str, Optional[Dict[str, Any]]]] = []
+        for path in paths:
+            opener = gzip.open if path.endswith('.gz') else open
+            with opener(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    item = json.loads(line)
+                    entries.append((item['t'], item['s'], item.get('r')))
+
+        entries.sort(key=lambda e: e[0])
+        for t, symbol, record in entries:
+            self._times.setdefault(symbol, []).append(t)
+            self._records.setdefault(symbol, []).append(record)
+        logger.info(f"🎞️ Loaded {len(entries)} recorded snapshots for {len(self._times)} symbols from {len(paths)} file(s).")
+
+    def _now(self) -> float:
+        """زمان فعلی ساعت مجازی جلسه."""
+        if self.speed == 0:
+            return self._virtual_now
+        if self._wall_start is None:
+            self._wall_start = time.monotonic()
+        return self._session_start + (time.monotonic() - self._wall_start) * self.speed
+
+    def fetch(self, symbol: str) -> Optional[Dict[str, Any]]:
+        times = self._times.get(symbol)
+        if not times:
+            return None
+        index = bisect.bisect_right(times, self._now()) - 1
+        if index < 0:
+            return None
+        record = self._records[symbol][index]
+        if record is None:
+            raise SymbolUnavailableError(symbol)
+        return dict(record)
+
+    def flush(self):
+        # در حالت حداکثر سرعت، هر سیکل به سیکل ضبط‌شده بعدی می‌رود (همه رکوردهای یک سیکل زمان مشترک دارند)
+        if self.speed == 0:
+            index = bisect.bisect_right(self._timeline, self._virtual_now)
+            self._virtual_now = self._timeline[index] if index < len(self._timeline) else self._session_end + 1
+
+    def universe(self) -> Optional[List[str]]:
+        return list(self._times.keys())
+
+    @property
+    def exhausted(self) -> bool:
+        return self._now() > self._session_end
+
+
+# =========================================================
+# بازار مصنوعی (Synthetic) برای تست بار
+# =========================================================
+class SyntheticDataSource(LiveDataSource):
+    """
+    تیک‌های مصنوعی ولی واقع‌نما با همان ساختار خروجی TsetmcDataSource تولید می‌کند.
+    - قطعی است: هر نماد Random مخصوص خودش را دارد (Seed + CRC نماد)، پس ترتیب Thread ها روی خروجی اثری ندارد.
+    - قیمت‌ها در دامنه مجاز ±۵٪ قیمت دیروز قدم می‌زنند؛ بخشی از نمادها روند صعودی و صف خرید دارند.
+    - بخشی از نمادها متوقف هستند و SymbolUnavailableError پرتاب می‌کنند (برای Circuit Breaker).
+    - latency_ms تأخیر شبکه TSETMC را شبیه‌سازی می‌کند.
+    """
+    # بازار مصنوعی به ساعات بازار وابسته نیست
+    is_live = False
+    PRICE_LIMIT = 0.05
+
+    def __init__(
+        self,
+        seed: int = SYNTHETIC_SEED,
+        latency_ms: float = SYNTHETIC_LATENCY_MS,
+        halted_ratio: float = 0.02,
+        hot_ratio: float = 0.1,
+    ):
+        self.seed = seed
+        self.latency_ms = latency_ms
+        self.halted_ratio = halted_ratio
+        self.hot_ratio = hot_ratio
+        self._lock = threading.Lock()
+        self._states: Dict[str, Dict[str, Any]] = {}
+
+    def _new_state(self, symbol: str) -> Dict[str, Any]:
+        rng = random.Random(self.seed ^ zlib.crc32(symbol.encode('utf-8')))
+        yesterday = float(rng.randrange(1_000, 60_000, 10))
+        state = {
+            'rng': rng,
+            'halted': rng.random() < self.halted_ratio,
+            'trend': 0.004 if rng.random() < self.hot_ratio else rng.uniform(-0.001, 0.001),
+            'yesterday': yesterday,
+            'open': round(yesterday * (1 + rng.uniform(-0.02, 0.02))),
+            'last': None,
+            'high': 0.0,
+            'low': 0.0,
+            'base_volume': rng.randrange(100_000, 5_000_000, 1_000),
+            'volume': 0,
+            'count': 0,
+            'individual': [0.0, 0, 0.0, 0],   # buy_vol, buy_count, sell_vol, sell_count
+            'corporate': [0.0, 0, 0.0, 0],
+        }
+        # شروع از میانه جلسه: بخشی از حجم روز (نسبت به حجم مبنا) قبلاً معامله شده است
+        self._trade(state, int(state['base_volume'] * rng.uniform(0.1, 2.5)), rng.randint(50, 2_000))
+        return state
+
+    @staticmethod
+    def _trade(state: Dict[str, Any], traded: int, trades: int):
+        """حجم traded را در trades معامله بین خریدار/فروشنده حقیقی و حقوقی پخش می‌کند."""
+        rng = state['rng']
+        state['volume'] += traded
+        state['count'] += trades
+
+        # در روند صعودی خریداران حقیقی درشت‌تر هستند (قدرت خریدار بالاتر)
+        bullish = state['trend'] > 0.002
+        buy_share = 0.65 if bullish else rng.uniform(0.35, 0.6)
+        buyers = max(1, int(trades * (0.4 if bullish else 0.6)))
+        sellers = max(1, trades - buyers)
+        corporate_share = rng.uniform(0.0, 0.3)
+        for kind, share in (('individual', 1 - corporate_share), ('corporate', corporate_share)):
+            summary = state[kind]
+            summary[0] += traded * share * buy_share
+            summary[1] += buyers
+            summary[2] += traded * share * (1 - buy_share)
+            summary[3] += sellers
+
+    def _step(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """یک تیک جدید: حرکت قیمت، حجم و معاملات حقیقی/حقوقی."""
+        rng = state['rng']
+        yesterday = state['yesterday']
+        upper, lower = yesterday * (1 + self.PRICE_LIMIT), yesterday * (1 - self.PRICE_LIMIT)
+
+        last = state['last'] if state['last'] is not None else state['open']
+        last = min(upper, max(lower, last * (1 + state['trend'] + rng.gauss(0, 0.003))))
+        last = float(round(last))
+        state['last'] = last
+        state['high'] = max(state['high'] or last, last)
+        state['low'] = min(state['low'] or last, last)
+
+        self._trade(state, int(state['base_volume'] * rng.uniform(0.001, 0.03)), rng.randint(1, 40))
+
+        at_upper = last >= round(upper)
+        return {
+            'last_price': last,
+            'best_demand_price': last if at_upper else last - 10,
+            'best_demand_vol': rng.randint(1_000, 500_000) * (10 if at_upper else 1),
+            'best_supply_price': 0.0 if at_upper else last + 10,
+            'best_supply_vol': 0 if at_upper else rng.randint(1_000, 500_000),
+        }
+
+    def fetch(self, symbol: str) -> Optional[Dict[str, Any]]:
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000)
+
+        with self._lock:
+            state = self._states.get(symbol)
+            if state is None:
+                state = self._states[symbol] = self._new_state(symbol)
+            if state['halted']:
+                raise SymbolUnavailableError(symbol)
+            book = self._step(state)
+
+            result = {
+                'symbol': symbol,
+                'symbol_name': f"{symbol} (synthetic)",
+                'last_price': book['last_price'],
+                'adj_close': book['last_price'],
+                'open_price': float(state['open']),
+                'yesterday_price': state['yesterday'],
+                'high_price': state['high'],
+                'low_price': state['low'],
+                'volume': state['volume'],
+                'value': state['volume'] * book['last_price'],
+                'base_volume': state['base_volume'],
+                'count': state['count'],
+                'best_demand_price': book['best_demand_price'],
+                'best_demand_vol': book['best_demand_vol'],
+                'best_supply_price': book['best_supply_price'],
+                'best_supply_vol': book['best_supply_vol'],
+            }
+            for kind in ('individual', 'corporate'):
+                buy_vol, buy_count, sell_vol, sell_count = state[kind]
+                result.update({
+                    f'{kind}_buy_vol': float(round(buy_vol)),
+                    f'{kind}_buy_count': buy_count,
+                    f'{kind}_sell_vol': float(round(sell_vol)),
+                    f'{kind}_sell_count': sell_count,
+                })
+        return result
+
+
+def create_data_source() -> LiveDataSource:
+    """منبع داده را بر اساس متغیرهای محیطی DATA_SOURCE (tsetmc / replay / synthetic) و RECORD_SESSION می‌سازد."""
+    if DATA_SOURCE == 'replay':
+        source: LiveDataSource = ReplayDataSource(REPLAY_FILE, REPLAY_SPEED)
+        logger.info(f"🎞️ Replaying recorded session '{REPLAY_FILE}' at speed {REPLAY_SPEED or 'max'}.")
+    elif DATA_SOURCE == 'synthetic':
+        source = SyntheticDataSource()
+        logger.info(f"🧪 Using synthetic market data (seed={SYNTHETIC_SEED}, latency={SYNTHETIC_LATENCY_MS}ms).")
+    else:
+        source = TsetmcDataSource()
+
+    if RECORD_SESSION:
+        logger.info(f"⏺️ Recording mapped snapshots to '{RECORDINGS_DIR}/'.")
+        source = RecordingDataSource(source)
+    return source
@@ -3,18 +3,24 @@ import os
 import uuid
 from datetime import date, datetime
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, Date, DateTime, UniqueConstraint, ForeignKey, Text
+from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, Date, DateTime, UniqueConstraint, ForeignKey, Text, Index, text
 from sqlalchemy.orm import sessionmaker, declarative_base, Session
 from sqlalchemy.engine import Engine
-from typing import Optional
+from typing import Optional, Tuple, Dict, Any
+import logging
 
 
+load_dotenv()
+
 # 1. تنظیمات آدرس دیتابیس
-# آدرس مستقیم
-DATABASE_URL = "sqlite:///E:/BourseAnalysis/V-3/Backend-V3/app.db"
-# اگر می‌خواهید از .env استفاده کنید:
-# load_dotenv()
-# DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./phase1_db.sqlite")
+# آدرس پیش‌فرض دیتابیس Backend؛ با DATABASE_URL قابل تغییر است (مثلاً دیتابیس موقت load_test.py)
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///E:/BourseAnalysis/V-3/Backend-V3/app.db")
+
+# 2. پنجره زمانی نمادهای فاز ۱ (بر حسب تعداد روزهای معاملاتی ثبت‌شده در هر جدول؛ 0 یعنی بدون محدودیت)
+PHASE1_LOOKBACK_DAYS = int(os.getenv("PHASE1_LOOKBACK_DAYS", 5))
+# واچ‌لیست هفتگی است، پس پنجره بلندتری دارد
+WATCHLIST_LOOKBACK_DAYS = int(os.getenv("WATCHLIST_LOOKBACK_DAYS", 20))
+WATCHLIST_ACTIVE_STATUS = os.getenv("WATCHLIST_ACTIVE_STATUS", "active")
 
 # تعریف Base برای SQLAlchemy Declarative
 Base = declarative_base()
@@ -50,6 +56,10 @@ class WeeklyWatchlistResult(Base):
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
+    __table_args__ = (
+        Index('ix_weekly_watchlist_status_jentry_date', 'status', 'jentry_date'),
+    )
+
     def __repr__(self):
         return f"<WeeklyWatchlistResult {self.symbol_id}>"
 
@@ -75,6 +85,7 @@ class GoldenKeyResult(Base):
     
     __table_args__ = (
         UniqueConstraint('symbol_id', 'jdate', name='_symbol_jdate_golden_key_uc'),
+        Index('ix_golden_key_jdate_score', 'jdate', 'score'),
     )
 
     def __repr__(self):
@@ -102,6 +113,7 @@ class PotentialBuyQueueResult(Base):
 
     __table_args__ = (
         UniqueConstraint('symbol_id', 'jdate', name='_symbol_jdate_potential_queue_uc'),
+        Index('ix_potential_buy_queue_jdate_probability', 'jdate', 'probability_percent'),
     )
 
     def __repr__(self):
@@ -138,6 +150,11 @@ class TechnicalIndicatorData(Base):
     # اضافه کردن created_at برای اطمینان از مرتب‌سازی در صورت نبود jdate دقیق
     created_at = Column(DateTime, default=datetime.now) 
 
+    __table_args__ = (
+        # آخرین سطر هر نماد (LatestTech در main.py) با یک Seek روی این ایندکس پیدا می‌شود
+        Index('ix_technical_indicator_symbol_jdate', 'symbol_id', 'jdate'),
+    )
+
 
 class CandlestickPatternDetection(Base):
     """نتایج تشخیص الگوهای کندل استیک."""
@@ -152,6 +169,11 @@ class CandlestickPatternDetection(Base):
     # اضافه کردن created_at برای اطمینان از مرتب‌سازی در صورت نبود jdate دقیق
     created_at = Column(DateTime, default=datetime.now) 
 
+    __table_args__ = (
+        # آخرین الگوی هر نماد (LatestCandle در main.py) با یک Seek روی این ایندکس پیدا می‌شود
+        Index('ix_candlestick_pattern_symbol_jdate', 'symbol_id', 'jdate'),
+    )
+
 
 class DynamicSupportOpportunity(Base):
     """ذخیره سازی نتایج نهایی تحلیل حمایت دینامیک و پول هوشمند."""
@@ -171,6 +193,7 @@ class DynamicSupportOpportunity(Base):
     
     __table_args__ = (
         UniqueConstraint('symbol_id', 'analysis_date', name='uq_symbol_date'),
+        Index('ix_dynamic_support_analysis_date', 'analysis_date'),
     )
 
     def __repr__(self):
@@ -207,6 +230,24 @@ def create_tables():
     """ایجاد تمام جداول تعریف شده در Base."""
     Base.metadata.create_all(bind=engine)
 
+def ensure_phase1_indexes():
+    """
+    ایندکس‌های ترکیبی مورد نیاز فیلتر پنجره زمانی و جستجوی آخرین اندیکاتور/الگوی هر نماد را
+    روی دیتابیس موجود (ساخته‌شده توسط Backend) ایجاد می‌کند.
+    create_all روی جداول موجود ایندکس اضافه نمی‌کند، به همین دلیل این تابع جداگانه است.
+    """
+    for model in (
+        WeeklyWatchlistResult, GoldenKeyResult, PotentialBuyQueueResult, DynamicSupportOpportunity,
+        TechnicalIndicatorData, CandlestickPatternDetection,
+    ):
+        for index in model.__table__.indexes:
+            if not index.name.startswith('ix_'):
+                continue
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except Exception as e:
+                logging.warning(f"⚠️ Could not create index {index.name}: {e}")
+
 def get_symbol_name_by_id(symbol_id: str) -> Optional[str]:
     """
     نام نماد (symbol_name) را با استفاده از symbol_id از جدول
@@ -228,8 +269,93 @@ def get_symbol_name_by_id(symbol_id: str) -> Optional[str]:
     finally:
         session.close()
 
+# =================================================================
+# --- اثر انگشت (Fingerprint) جداول فاز ۱ ---
+# =================================================================
+
+# برای هر جدول: تعداد سطرها، بزرگترین id و آخرین زمان تغییر.
+# هر سه روی SQLite ارزان هستند (MAX(id) از روی rowid و COUNT از روی کوچکترین ایندکس).
+PHASE1_FINGERPRINT_QUERY = text("""
+    SELECT
+        (SELECT COUNT(*) FROM weekly_watchlist_results)        AS weekly_count,
+        (SELECT MAX(id) FROM weekly_watchlist_results)         AS weekly_max_id,
+        (SELECT MAX(updated_at) FROM weekly_watchlist_results) AS weekly_updated_at,
+        (SELECT COUNT(*) FROM golden_key_results)              AS golden_count,
+        (SELECT MAX(id) FROM golden_key_results)               AS golden_max_id,
+        (SELECT MAX(timestamp) FROM golden_key_results)        AS golden_updated_at,
+        (SELECT COUNT(*) FROM potential_buy_queue_results)     AS buy_queue_count,
+        (SELECT MAX(id) FROM potential_buy_queue_results)      AS buy_queue_max_id,
+        (SELECT MAX(timestamp) FROM potential_buy_queue_results) AS buy_queue_updated_at,
+        (SELECT COUNT(*) FROM dynamic_support_opportunities)   AS dynamic_count,
+        (SELECT MAX(id) FROM dynamic_support_opportunities)    AS dynamic_max_id,
+        (SELECT MAX(created_at) FROM dynamic_support_opportunities) AS dynamic_updated_at
+""")
+
+def get_phase1_fingerprint(session: Session) -> Tuple:
+    """
+    اثر انگشت ارزان چهار جدول فاز ۱ را برمی‌گرداند.
+    تا زمانی که Backend در این جداول چیزی ننوشته باشد، خروجی ثابت می‌ماند.
+    """
+    row = session.execute(PHASE1_FINGERPRINT_QUERY).one()
+    return tuple(row)
+
+
+# جداول ورودی کوئری کاندیدهای فاز ۲ (علاوه بر چهار جدول فاز ۱).
+# این جداول بزرگ هستند، پس فقط از MAX روی rowid و ستون‌های ایندکس‌دار استفاده می‌شود (بدون COUNT).
+CANDIDATE_DATA_FINGERPRINT_QUERY = text("""
+    SELECT
+        (SELECT MAX(id) FROM technical_indicator_data)           AS tech_max_id,
+        (SELECT MAX(jdate) FROM technical_indicator_data)        AS tech_max_jdate,
+        (SELECT MAX(id) FROM candlestick_pattern_detection)      AS candle_max_id,
+        (SELECT MAX(jdate) FROM candlestick_pattern_detection)   AS candle_max_jdate,
+        (SELECT COUNT(*) FROM comprehensive_symbol_data)         AS symbols_count
+""")
+
+def get_candidate_data_fingerprint(session: Session) -> Tuple:
+    """
+    اثر انگشت همه جداولی که کوئری کاندیدهای main.py از آن‌ها می‌خواند
+    (چهار جدول فاز ۱ + اندیکاتورها، الگوهای کندلی و اطلاعات نمادها).
+    """
+    row = session.execute(CANDIDATE_DATA_FINGERPRINT_QUERY).one()
+    return get_phase1_fingerprint(session) + tuple(row)
+
+
+def get_phase1_window_cutoffs(session: Session) -> Dict[str, Any]:
+    """
+    برای هر جدول فاز ۱، تاریخ N-امین روز معاملاتی اخیر (بر اساس تاریخ‌های متمایز ثبت‌شده) را برمی‌گرداند.
+    سطرهایی با تاریخ بزرگتر یا مساوی این مقدار داخل پنجره هستند.
+    مقدار None یعنی فیلتری اعمال نشود (پنجره غیرفعال است یا جدول کمتر از N روز داده دارد).
+
+    هر کوئری روی ایندکس‌های ترکیبی ensure_phase1_indexes اجرا می‌شود و هزینه آن با بزرگ شدن جدول ثابت می‌ماند.
+    """
+    windows = {
+        'weekly': (WeeklyWatchlistResult.jentry_date, WATCHLIST_LOOKBACK_DAYS,
+                   WeeklyWatchlistResult.status == WATCHLIST_ACTIVE_STATUS),
+        'golden': (GoldenKeyResult.jdate, PHASE1_LOOKBACK_DAYS, None),
+        'buy_queue': (PotentialBuyQueueResult.jdate, PHASE1_LOOKBACK_DAYS, None),
+        'dynamic': (DynamicSupportOpportunity.analysis_date, PHASE1_LOOKBACK_DAYS, None),
+    }
+
+    cutoffs: Dict[str, Any] = {}
+    for table_key, (date_column, lookback_days, extra_filter) in windows.items():
+        if lookback_days <= 0:
+            cutoffs[table_key] = None
+            continue
+
+        query = session.query(date_column).distinct()
+        if extra_filter is not None:
+            query = query.filter(extra_filter)
+        cutoffs[table_key] = (
+            query.order_by(date_column.desc())
+            .offset(lookback_days - 1)
+            .limit(1)
+            .scalar()
+        )
+    return cutoffs
+
 
 if __name__ == '__main__':
     # در صورت اجرای مستقیم فایل، جداول را ایجاد می‌کند.
     create_tables()
+    ensure_phase1_indexes()
     print("✅ Database tables created/checked.")
\ No newline at end of file
@@ -0,0 +1,126 @@
+# job_runner.py
+# وظیفه: اجرای تک‌پروازی (Single-flight) تحلیل و حالت Job ناهمگام برای اندپوینت /run
+
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# --- تنظیمات ---
+# تعداد Job های تمام‌شده که برای پاسخ به /run/<id> در حافظه نگه داشته می‌شوند
+JOB_HISTORY_SIZE = int(os.getenv("JOB_HISTORY_SIZE", 50))
+
+
+class SingleFlightJobRunner:
+    """
+    تابع func را حداکثر یک نسخه در هر لحظه اجرا می‌کند:
+    - درخواست‌هایی که هنگام اجرای یک Job می‌رسند (زمان‌بند، فراخوانی دستی، Retry و Trigger رویدادمحور)
+      به همان Job متصل می‌شوند و همان نتیجه را دریافت می‌کنند (Coalescing).
+    - هر Job یک شناسه دارد تا در حالت ناهمگام بتوان نتیجه را بعداً از /run/<id> خواند.
+    """
+
+    def __init__(self, func: Callable[..., Dict[str, Any]], history_size: int = JOB_HISTORY_SIZE):
+        self.func = func
+        self.history_size = history_size
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._inflight: Optional[Dict[str, Any]] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="analysis-job")
+        self.coalesced_requests = 0
+
+    # ---------------------------------------------------------
+    # ثبت و اجرای Job
+    # ---------------------------------------------------------
+    def submit(self, **kwargs) -> Tuple[Dict[str, Any], bool]:
+        """
+        Job جدید ثبت می‌کند، یا اگر Job دیگری در حال اجراست همان را برمی‌گرداند.
+        خروجی: (Job, آیا به Job در حال اجرا متصل شد)
+        """
+        with self._lock:
+            if self._inflight is not None:
+                self._inflight['waiters'] += 1
+                self.coalesced_requests += 1
+                logger.info(f"🔗 Analysis job {self._inflight['id']} already in flight. Joining it.")
+                return self._inflight, True
+
+            job = {
+                'id': uuid.uuid4().hex[:12],
+                'status': 'queued',
+                'params': kwargs,
+                'waiters': 1,
+                'submitted_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'result': None,
+                'error': None,
+            }
+            self._inflight = job
+            self._jobs[job['id']] = job
+            self._trim_history()
+            job['future'] = self._executor.submit(self._execute, job)
+            return job, False
+
+    def _execute(self, job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        job['status'] = 'running'
+        job['started_at'] = time.time()
+        try:
+            job['result'] = self.func(**job['params'])
+            job['status'] = 'done'
+            return job['result']
+        except Exception as e:
+            logger.error(f"❌ Analysis job {job['id']} failed: {e}")
+            job['error'] = str(e)
+            job['status'] = 'error'
+            raise
+        finally:
+            job['finished_at'] = time.time()
+            with self._lock:
+                if self._inflight is job:
+                    self._inflight = None
+
+    def run(self, timeout: Optional[float] = None, **kwargs) -> Tuple[Dict[str, Any], bool]:
+        """
+        اجرای همگام: تا پایان Job (جدید یا در حال اجرا) صبر می‌کند.
+        خروجی: (Job تمام‌شده، آیا به Job در حال اجرا متصل شد). خطای func دوباره پرتاب می‌شود.
+        """
+        job, coalesced = self.submit(**kwargs)
+        job['future'].result(timeout=timeout)
+        return job, coalesced
+
+    def _trim_history(self):
+        """قدیمی‌ترین Job های تمام‌شده حذف می‌شوند (Job در حال اجرا هیچ‌وقت حذف نمی‌شود)."""
+        while len(self._jobs) > self.history_size:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if oldest is self._inflight:
+                break
+            del self._jobs[oldest_id]
+
+    # ---------------------------------------------------------
+    # گزارش وضعیت
+    # ---------------------------------------------------------
+    @staticmethod
+    def describe(job: Dict[str, Any]) -> Dict[str, Any]:
+        """نمای قابل JSON شدن Job (بدون Future)."""
+        view = {k: v for k, v in job.items() if k != 'future'}
+        if job['finished_at'] and job['started_at']:
+            view['duration_seconds'] = round(job['finished_at'] - job['started_at'], 3)
+        return view
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return self.describe(job) if job else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'inflight_job': self._inflight['id'] if self._inflight else None,
+                'jobs_in_history': len(self._jobs),
+                'coalesced_requests': self.coalesced_requests,
+            }
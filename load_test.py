@@ -0,0 +1,331 @@
+# load_test.py
+# وظیفه: تست بار End-to-End با بازار مصنوعی (Orchestrator → Redis → process_market_analysis → Telegram)
+#
+# همه وابستگی‌های بیرونی با نمونه‌های محلی جایگزین می‌شوند:
+#   - TSETMC  → SyntheticDataSource (قطعی، با تأخیر شبیه‌سازی‌شده)
+#   - Redis   → fakeredis (در حافظه؛ برای هر اندازه Universe یک سرور تازه، از طریق همان Pool های redis_pool)
+#   - Telegram → یک سرور HTTP محلی که sendMessage را می‌پذیرد و شمارش می‌کند
+#   - دیتابیس Backend → فایل SQLite موقت با سطرهای فاز ۱ مصنوعی
+#
+# اجرا:
+#   python load_test.py --sizes 100,300,700 --cycles 10 --latency-ms 30
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List
+
+# --- تنظیمات پیش‌فرض ---
+DEFAULT_SIZES = "100,300,700"
+DEFAULT_CYCLES = 10
+DEFAULT_LATENCY_MS = 30.0
+DEFAULT_SEED = 42
+# روزهای معاملاتی (شمسی) که سطرهای فاز ۱ روی آن‌ها پخش می‌شوند
+PHASE1_JDATES = [f"1404-07-{day:02d}" for day in range(1, 11)]
+
+
+# =========================================================
+# 1) سرور محلی Telegram Bot API
+# =========================================================
+class TelegramStandIn:
+    """سرور HTTP محلی که مسیر /bot<token>/sendMessage را شبیه‌سازی می‌کند."""
+
+    def __init__(self):
+        stand_in = self
+        self.messages = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with stand_in._lock:
+                    stand_in.messages += 1
+                    stand_in.bytes += len(body)
+                payload = json.dumps({"ok": True, "result": {"message_id": stand_in.messages}}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def reset(self):
+        with self._lock:
+            self.messages = 0
+            self.bytes = 0
+
+    def close(self):
+        self.server.shutdown()
+
+
+# =========================================================
+# 2) تولید سطرهای فاز ۱ مصنوعی
+# =========================================================
+def synthetic_symbol_names(size: int) -> List[str]:
+    return [f"نماد{i:04d}" for i in range(1, size + 1)]
+
+
+def populate_phase1_database(size: int, seed: int) -> List[str]:
+    """
+    جداول دیتابیس موقت را از نو می‌سازد و برای size نماد، سطرهای فاز ۱ قطعی (با seed) درج می‌کند.
+    نسبت‌ها تقریباً شبیه دیتابیس واقعی هستند: هر نماد حداقل در یکی از چهار جدول فاز ۱ حضور دارد.
+    """
+    from db_connector import (
+        Base, engine, get_db_session, ensure_phase1_indexes,
+        ComprehensiveSymbolData, WeeklyWatchlistResult, GoldenKeyResult,
+        PotentialBuyQueueResult, DynamicSupportOpportunity,
+        TechnicalIndicatorData, CandlestickPatternDetection,
+    )
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    ensure_phase1_indexes()
+
+    rng = random.Random(seed)
+    names = synthetic_symbol_names(size)
+    patterns = ['hammer', 'bullish engulfing', 'doji', 'shooting star', 'morning star']
+    today = date.today()
+
+    session = get_db_session()
+    try:
+        for i, name in enumerate(names):
+            symbol_id = f"{seed}{i:012d}"
+            session.add(ComprehensiveSymbolData(symbol_id=symbol_id, symbol_name=name))
+
+            tables = {t for t in ('Watchlist', 'GoldenKey', 'BuyQueue', 'DynamicSupport') if rng.random() < 0.35}
+            tables = tables or {rng.choice(['Watchlist', 'GoldenKey', 'BuyQueue', 'DynamicSupport'])}
+            jdates = rng.sample(PHASE1_JDATES, 3)
+            price = float(rng.randrange(1_000, 60_000, 10))
+
+            if 'Watchlist' in tables:
+                jdate = jdates[0]
+                session.add(WeeklyWatchlistResult(
+                    symbol_id=symbol_id, symbol_name=name, entry_price=price,
+                    entry_date=today, jentry_date=jdate,
+                    status='active' if rng.random() < 0.8 else 'closed',
+                ))
+            for jdate in jdates:
+                if 'GoldenKey' in tables:
+                    session.add(GoldenKeyResult(
+                        symbol_id=symbol_id, symbol_name=name, jdate=jdate, score=rng.randint(10, 100),
+                    ))
+                if 'BuyQueue' in tables:
+                    session.add(PotentialBuyQueueResult(
+                        symbol_id=symbol_id, symbol_name=name, jdate=jdate,
+                        probability_percent=round(rng.uniform(20, 95), 1),
+                    ))
+                session.add(TechnicalIndicatorData(
+                    symbol_id=symbol_id, jdate=jdate,
+                    RSI=round(rng.uniform(15, 85), 1), halftrend_signal=rng.choice([-1, 0, 1]),
+                ))
+                if rng.random() < 0.5:
+                    session.add(CandlestickPatternDetection(
+                        symbol_id=symbol_id, jdate=jdate, pattern_name=rng.choice(patterns),
+                    ))
+            if 'DynamicSupport' in tables:
+                for offset in rng.sample(range(10), 2):
+                    session.add(DynamicSupportOpportunity(
+                        analysis_date=today - timedelta(days=offset), symbol_id=symbol_id, symbol_name=name,
+                        current_price=price, support_level=price * 0.95,
+                        distance_from_support=5.0, power_ratio=round(rng.uniform(0.5, 3), 2),
+                    ))
+        session.commit()
+    finally:
+        session.close()
+    return names
+
+
+# =========================================================
+# 3) اندازه‌گیری
+# =========================================================
+def percentile(values: List[float], q: float) -> float:
+    """صدک q (0..100) به روش Nearest-Rank."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(samples: Dict[str, List[float]]) -> Dict[str, Dict[str, float]]:
+    return {
+        stage: {
+            'p50': round(percentile(values, 50), 1),
+            'p95': round(percentile(values, 95), 1),
+            'p99': round(percentile(values, 99), 1),
+            'max': round(max(values), 1) if values else 0.0,
+        }
+        for stage, values in samples.items()
+    }
+
+
+def run_universe(size: int, args, telegram: TelegramStandIn) -> Dict[str, Any]:
+    """یک اندازه Universe: ساخت دیتابیس، سپس cycles بار (سیکل Writer + یک /run)."""
+    import fakeredis
+    import redis_pool
+
+    # هر اندازه Universe یک Redis تازه دارد؛ Pool های پروژه به همان سرور در حافظه وصل می‌شوند
+    redis_pool.configure_pools(connection_class=fakeredis.FakeConnection, server=fakeredis.FakeServer())
+
+    from data_sources import SyntheticDataSource
+    from phase1_orchestrator import Phase1Orchestrator
+    import main
+    import alert_state
+
+    populate_phase1_database(size, args.seed)
+    telegram.reset()
+    # وضعیت درون‌پردازه‌ای main (نسخه تحلیل‌شده، کش کاندیدها) متعلق به Redis / دیتابیس قبلی است
+    main.reset_state()
+    alert_state.reset_state()
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+
+    orchestrator = Phase1Orchestrator(
+        max_workers=args.workers,
+        data_source=SyntheticDataSource(seed=args.seed, latency_ms=args.latency_ms),
+    )
+    samples: Dict[str, List[float]] = {}
+    fetched_total, writer_seconds, analyzed_total, analysis_seconds, alerts_total = 0, 0.0, 0, 0.0, 0
+    alerts_sent, alerts_suppressed = 0, 0
+
+    for _ in range(args.cycles):
+        # --- سیکل Writer: واکشی همزمان + نوشتن در Redis ---
+        started = time.perf_counter()
+        orchestrator.fetch_and_cache_all_realtime()
+        cycle_ms = (time.perf_counter() - started) * 1000
+        fetch_ms = orchestrator.last_cycle_stats.get('duration_seconds', 0.0) * 1000
+        samples.setdefault('writer_fetch', []).append(fetch_ms)
+        samples.setdefault('writer_cache_write', []).append(max(0.0, cycle_ms - fetch_ms))
+        samples.setdefault('writer_cycle', []).append(cycle_ms)
+        fetched_total += orchestrator.last_cycle_stats.get('fetched', 0)
+        writer_seconds += cycle_ms / 1000
+
+        # --- یک اجرای /run ---
+        started = time.perf_counter()
+        result = main.process_market_analysis()
+        run_ms = (time.perf_counter() - started) * 1000
+        for stage, value in result.get('timings_ms', {}).items():
+            samples.setdefault(f"run_{stage}", []).append(value)
+        samples.setdefault('run_total', []).append(run_ms)
+        analyzed_total += result.get('symbols_checked', 0)
+        alerts_total += result.get('alerts_generated', 0)
+        alerts_sent += result.get('alerts_sent', 0)
+        alerts_suppressed += result.get('alerts_suppressed', 0)
+        analysis_seconds += run_ms / 1000
+
+    # پیام‌های تلگرام در صف پس‌زمینه notifier هستند؛ قبل از خواندن آمار Stand-in ارسال شوند
+    main.notifier.flush(timeout=30)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    orchestrator.close()
+
+    return {
+        'universe': size,
+        'cycles': args.cycles,
+        'writer_symbols_per_second': round(fetched_total / writer_seconds, 1) if writer_seconds else 0.0,
+        'run_symbols_per_second': round(analyzed_total / analysis_seconds, 1) if analysis_seconds else 0.0,
+        'symbols_checked_per_run': analyzed_total // max(1, args.cycles),
+        'alerts_generated': alerts_total,
+        'alerts_sent': alerts_sent,
+        'alerts_suppressed': alerts_suppressed,
+        'telegram_messages': telegram.messages,
+        'telegram_bytes': telegram.bytes,
+        'telegram_delivery': main.notifier.stats(),
+        'peak_memory_mb': round(peak_bytes / 1024 / 1024, 1),
+        'redis_pools': redis_pool.pool_stats(),
+        'latency_ms': summarize(samples),
+    }
+
+
+def print_report(results: List[Dict[str, Any]]):
+    for result in results:
+        print(f"\n=== Universe: {result['universe']} symbols ({result['cycles']} cycles) ===")
+        print(f"  writer throughput : {result['writer_symbols_per_second']} symbols/s")
+        print(f"  /run throughput   : {result['run_symbols_per_second']} symbols/s "
+              f"({result['symbols_checked_per_run']} candidates per run)")
+        print(f"  alerts / telegram : {result['alerts_generated']} alerts "
+              f"({result['alerts_sent']} sent, {result['alerts_suppressed']} suppressed), "
+              f"{result['telegram_messages']} messages, {result['telegram_bytes']} bytes")
+        delivery = result['telegram_delivery']
+        print(f"  telegram delivery : avg {delivery['delivery_latency_ms']['avg']} ms, "
+              f"max {delivery['delivery_latency_ms']['max']} ms, dropped {delivery['dropped']}")
+        print(f"  peak memory       : {result['peak_memory_mb']} MB")
+        for name, stats in result['redis_pools'].items():
+            print(f"  redis pool {name:<7}: created={stats['created']} waits={stats['waits']} checkouts={stats['checkouts']}")
+        print(f"  {'stage':<20}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+        for stage, stats in result['latency_ms'].items():
+            print(f"  {stage:<20}{stats['p50']:>10}{stats['p95']:>10}{stats['p99']:>10}{stats['max']:>10}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="End-to-end load test with a synthetic market.")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help="Comma-separated universe sizes (e.g. 100,300,700)")
+    parser.add_argument('--cycles', type=int, default=DEFAULT_CYCLES, help="Writer cycles and /run calls per size")
+    parser.add_argument('--latency-ms', type=float, default=DEFAULT_LATENCY_MS, help="Simulated TSETMC latency per request")
+    parser.add_argument('--workers', type=int, default=None, help="Fetch workers (default: FETCH_MAX_WORKERS)")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--workdir', default=None, help="Scratch directory for the SQLite DB, logs and caches")
+    parser.add_argument('--output', default=None, help="Optional JSON file for the results")
+    return parser.parse_args()
+
+
+def main_cli():
+    args = parse_args()
+    try:
+        import fakeredis  # noqa: F401
+    except ImportError:
+        sys.exit("❌ load_test.py needs 'fakeredis' as the local Redis stand-in: pip install fakeredis")
+
+    # همه فایل‌های جانبی (دیتابیس موقت، logs، cache) در پوشه موقت نوشته می‌شوند
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="morning_assistant_load_"))
+    output = os.path.abspath(args.output) if args.output else None
+    os.makedirs(workdir, exist_ok=True)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)
+
+    telegram = TelegramStandIn()
+    # متغیرهای محیطی باید قبل از import ماژول‌های پروژه تنظیم شوند
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'load_test.db')}"
+    os.environ['TELEGRAM_API_URL'] = telegram.url
+    os.environ['TELEGRAM_BOT_TOKEN'] = "load-test"
+    os.environ['TELEGRAM_CHAT_ID'] = "0"
+
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+    import main  # noqa: F401  (logging.basicConfig داخل main بعد از این خط اثری ندارد)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = []
+    try:
+        for size in [int(s) for s in args.sizes.split(',') if s.strip()]:
+            print(f"🧪 Running universe of {size} symbols...", flush=True)
+            results.append(run_universe(size, args, telegram))
+    finally:
+        telegram.close()
+
+    print_report(results)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n📁 Scratch directory: {workdir}")
+
+
+if __name__ == "__main__":
+    main_cli()
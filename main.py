@@ -1,20 +1,38 @@
 # main.py
 # سرور اصلی Flask برای اجرای تحلیل‌های فاز ۲ و ارسال سیگنال
 
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request, Response
 import requests
 from datetime import datetime
 from sqlalchemy import text
-from db_connector import get_db_session
-from analysis_engine import analyze_symbol_combined, escape_markdown
+from db_connector import (
+    get_db_session, get_phase1_window_cutoffs, get_candidate_data_fingerprint,
+    ensure_phase1_indexes, WATCHLIST_ACTIVE_STATUS,
+)
+from analysis_engine import analyze_symbol_combined, analyze_symbols_batch, escape_markdown
 from notifier import TelegramNotifier
+from realtime_cache import (
+    read_snapshot, read_version, read_updated_at, write_analysis_scores, write_analysis_run,
+    read_candidates, write_candidates, ANALYSIS_CANDIDATES_TTL_SECONDS,
+)
+from snapshot_trigger import SnapshotUpdateTrigger, EVENT_TRIGGER_ENABLED
+from redis_pool import get_redis_client, pool_stats
+from job_runner import SingleFlightJobRunner
+from alert_state import filter_alerts, mark_pending, settle_alerts, clear_pending
+from subscribers import alert_symbol, match_subscribers
+from alert_store import build_run_record, encode_run_record, append_record
+from metrics import (
+    ANALYSIS_STAGE_SECONDS, ANALYSIS_RUNS, SYMBOLS_SCORED, ALERTS, ANALYSIS_LAST_RUN,
+    SNAPSHOT_AGE_SECONDS, CANDIDATE_CACHE_AGE_SECONDS, METRICS_ENABLED, observe_stages, track_age, render_latest,
+)
 import os
 import logging
 import json
-import redis
+import time
+import threading
 from dotenv import load_dotenv
 from zoneinfo import ZoneInfo
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Iterable
 
 # --- تنظیمات اولیه ---
 load_dotenv()
@@ -29,14 +47,23 @@ logger = logging.getLogger(__name__)
 notifier = TelegramNotifier()
 TEHRAN_TZ = ZoneInfo("Asia/Tehran")
 
-# تنظیمات Redis (مشابه Orchestrator)
-REALTIME_CACHE_KEY = "market:realtime:tickers" 
-REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
-REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+# تنظیمات Redis در redis_pool (Pool مشترک بین Thread های Flask) و کلیدها در realtime_cache تعریف شده‌اند
+REDIS_POOL_NAME = "main"
 
 LOG_DIR = "logs"
 os.makedirs(LOG_DIR, exist_ok=True)
 
+# امتیازدهی دسته‌ای (برداری) همه نمادها؛ با مقدار 0 حلقه قدیمی analyze_symbol_combined اجرا می‌شود
+ANALYSIS_BATCH_SCORING = os.getenv("ANALYSIS_BATCH_SCORING", "1") == "1"
+
+# اجرای تحلیل همزمان انجام نمی‌شود (درخواست‌های همزمان در analysis_jobs به یک اجرا متصل می‌شوند)
+_analysis_lock = threading.Lock()
+# آخرین نسخه Snapshot که تحلیل شده است (برای جلوگیری از تحلیل تکراری یک Snapshot)
+_last_analyzed_version = 0
+# کش درون‌پردازه‌ای کاندیدهای فاز ۱: {'fingerprint': ..., 'candidates': {...}, 'loaded_at': ...}
+# مثل نسخه Redis بعد از ANALYSIS_CANDIDATES_TTL_SECONDS منقضی می‌شود (Fingerprint اصلاح درجای سطرها را نمی‌بیند)
+_candidate_cache: Dict[str, Any] = {}
+
 # ==========================
 # توابع کمکی (Helper Functions)
 # ==========================
@@ -45,25 +72,25 @@ def fetch_potential_symbols_with_phase1_data(db_session) -> Dict[str, Any]:
     """
     واکشی نمادهای منتخب از جداول فاز ۱ (GoldenKey, Watchlist, BuyQueue)
     به همراه داده‌های تکنیکال ذخیره شده.
+    فقط سطرهای داخل پنجره زمانی (PHASE1_LOOKBACK_DAYS) و واچ‌لیست‌های فعال در نظر گرفته می‌شوند.
     """
     # کوئری اصلاح شده برای سازگاری با ستون‌های db_connector.py (مخصوصاً jentry_date)
-    query = text("""
-        WITH LatestTech AS (
-            SELECT *, ROW_NUMBER() OVER(PARTITION BY symbol_id ORDER BY jdate DESC) as rn
-            FROM technical_indicator_data
-        ),
-        LatestCandle AS (
-            SELECT *, ROW_NUMBER() OVER(PARTITION BY symbol_id ORDER BY jdate DESC) as rn
-            FROM candlestick_pattern_detection
-        ),
-        AllCandidates AS (
-            SELECT symbol_id, score AS golden_key_score, jdate, 'GoldenKey' AS source_table FROM golden_key_results WHERE score > 26
+    # 💡 آخرین اندیکاتور/الگوی هر نماد با زیرکوئری همبسته روی ایندکس (symbol_id, jdate) پیدا می‌شود،
+    # نه با ROW_NUMBER روی کل تاریخچه؛ هزینه آن به ازای هر کاندید ثابت است و با رشد جدول زیاد نمی‌شود.
+    # شرط پنجره زمانی هر جدول فقط وقتی اضافه می‌شود که Cutoff داشته باشد (مثل فیلترهای _query_unique_symbols)
+    query_template = """
+        WITH AllCandidates AS (
+            SELECT symbol_id, score AS golden_key_score, jdate, 'GoldenKey' AS source_table FROM golden_key_results
+            WHERE score > 26{golden_window}
             UNION
-            SELECT symbol_id, probability_percent AS golden_key_score, jdate, 'BuyQueue' AS source_table FROM potential_buy_queue_results WHERE probability_percent > 50
+            SELECT symbol_id, probability_percent AS golden_key_score, jdate, 'BuyQueue' AS source_table FROM potential_buy_queue_results
+            WHERE probability_percent > 50{buy_queue_window}
             UNION
             SELECT symbol_id, 100 as golden_key_score, jentry_date AS jdate, 'Watchlist' AS source_table FROM weekly_watchlist_results
+            WHERE status = :watchlist_status{weekly_window}
             UNION
             SELECT symbol_id, 100 as golden_key_score, analysis_date As jdate, 'DynamicSupport' AS source_table FROM dynamic_support_opportunities
+            WHERE 1 = 1{dynamic_window}
         )
         SELECT DISTINCT
             ac.symbol_id,
@@ -75,70 +102,145 @@ def fetch_potential_symbols_with_phase1_data(db_session) -> Dict[str, Any]:
             candle.pattern_name
         FROM AllCandidates ac
         INNER JOIN comprehensive_symbol_data csd ON ac.symbol_id = csd.symbol_id
-        LEFT JOIN LatestTech tech ON ac.symbol_id = tech.symbol_id AND tech.rn = 1
-        LEFT JOIN LatestCandle candle ON ac.symbol_id = candle.symbol_id AND candle.rn = 1
+        LEFT JOIN technical_indicator_data tech ON tech.id = (
+            SELECT t.id FROM technical_indicator_data t
+            WHERE t.symbol_id = ac.symbol_id
+            ORDER BY t.jdate DESC, t.id DESC LIMIT 1
+        )
+        LEFT JOIN candlestick_pattern_detection candle ON candle.id = (
+            SELECT c.id FROM candlestick_pattern_detection c
+            WHERE c.symbol_id = ac.symbol_id
+            ORDER BY c.jdate DESC, c.id DESC LIMIT 1
+        )
         ORDER BY ac.golden_key_score DESC
         LIMIT 100;
-    """)
+    """
+    # ستون تاریخ هر جدول برای شرط پنجره زمانی
+    window_columns = {'golden': 'jdate', 'buy_queue': 'jdate', 'weekly': 'jentry_date', 'dynamic': 'analysis_date'}
     
     try:
-        result = db_session.execute(query)
+        # Cutoff برابر None یعنی بدون محدودیت؛ شرط حذف می‌شود (سطرهای با تاریخ NULL هم کنار گذاشته نمی‌شوند)
+        cutoffs = get_phase1_window_cutoffs(db_session)
+        query = text(query_template.format(**{
+            f"{key}_window": f" AND {column} >= :{key}_cutoff" if cutoffs.get(key) is not None else ""
+            for key, column in window_columns.items()
+        }))
+        params = {f"{key}_cutoff": str(value) for key, value in cutoffs.items() if value is not None}
+        params["watchlist_status"] = WATCHLIST_ACTIVE_STATUS
+
+        started = time.perf_counter()
+        result = db_session.execute(query, params)
         # خروجی: دیکشنری با کلید symbol_id
         symbols_data = {row.symbol_id: dict(row._mapping) for row in result}
+        ANALYSIS_STAGE_SECONDS.labels(stage="candidate_sql").observe(time.perf_counter() - started)
         logger.info(f"✅ Found {len(symbols_data)} potential symbols from DB.")
         return symbols_data
     except Exception as e:
         logger.error(f"❌ SQL Query Failed: {e}")
         return {}
 
-def fetch_live_market_data_from_cache() -> Optional[Dict[str, Dict[str, Any]]]:
+def get_phase1_candidates(db_session) -> Dict[str, Any]:
+    """
+    کاندیدهای فاز ۱ را با کش دو سطحی برمی‌گرداند:
+    1. حافظه همین پردازه  2. Redis (مشترک بین Worker ها)  3. کوئری کامل دیتابیس.
+    کلید کش یک Fingerprint ارزان از جداول منبع است؛ با نوشتن Backend در هر کدام، کش خودکار باطل می‌شود.
+    """
+    global _candidate_cache
+    try:
+        fingerprint = json.dumps(get_candidate_data_fingerprint(db_session), default=str)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not compute candidate fingerprint ({e}). Running the full query.")
+        return fetch_potential_symbols_with_phase1_data(db_session)
+
+    cache_age = time.time() - _candidate_cache.get('loaded_at', 0)
+    if _candidate_cache.get('fingerprint') == fingerprint and cache_age < ANALYSIS_CANDIDATES_TTL_SECONDS:
+        logger.info(f"♻️ Phase-1 candidates unchanged. Using in-process cache ({len(_candidate_cache['candidates'])} symbols).")
+        return _candidate_cache['candidates']
+
+    r = get_redis_client(REDIS_POOL_NAME)
+    candidates = None
+    try:
+        candidates = read_candidates(r, fingerprint)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not read cached candidates from Redis: {e}")
+    if candidates is not None:
+        logger.info(f"♻️ Phase-1 candidates loaded from Redis cache ({len(candidates)} symbols).")
+
+    if candidates is None:
+        candidates = fetch_potential_symbols_with_phase1_data(db_session)
+        # نتیجه خالی (ممکن است ناشی از خطای SQL باشد) کش نمی‌شود
+        if candidates:
+            try:
+                write_candidates(r, fingerprint, candidates)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not write candidates to Redis: {e}")
+
+    if candidates:
+        _candidate_cache = {'fingerprint': fingerprint, 'candidates': candidates, 'loaded_at': time.time()}
+    return candidates
+
+def fetch_live_market_data_from_cache(symbol_names: Optional[Iterable[str]] = None) -> Optional[Dict[str, Dict[str, Any]]]:
     """
     داده‌های لحظه‌ای را از Redis می‌خواند.
     خروجی: دیکشنری که کلید آن 'نام نماد' (فارسی) است.
+    اگر symbol_names داده شود، فقط همان نمادها خوانده می‌شوند (MGET روی کلیدهای تک‌نماد).
     """
     try:
-        r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True, socket_timeout=2)
-        raw_data = r.get(REALTIME_CACHE_KEY)
+        # Pool مشترک با decode_responses=False: Payload ممکن است با کدک باینری (msgpack/struct) نوشته شده باشد
+        r = get_redis_client(REDIS_POOL_NAME)
+        live_data = read_snapshot(r, symbol_names)
         
-        if not raw_data:
+        if not live_data:
             logger.warning("⚠️ Redis cache is empty. Is the Orchestrator running?")
             return None
         
-        data_list = json.loads(raw_data)
-        # تبدیل لیست به دیکشنری با کلید نام نماد (مثلاً 'فولاد')
-        return {item['symbol']: item for item in data_list if item.get('symbol')}
+        return live_data
         
     except Exception as e:
         logger.error(f"❌ Redis Error: {e}")
         return None
 
+def fetch_snapshot_updated_at() -> Optional[float]:
+    """زمان آخرین نوشتن Snapshot در Redis (epoch) برای متریک سن Snapshot."""
+    return read_updated_at(get_redis_client(REDIS_POOL_NAME))
+
+def fetch_snapshot_version() -> int:
+    """نسخه فعلی Snapshot در Redis (صفر در صورت خطا یا خالی بودن)."""
+    try:
+        return read_version(get_redis_client(REDIS_POOL_NAME))
+    except Exception as e:
+        logger.warning(f"⚠️ Could not read snapshot version from Redis: {e}")
+        return 0
+
+def publish_analysis_scores(symbol_scores: Dict[str, float]):
+    """
+    امتیاز نمادها را برای realtime_writer منتشر می‌کند تا نمادهای پرامتیاز در Tier داغ (Hot) واکشی شوند.
+    """
+    try:
+        write_analysis_scores(get_redis_client(REDIS_POOL_NAME), symbol_scores)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not publish analysis scores to Redis: {e}")
+
 # ==========================
 # تابع ذخیره لاگ (اصلاح‌شده برای داشبورد)
 # ==========================
 
-def save_json_log(alerts):
+def save_alert_log(alerts, snapshot_version=None):
     """
-    💡 اصلاح شده: ذخیره لاگ با نام روز جاری، حتی اگر alerts خالی باشد، 
+    نتیجه این اجرا را (حتی اگر alerts خالی باشد) به فایل روزانه logs/alerts_YYYYMMDD.jsonl اضافه می‌کند
     تا Dashboard مطمئن باشد که فرآیند تحلیل امروز اجرا شده است.
+    فقط فیلدهای خلاصه هر هشدار ذخیره می‌شوند و دیتای خام با snapshot_version ارجاع داده می‌شود.
+    همین رکورد برای حالت زنده داشبورد در Redis هم منتشر می‌شود.
     """
-    # ❗ این شرط حذف می‌شود: if not alerts: return 
-    
-    now = datetime.now(TEHRAN_TZ)
-    # 1. نام فایل: phase2_alerts_YYYYMMDD_HHMM.json
-    # اگر در یک دقیقه چندین بار اجرا شود، فایل قبلی بازنویسی می‌شود که مشکلی نیست.
-    filename = os.path.join(LOG_DIR, f"phase2_alerts_{now.strftime('%Y%m%d_%H%M')}.json")
-    
-    # 2. ساختار: { 'timestamp': '...', 'alerts': [...] }
-    log_data = {
-        "timestamp": now.strftime('%Y-%m-%d %H:%M:%S'),
-        "alerts_count": len(alerts),
-        "alerts": alerts 
-    }
-    
+    record = build_run_record(alerts, snapshot_version=snapshot_version, now=datetime.now(TEHRAN_TZ))
     try:
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(log_data, f, ensure_ascii=False, indent=2)
-        logger.info(f"📝 Dashboard Log Saved ({len(alerts)} alerts): {filename}")
+        write_analysis_run(get_redis_client(REDIS_POOL_NAME), encode_run_record(record))
+    except Exception as e:
+        logger.warning(f"⚠️ Could not publish analysis run to Redis: {e}")
+
+    try:
+        path = append_record(record, log_dir=LOG_DIR)
+        logger.info(f"📝 Dashboard Log Saved ({len(alerts)} alerts): {path}")
     except Exception as e:
         logger.error(f"❌ Failed to save log: {e}")
 
@@ -147,7 +249,75 @@ def save_json_log(alerts):
 # منطق اصلی تحلیل (Core Logic)
 # ==========================
 
-def process_market_analysis():
+def build_alerts_message(alerts, now: datetime) -> str:
+    """متن پیام تلگرام برای یک مجموعه هشدار (برای هر مجموعه متمایز مشترکین یکبار ساخته می‌شود)."""
+    message_lines = [f"🚨 **Strong Buy Signals Detected** ({now.strftime('%H:%M')})\n"]
+    
+    for alert in alerts:
+        # ❗ توجه: آدرس‌دهی مستقیم به کلیدهای فلت شده (مثل power_ratio و target)
+        # از آنجایی که analysis_engine.py را مسطح کردیم، این اصلاح ضروری است.
+        row = (
+            f"💎 *{escape_markdown(alert.get('symbol_name', 'N/A'))}*\n"
+            f"📈 Score: `{alert.get('score')}` | Power: `{alert.get('power_ratio')}`\n"
+            f"💰 Price: `{alert.get('last_price')}` | Target: `{alert.get('target')}`\n"
+            f"📜 Reasons: {', '.join(alert.get('reasons', []))}\n"
+            f"------------------"
+        )
+        message_lines.append(row)
+    
+    return "\n".join(message_lines)
+
+def _elapsed_ms(started_at: float) -> float:
+    """زمان سپری‌شده از started_at (perf_counter) بر حسب میلی‌ثانیه."""
+    return round((time.perf_counter() - started_at) * 1000, 1)
+
+def get_last_analyzed_version() -> int:
+    return _last_analyzed_version
+
+def reset_state():
+    """
+    وضعیت درون‌پردازه‌ای تحلیل (آخرین نسخه تحلیل‌شده و کش کاندیدهای فاز ۱) را پاک می‌کند؛
+    برای زمانی که Redis یا دیتابیس زیر برنامه عوض می‌شود (مثلاً بین اجراهای load_test.py).
+    """
+    global _last_analyzed_version, _candidate_cache
+
+    with _analysis_lock:
+        _last_analyzed_version = 0
+        _candidate_cache = {}
+
+def process_market_analysis(force: bool = False):
+    """
+    تحلیل را برای نسخه فعلی Snapshot اجرا می‌کند.
+    اگر این نسخه قبلاً تحلیل شده باشد (مثلاً Trigger رویدادمحور زودتر از زمان‌بند پشتیبان رسیده)،
+    اجرا رد می‌شود؛ با force=True تحلیل در هر صورت انجام می‌شود.
+    """
+    global _last_analyzed_version
+
+    with _analysis_lock:
+        version = fetch_snapshot_version()
+        if not force and version and version <= _last_analyzed_version:
+            logger.info(f"⏭️ Snapshot version {version} already analyzed. Skipping.")
+            return {"status": "skipped", "message": f"Snapshot version {version} already analyzed", "snapshot_version": version}
+
+        result = _run_market_analysis(version)
+        if version and result.get("status") == "success":
+            _last_analyzed_version = max(_last_analyzed_version, version)
+        result["snapshot_version"] = version
+        record_run_metrics(result)
+        return result
+
+def record_run_metrics(result: Dict[str, Any]):
+    """نتیجه یک اجرا را در متریک‌های Prometheus (/metrics) ثبت می‌کند."""
+    ANALYSIS_RUNS.labels(status=result.get("status", "unknown")).inc()
+    observe_stages(result.get("timings_ms", {}))
+    if result.get("status") != "success":
+        return
+    SYMBOLS_SCORED.inc(result.get("symbols_scored", 0))
+    for outcome in ("generated", "sent", "suppressed", "unmatched"):
+        ALERTS.labels(outcome=outcome).inc(result.get(f"alerts_{outcome}", 0))
+    ANALYSIS_LAST_RUN.set_to_current_time()
+
+def _run_market_analysis(snapshot_version: Optional[int] = None):
     """
     منطق اصلی: ترکیب دیتابیس و ردیس، تحلیل و ارسال پیام.
     """
@@ -156,71 +326,132 @@ def process_market_analysis():
     
     db_session = get_db_session()
     alerts_sent = 0
+    alerts_suppressed = 0
+    alerts_unmatched = 0
+    # زمان هر مرحله (میلی‌ثانیه) برای پایش و تست بار
+    timings = {}
     
     try:
         # 1. واکشی دیتا از DB
-        potential_symbols = fetch_potential_symbols_with_phase1_data(db_session)
+        stage_started = time.perf_counter()
+        potential_symbols = get_phase1_candidates(db_session)
+        timings['db_query'] = _elapsed_ms(stage_started)
         if not potential_symbols:
-            return {"status": "skipped", "message": "No symbols in watchlist DB"}
+            return {"status": "skipped", "message": "No symbols in watchlist DB", "timings_ms": timings}
 
-        # 2. واکشی دیتا از Redis
-        live_data = fetch_live_market_data_from_cache()
+        # 2. واکشی دیتا از Redis (فقط نمادهای کاندید)
+        stage_started = time.perf_counter()
+        candidate_names = {p.get('symbol_name') for p in potential_symbols.values() if p.get('symbol_name')}
+        live_data = fetch_live_market_data_from_cache(candidate_names)
+        timings['cache_read'] = _elapsed_ms(stage_started)
         if not live_data:
-            return {"status": "error", "message": "No live data in Redis"}
+            return {"status": "error", "message": "No live data in Redis", "timings_ms": timings}
 
         strong_buy_alerts = []
+        symbol_scores = {}
 
         # 3. حلقه تحلیل
-        for p1_id, p1_data in potential_symbols.items():
-            sym_name = p1_data.get('symbol_name')
-            
-            if sym_name and sym_name in live_data:
-                live_ticker = live_data[sym_name]
-                analysis_result = analyze_symbol_combined(live_ticker, p1_data)
+        stage_started = time.perf_counter()
+        if ANALYSIS_BATCH_SCORING:
+            # نمادهای کاندیدی که داده لحظه‌ای دارند، یکجا امتیازدهی می‌شوند
+            matched = [
+                (p1_data['symbol_name'], p1_data) for p1_data in potential_symbols.values()
+                if p1_data.get('symbol_name') and p1_data['symbol_name'] in live_data
+            ]
+            scores, strong_buy_alerts = analyze_symbols_batch(
+                [live_data[sym_name] for sym_name, _ in matched],
+                [p1_data for _, p1_data in matched],
+            )
+            symbol_scores = {sym_name: score for (sym_name, _), score in zip(matched, scores)}
+        else:
+            for p1_id, p1_data in potential_symbols.items():
+                sym_name = p1_data.get('symbol_name')
                 
-                if analysis_result.get("is_strong_buy"):
-                    strong_buy_alerts.append(analysis_result)
-            else:
-                continue
-
-        # 4. ارسال نتایج به تلگرام
-        if strong_buy_alerts:
-            message_lines = [f"🚨 **Strong Buy Signals Detected** ({now.strftime('%H:%M')})\n"]
-            
-            for alert in strong_buy_alerts:
-                # ❗ توجه: آدرس‌دهی مستقیم به کلیدهای فلت شده (مثل power_ratio و target)
-                # از آنجایی که analysis_engine.py را مسطح کردیم، این اصلاح ضروری است.
-                row = (
-                    f"💎 *{escape_markdown(alert.get('symbol_name', 'N/A'))}*\n"
-                    f"📈 Score: `{alert.get('score')}` | Power: `{alert.get('power_ratio')}`\n"
-                    f"💰 Price: `{alert.get('last_price')}` | Target: `{alert.get('target')}`\n"
-                    f"📜 Reasons: {', '.join(alert.get('reasons', []))}\n"
-                    f"------------------"
-                )
-                message_lines.append(row)
-            
-            full_msg = "\n".join(message_lines)
-            
+                if sym_name and sym_name in live_data:
+                    live_ticker = live_data[sym_name]
+                    analysis_result = analyze_symbol_combined(live_ticker, p1_data)
+                    symbol_scores[sym_name] = analysis_result.get("score", 0.0)
+                    
+                    if analysis_result.get("is_strong_buy"):
+                        strong_buy_alerts.append(analysis_result)
+                else:
+                    continue
+
+        publish_analysis_scores(symbol_scores)
+        timings['analysis'] = _elapsed_ms(stage_started)
+
+        # 4. ارسال نتایج به تلگرام (Cooldown برای هر چت جداگانه؛ هشدارهای تکراری هر چت حذف می‌شوند)
+        stage_started = time.perf_counter()
+        redis_client = get_redis_client(REDIS_POOL_NAME)
+        matched = match_subscribers(notifier.subscribers.get(), strong_buy_alerts)
+        alerts_to_send, _ = filter_alerts(redis_client, matched)
+        # شمارش بر اساس هشدار (نه چت): هشداری که برای هیچ مشترکی منطبق نیست «ارسال‌شده» حساب نمی‌شود
+        matched_symbols = {alert_symbol(a) for alerts in matched.values() for a in alerts}
+        sendable_symbols = {alert_symbol(a) for alerts in alerts_to_send.values() for a in alerts}
+        alerts_suppressed = len(matched_symbols - sendable_symbols)
+        alerts_unmatched = len(strong_buy_alerts) - len(matched_symbols)
+        if alerts_suppressed:
+            logger.info(f"🔕 Suppressed {alerts_suppressed} repeat alerts (cooldown or already queued for every matching chat).")
+        delivery = {}
+        if alerts_to_send:
+            # هشدارها از لحظه ورود به صف «در صف» هستند تا تحلیل Snapshot های بعدی (چند ثانیه بعد) در زمان
+            # کندی تلگرام آن‌ها را دوباره در صف نگذارد؛ نتیجه هر گروه پیام یکجا ثبت می‌شود:
+            # چت‌های موفق وارد Cooldown و وضعیت چت‌های ناموفق پاک می‌شود
+            mark_pending(redis_client, alerts_to_send)
+
+            def _on_delivered(delivered, failed, alerts):
+                settle_alerts(redis_client, alerts, delivered, failed)
+
             try:
-                notifier.send_message(full_msg)
-                logger.info(f"📨 Sent {len(strong_buy_alerts)} alerts to Telegram.")
+                # پیام هر مجموعه متمایز از هشدارها یکبار ساخته و در صف پس‌زمینه notifier برای چت‌های
+                # مربوطه قرار می‌گیرد؛ اینجا منتظر پاسخ تلگرام نمی‌مانیم
+                delivery = notifier.send_to_subscribers(
+                    alerts_to_send,
+                    lambda alerts: build_alerts_message(alerts, now),
+                    on_result=_on_delivered,
+                )
+                alerts_sent = delivery['alerts_queued']
+                if delivery['messages_queued']:
+                    logger.info(
+                        f"📨 Queued {alerts_sent} alerts for {delivery['subscribers']} subscribers "
+                        f"({delivery['renders']} distinct messages)."
+                    )
+                if not delivery['renders']:
+                    # تلگرام پیکربندی نشده؛ هیچ نتیجه‌ای ثبت نخواهد شد
+                    clear_pending(redis_client, alerts_to_send)
             except Exception as e:
                 logger.error(f"❌ Failed to send Telegram message: {e}")
-            
-            alerts_sent = len(strong_buy_alerts)
+                clear_pending(redis_client, alerts_to_send)
+        timings['notify'] = _elapsed_ms(stage_started)
         
-        # 5. ذخیره لاگ جیسون (فراخوانی تابع اصلاح‌شده)
-        save_json_log(strong_buy_alerts)
+        # 5. ذخیره لاگ روزانه (JSONL افزایشی)
+        stage_started = time.perf_counter()
+        save_alert_log(strong_buy_alerts, snapshot_version)
+        timings['log'] = _elapsed_ms(stage_started)
         
         return {
             "status": "success", 
             "symbols_checked": len(potential_symbols),
-            "alerts_generated": alerts_sent
+            "symbols_scored": len(symbol_scores),
+            "alerts_generated": len(strong_buy_alerts),
+            "alerts_sent": alerts_sent,
+            "alerts_suppressed": alerts_suppressed,
+            "alerts_unmatched": alerts_unmatched,
+            "telegram_messages_queued": delivery.get('messages_queued', 0),
+            "timings_ms": timings
         }
 
     finally:
         db_session.close()
 
+# همه مسیرهای اجرا (/run همگام و ناهمگام، Trigger رویدادمحور) از این Runner استفاده می‌کنند تا
+# درخواست‌های همزمان به یک اجرای در حال انجام متصل شوند و نتیجه آن را به اشتراک بگذارند
+analysis_jobs = SingleFlightJobRunner(process_market_analysis)
+
+# سن کش‌ها هنگام هر Scrape اندپوینت /metrics محاسبه می‌شود
+track_age(SNAPSHOT_AGE_SECONDS, fetch_snapshot_updated_at)
+track_age(CANDIDATE_CACHE_AGE_SECONDS, lambda: _candidate_cache.get('loaded_at'))
+
 # ==========================
 # مسیرهای Flask (Routes)
 # ==========================
@@ -233,23 +464,64 @@ def index():
 def manual_run():
     """
     این اندپوینت را می‌توانید هر دقیقه (توسط زمان‌بند خارجی) یا دستی صدا بزنید.
+    با ?force=1 حتی اگر Snapshot فعلی قبلاً تحلیل شده باشد، تحلیل دوباره اجرا می‌شود.
+    اگر تحلیلی در حال اجرا باشد، درخواست به همان اجرا متصل می‌شود (force نادیده گرفته می‌شود).
+    با ?async=1 فوراً شناسه Job برگردانده می‌شود و نتیجه از /run/<job_id> خوانده می‌شود.
     """
-    result = process_market_analysis()
-    return jsonify(result)
+    force = request.args.get('force') == '1'
+
+    if request.args.get('async') == '1':
+        job, coalesced = analysis_jobs.submit(force=force)
+        return jsonify({"job_id": job['id'], "status": job['status'], "coalesced": coalesced}), 202
+
+    try:
+        job, coalesced = analysis_jobs.run(force=force)
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+    return jsonify({**job['result'], "job_id": job['id'], "coalesced": coalesced})
+
+@app.route('/run/<job_id>')
+def run_status(job_id):
+    """وضعیت و نتیجه یک Job (queued / running / done / error)."""
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": f"Unknown or expired job id {job_id}"}), 404
+    return jsonify(job)
 
 @app.route('/health')
 def health_check():
-    # بررسی ساده اتصال به ردیس
+    # بررسی ساده اتصال به ردیس (از طریق Pool مشترک)
     try:
-        r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, socket_timeout=1)
-        r.ping()
+        get_redis_client(REDIS_POOL_NAME).ping()
         redis_status = "UP"
     except:
         redis_status = "DOWN"
         
-    return jsonify({"status": "ok", "redis": redis_status, "time": datetime.now().isoformat()})
+    # آمار Pool (in_use / created / waits) برای تنظیم اندازه Pool زیر بار
+    return jsonify({
+        "status": "ok",
+        "redis": redis_status,
+        "redis_pools": pool_stats(),
+        "analysis_jobs": analysis_jobs.stats(),
+        "telegram": notifier.stats(),
+        "time": datetime.now().isoformat(),
+    })
+
+@app.route('/metrics')
+def metrics():
+    """متریک‌های Prometheus: Histogram مراحل تحلیل، شمارنده‌های نماد/هشدار و سن کش‌ها."""
+    if not METRICS_ENABLED:
+        return Response("metrics are disabled (METRICS_ENABLED=0)\n", status=404, mimetype="text/plain")
+    body, content_type = render_latest()
+    if body is None:
+        return Response("prometheus_client is not installed\n", status=503, mimetype="text/plain")
+    return Response(body, content_type=content_type)
 
 if __name__ == "__main__":
     # اجرا روی پورت 5000
     logger.info("🚀 Flask Server Starting on port 5000...")
+    ensure_phase1_indexes()
+    # اجرای تحلیل به محض انتشار Snapshot جدید (زمان‌بند /run فقط پشتیبان است)
+    if EVENT_TRIGGER_ENABLED:
+        SnapshotUpdateTrigger(lambda version: analysis_jobs.run(), get_last_analyzed_version).start()
     app.run(host='0.0.0.0', port=5000, debug=False)
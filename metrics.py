@@ -0,0 +1,126 @@
+# metrics.py
+# وظیفه: متریک‌های Prometheus برای مراحل Pipeline تحلیل (main.py) و واکشی (realtime_writer / Orchestrator)
+
+import os
+import time
+import logging
+from typing import Callable
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest, start_http_server
+except ImportError:  # وابستگی اختیاری؛ در نبود آن متریک‌ها بدون اثر هستند
+    Counter = Gauge = Histogram = None
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+    generate_latest = start_http_server = None
+
+logger = logging.getLogger(__name__)
+
+# --- تنظیمات ---
+METRICS_NAMESPACE = "morning_assistant"
+# پورت اندپوینت /metrics پردازه realtime_writer (اندپوینت main.py روی همان پورت Flask است)
+WRITER_METRICS_PORT = int(os.getenv("WRITER_METRICS_PORT", 9101))
+# با مقدار 0 هر دو اندپوینت (/metrics در main.py و سرور مستقل realtime_writer) غیرفعال می‌شوند
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# Bucket ها (ثانیه): مراحل کوتاه تحلیل / درخواست تک‌نماد و ارسال تلگرام / Sweep کامل واکشی
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+REQUEST_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 20.0)
+SWEEP_BUCKETS = (0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+
+
+class _NoopMetric:
+    """جایگزین متریک در نبود prometheus_client (همه فراخوانی‌ها بدون اثر)."""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, *args, **kwargs):
+        pass
+
+    def inc(self, *args, **kwargs):
+        pass
+
+    def set(self, *args, **kwargs):
+        pass
+
+    def set_to_current_time(self):
+        pass
+
+    def set_function(self, *args, **kwargs):
+        pass
+
+
+def _metric(kind, name: str, documentation: str, **kwargs):
+    if kind is None:
+        return _NoopMetric()
+    return kind(name, documentation, namespace=METRICS_NAMESPACE, **kwargs)
+
+
+# ---------------------------------------------------------
+# Pipeline تحلیل (main.py)
+# ---------------------------------------------------------
+# stage: candidate_sql, db_query, cache_read, analysis, notify, log (هم‌نام با timings_ms در پاسخ /run)
+ANALYSIS_STAGE_SECONDS = _metric(Histogram, "analysis_stage_seconds", "Duration of each analysis stage", labelnames=("stage",), buckets=STAGE_BUCKETS)
+ANALYSIS_RUNS = _metric(Counter, "analysis_runs_total", "Analysis runs by result status", labelnames=("status",))
+SYMBOLS_SCORED = _metric(Counter, "symbols_scored_total", "Symbols scored by the analysis")
+ALERTS = _metric(Counter, "alerts_total", "Strong-buy alerts by outcome", labelnames=("outcome",))
+ANALYSIS_LAST_RUN = _metric(Gauge, "analysis_last_run_timestamp_seconds", "Unix time of the last finished analysis run")
+SNAPSHOT_AGE_SECONDS = _metric(Gauge, "snapshot_age_seconds", "Seconds since the market snapshot in Redis was last written")
+CANDIDATE_CACHE_AGE_SECONDS = _metric(Gauge, "candidate_cache_age_seconds", "Seconds since the Phase-1 candidate set was loaded")
+
+# ---------------------------------------------------------
+# تلگرام (notifier.py)
+# ---------------------------------------------------------
+TELEGRAM_SEND_SECONDS = _metric(Histogram, "telegram_send_seconds", "Duration of one Bot API sendMessage call", buckets=REQUEST_BUCKETS)
+TELEGRAM_MESSAGES = _metric(Counter, "telegram_messages_total", "Telegram messages by delivery result", labelnames=("result",))
+TELEGRAM_QUEUE_DEPTH = _metric(Gauge, "telegram_queue_depth", "Messages waiting in the Telegram delivery queue")
+
+# ---------------------------------------------------------
+# واکشی (phase1_orchestrator.py در پردازه realtime_writer)
+# ---------------------------------------------------------
+FETCH_SWEEP_SECONDS = _metric(Histogram, "fetch_sweep_seconds", "Duration of one concurrent fetch sweep", buckets=SWEEP_BUCKETS)
+SYMBOL_FETCH_SECONDS = _metric(Histogram, "symbol_fetch_seconds", "Duration of one symbol fetch", buckets=REQUEST_BUCKETS)
+SYMBOLS_FETCHED = _metric(Counter, "symbols_fetched_total", "Symbols fetched successfully")
+SYMBOLS_FAILED = _metric(Counter, "symbols_failed_total", "Symbol fetches that failed or exceeded the sweep budget")
+SYMBOLS_SKIPPED = _metric(Counter, "symbols_skipped_total", "Symbols skipped by the circuit breaker")
+SNAPSHOT_WRITE_SECONDS = _metric(Histogram, "snapshot_write_seconds", "Duration of writing the snapshot to Redis", buckets=STAGE_BUCKETS)
+
+
+def observe_stages(timings_ms: dict):
+    """timings_ms خروجی /run (میلی‌ثانیه) را در Histogram مراحل ثبت می‌کند."""
+    for stage, value in timings_ms.items():
+        ANALYSIS_STAGE_SECONDS.labels(stage=stage).observe(value / 1000)
+
+
+def track_age(gauge, last_updated: Callable[[], float]):
+    """
+    مقدار Gauge هنگام هر Scrape محاسبه می‌شود: ثانیه‌های سپری‌شده از last_updated() (epoch).
+    اگر last_updated مقداری نداشته باشد (یا خطا دهد) NaN گزارش می‌شود.
+    """
+    def _age() -> float:
+        try:
+            updated_at = last_updated()
+        except Exception:
+            return float('nan')
+        return time.time() - updated_at if updated_at else float('nan')
+
+    gauge.set_function(_age)
+
+
+def render_latest():
+    """(بدنه، Content-Type) برای اندپوینت /metrics؛ در نبود prometheus_client بدنه None است."""
+    if generate_latest is None:
+        return None, CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port: int = WRITER_METRICS_PORT) -> bool:
+    """اندپوینت /metrics مستقل (برای پردازه‌هایی که Flask ندارند، مثل realtime_writer)."""
+    if not METRICS_ENABLED:
+        return False
+    if start_http_server is None:
+        logger.warning("⚠️ prometheus_client not installed. Metrics endpoint disabled.")
+        return False
+    start_http_server(port)
+    logger.info(f"📈 Metrics endpoint listening on :{port}/metrics")
+    return True
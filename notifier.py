@@ -2,27 +2,95 @@
 # وظیفه: ارسال پیام‌ها و سیگنال‌ها به تلگرام
 
 import os
+import queue
+import atexit
 import requests
 import time
 import logging
+import threading
+from typing import Callable, Optional, Dict, Any, List
+
+from subscribers import SubscriberRegistry, alert_symbol, group_by_filter_result
+from metrics import TELEGRAM_SEND_SECONDS, TELEGRAM_MESSAGES, TELEGRAM_QUEUE_DEPTH
 
 logger = logging.getLogger(__name__)
 
 # خواندن متغیرهای محیطی
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
+# آدرس پایه Bot API (برای تست بار می‌توان آن را به یک سرور محلی اشاره داد)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+# ارسال در Thread پس‌زمینه (با 0 ارسال مثل قبل همگام و داخل درخواست /run انجام می‌شود)
+TELEGRAM_ASYNC_DELIVERY = os.getenv("TELEGRAM_ASYNC_DELIVERY", "1") == "1"
+# ظرفیت صف ارسال؛ در صورت پر بودن صف، پیام جدید دور ریخته می‌شود (تحلیل منتظر تلگرام نمی‌ماند)
+TELEGRAM_QUEUE_SIZE = int(os.getenv("TELEGRAM_QUEUE_SIZE", 100))
+# حداقل فاصله دو پیام به یک چت (محدودیت تلگرام حدود یک پیام در ثانیه برای هر چت است)
+TELEGRAM_MIN_INTERVAL_SECONDS = float(os.getenv("TELEGRAM_MIN_INTERVAL_SECONDS", 1.0))
+# سقف کل پیام‌ها در ثانیه برای همه چت‌ها (محدودیت سراسری تلگرام حدود ۳۰ پیام در ثانیه است)
+TELEGRAM_GLOBAL_RATE_PER_SECOND = float(os.getenv("TELEGRAM_GLOBAL_RATE_PER_SECOND", 25))
+# تعداد Worker های ارسال؛ پیام‌های چت‌های مختلف همزمان ارسال می‌شوند
+TELEGRAM_DELIVERY_WORKERS = int(os.getenv("TELEGRAM_DELIVERY_WORKERS", 4))
+# سقف انتظار برای retry_after اعلام‌شده توسط تلگرام (پاسخ 429)
+TELEGRAM_MAX_RETRY_AFTER_SECONDS = 60
+# زمان انتظار برای خالی شدن صف هنگام خروج برنامه
+TELEGRAM_SHUTDOWN_FLUSH_SECONDS = 5
+
+class _GroupDelivery:
+    """
+    نتیجه ارسال یک پیام مشترک به چند چت را جمع می‌کند و on_result(delivered, failed, alerts)
+    را یکبار، بعد از مشخص شدن نتیجه همه چت‌های گروه، صدا می‌زند.
+    """
+
+    def __init__(self, alerts: List[dict], chat_ids: List[str], on_result: Callable[[List[str], List[str], List[dict]], None]):
+        self.alerts = alerts
+        self.on_result = on_result
+        self._lock = threading.Lock()
+        self._remaining = len(chat_ids)
+        self._delivered: List[str] = []
+        self._failed: List[str] = []
+
+    def done(self, chat_id: str, success: bool):
+        with self._lock:
+            (self._delivered if success else self._failed).append(chat_id)
+            self._remaining -= 1
+            finished = self._remaining == 0
+        if finished:
+            self.on_result(self._delivered, self._failed, self.alerts)
+
 
 class TelegramNotifier:
     """
     کلاسی برای ارسال سیگنال‌ها و پیام‌های متنی به تلگرام با استفاده از MarkdownV2.
+    در حالت ناهمگام (پیش‌فرض) send_message / send_alert پیام را در صف می‌گذارند و فوراً برمی‌گردند؛
+    چند Worker پس‌زمینه با یک Session مشترک HTTP پیام‌ها را با رعایت محدودیت نرخ هر چت و محدودیت سراسری ارسال می‌کنند.
+    send_to_subscribers هشدارها را بین همه مشترکین (subscribers.py) پخش می‌کند.
     """
-    def __init__(self, bot_token=None, chat_id=None, max_retries=3):
+    def __init__(self, bot_token=None, chat_id=None, max_retries=3, api_url=None, async_delivery=None, subscribers=None):
         self.bot_token = bot_token or TELEGRAM_BOT_TOKEN
         self.chat_id = chat_id or TELEGRAM_CHAT_ID
         if not self.bot_token or not self.chat_id:
             logger.warning("Telegram token/chat_id not set. Notifier will be inactive.")
-        self.base_url = f"https://api.telegram.org/bot{self.bot_token}"
+        self.base_url = f"{(api_url or TELEGRAM_API_URL).rstrip('/')}/bot{self.bot_token}"
         self.max_retries = max_retries
+        self.async_delivery = TELEGRAM_ASYNC_DELIVERY if async_delivery is None else async_delivery
+        self.subscribers = subscribers or SubscriberRegistry(default_chat_id=self.chat_id)
+
+        # یک Session برای همه ارسال‌ها (استفاده مجدد از اتصال TLS)
+        self._session = requests.Session()
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=TELEGRAM_QUEUE_SIZE)
+        TELEGRAM_QUEUE_DEPTH.set_function(self._queue.qsize)
+        self._workers: List[threading.Thread] = []
+        self._worker_lock = threading.Lock()
+        # زمان رزرو‌شده بعدی برای هر چت و برای کل ربات (محدودیت نرخ بین Worker ها مشترک است)
+        self._slot_lock = threading.Lock()
+        self._next_chat_slot: Dict[str, float] = {}
+        self._next_global_slot = 0.0
+
+        self._stats_lock = threading.Lock()
+        self._stats = {'enqueued': 0, 'delivered': 0, 'failed': 0, 'dropped': 0, 'rate_limited': 0, 'fanout_renders': 0}
+        self._latency_total_ms = 0.0
+        self._latency_last_ms = 0.0
+        self._latency_max_ms = 0.0
 
     def _md_escape(self, s: str) -> str:
         """فرار دادن کاراکترهای خاص مورد نیاز MarkdownV2 به جز پارامترهای مجاز."""
@@ -34,22 +102,159 @@ class TelegramNotifier:
             s = s.replace(ch, f"\\{ch}")
         return s
 
-    def _send_request(self, text: str, parse_mode: str = "MarkdownV2") -> bool:
+    # ---------------------------------------------------------
+    # صف ارسال و Worker پس‌زمینه
+    # ---------------------------------------------------------
+    def _enqueue(self, text: str, parse_mode: str, chat_id=None, on_result: Optional[Callable[[bool], None]] = None) -> bool:
+        """
+        پیام را برای ارسال ثبت می‌کند. در حالت ناهمگام خروجی یعنی «در صف قرار گرفت»
+        و نتیجه واقعی ارسال (در صورت نیاز) به on_result داده می‌شود.
+        """
+        item = {
+            'chat_id': chat_id or self.chat_id,
+            'text': text,
+            'parse_mode': parse_mode,
+            'enqueued_at': time.monotonic(),
+            'on_result': on_result,
+        }
+        if not self.async_delivery:
+            return self._deliver(item)
+
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._stats_lock:
+                self._stats['dropped'] += 1
+            TELEGRAM_MESSAGES.labels(result="dropped").inc()
+            logger.error(f"❌ Telegram queue full ({TELEGRAM_QUEUE_SIZE}). Message dropped.")
+            return False
+        with self._stats_lock:
+            self._stats['enqueued'] += 1
+        return True
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if not self._workers:
+                atexit.register(self.flush, TELEGRAM_SHUTDOWN_FLUSH_SECONDS)
+            self._workers = [worker for worker in self._workers if worker.is_alive()]
+            while len(self._workers) < TELEGRAM_DELIVERY_WORKERS:
+                worker = threading.Thread(
+                    target=self._worker_loop, name=f"telegram-delivery-{len(self._workers)}", daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+
+    def _worker_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                self._deliver(item)
+            except Exception as e:
+                logger.error(f"❌ Telegram delivery worker error: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """تا خالی شدن صف (حداکثر timeout ثانیه) صبر می‌کند؛ خروجی: آیا همه پیام‌ها پردازش شدند."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _deliver(self, item: Dict[str, Any]) -> bool:
+        success = self._send_request(item['text'], parse_mode=item['parse_mode'], chat_id=item['chat_id'])
+        latency_ms = (time.monotonic() - item['enqueued_at']) * 1000
+        TELEGRAM_MESSAGES.labels(result="delivered" if success else "failed").inc()
+        with self._stats_lock:
+            self._stats['delivered' if success else 'failed'] += 1
+            if success:
+                self._latency_last_ms = latency_ms
+                self._latency_total_ms += latency_ms
+                self._latency_max_ms = max(self._latency_max_ms, latency_ms)
+        if item['on_result'] is not None:
+            try:
+                item['on_result'](success)
+            except Exception as e:
+                logger.error(f"❌ Telegram delivery callback failed: {e}")
+        return success
+
+    def stats(self) -> Dict[str, Any]:
+        """عمق صف، شمارنده‌های ارسال و تأخیر تحویل (از ورود به صف تا پاسخ تلگرام)."""
+        with self._stats_lock:
+            delivered = self._stats['delivered']
+            return {
+                **self._stats,
+                'queue_depth': self._queue.qsize(),
+                'async_delivery': self.async_delivery,
+                'delivery_latency_ms': {
+                    'last': round(self._latency_last_ms, 1),
+                    'avg': round(self._latency_total_ms / delivered, 1) if delivered else 0.0,
+                    'max': round(self._latency_max_ms, 1),
+                },
+            }
+
+    def _wait_for_slot(self, chat_id):
+        """
+        اولین زمان مجاز ارسال را (هم برای این چت و هم سراسری) رزرو می‌کند و تا آن زمان صبر می‌کند.
+        رزرو زیر قفل انجام می‌شود تا Worker های همزمان از محدودیت‌ها عبور نکنند.
+        """
+        with self._slot_lock:
+            now = time.monotonic()
+            send_at = max(now, self._next_chat_slot.get(chat_id, 0.0), self._next_global_slot)
+            self._next_chat_slot[chat_id] = send_at + TELEGRAM_MIN_INTERVAL_SECONDS
+            if TELEGRAM_GLOBAL_RATE_PER_SECOND > 0:
+                self._next_global_slot = send_at + 1.0 / TELEGRAM_GLOBAL_RATE_PER_SECOND
+        if send_at > now:
+            time.sleep(send_at - now)
+
+    def _back_off(self, chat_id, delay: float):
+        """
+        بعد از پاسخ 429 زمان مجاز بعدی این چت و کل ربات را جلو می‌برد؛
+        به این ترتیب همه Worker ها (نه فقط Worker ای که 429 گرفته) retry_after را رعایت می‌کنند.
+        """
+        with self._slot_lock:
+            resume_at = time.monotonic() + delay
+            self._next_chat_slot[chat_id] = max(self._next_chat_slot.get(chat_id, 0.0), resume_at)
+            self._next_global_slot = max(self._next_global_slot, resume_at)
+
+    def _send_request(self, text: str, parse_mode: str = "MarkdownV2", chat_id=None) -> bool:
         """منطق ارسال پیام با تلاش مجدد (Retry Mechanism)"""
-        if not self.bot_token or not self.chat_id:
+        chat_id = chat_id or self.chat_id
+        if not self.bot_token or not chat_id:
             return False
 
         url = f"{self.base_url}/sendMessage"
         payload = {
-            "chat_id": self.chat_id,
+            "chat_id": chat_id,
             "text": text,
             "parse_mode": parse_mode,
             "disable_web_page_preview": True
         }
 
         for attempt in range(1, self.max_retries + 1):
+            self._wait_for_slot(chat_id)
             try:
-                r = requests.post(url, json=payload, timeout=10)
+                started = time.perf_counter()
+                try:
+                    r = self._session.post(url, json=payload, timeout=10)
+                finally:
+                    TELEGRAM_SEND_SECONDS.observe(time.perf_counter() - started)
+                if r.status_code == 429:
+                    # تلگرام مدت انتظار را در parameters.retry_after اعلام می‌کند
+                    retry_after = self._retry_after(r) or 2 * attempt
+                    with self._stats_lock:
+                        self._stats['rate_limited'] += 1
+                    logger.warning(f"⚠️ تلگرام محدودیت نرخ اعمال کرد؛ {retry_after} ثانیه صبر می‌کنیم.")
+                    # انتظار در _wait_for_slot تلاش بعدی انجام می‌شود
+                    self._back_off(chat_id, min(retry_after, TELEGRAM_MAX_RETRY_AFTER_SECONDS))
+                    continue
+                if 400 <= r.status_code < 500:
+                    # خطای درخواست (مثلاً Markdown نامعتبر) با تلاش مجدد برطرف نمی‌شود
+                    logger.error(f"❌ تلگرام پیام را رد کرد ({r.status_code}): {r.text[:200]}")
+                    return False
                 r.raise_for_status()
                 # 200 (OK)
                 return True
@@ -60,19 +265,64 @@ class TelegramNotifier:
         logger.error("❌ ارسال پیام پس از چند تلاش ناموفق ماند.")
         return False
 
-    def send_message(self, text: str) -> bool:
+    @staticmethod
+    def _retry_after(response) -> Optional[float]:
+        try:
+            return float(response.json().get('parameters', {}).get('retry_after'))
+        except (ValueError, TypeError, AttributeError):
+            return None
+
+    def send_message(self, text: str, on_result: Optional[Callable[[bool], None]] = None) -> bool:
         """
         💡 اضافه شده: تابعی برای ارسال پیام‌های خام (مانند summary یا لیست سیگنال‌ها).
         این تابع در main.py برای ارسال پیام‌های فرمت‌شده استفاده می‌شود.
+        on_result (اختیاری) بعد از پایان ارسال با نتیجه (True/False) صدا زده می‌شود.
         """
-        if not text:
+        if not text or not self.bot_token or not self.chat_id:
             return False
         
         # پیام خام از main.py می‌آید و فرض می‌شود Escape شده است.
-        return self._send_request(text=text, parse_mode="MarkdownV2")
+        return self._enqueue(text, parse_mode="MarkdownV2", on_result=on_result)
+
+
+    def send_to_subscribers(
+        self,
+        alerts_by_chat: Dict[str, List[dict]],
+        render: Callable[[List[dict]], str],
+        on_result: Optional[Callable[[List[str], List[str], List[dict]], None]] = None,
+    ) -> Dict[str, int]:
+        """
+        هشدارهای هر چت ({chat_id: [هشدارها]}، معمولاً خروجی subscribers.match_subscribers) را ارسال می‌کند.
+        چت‌هایی که مجموعه یکسانی از هشدارها دارند یک پیام مشترک دریافت می‌کنند
+        (render برای هر مجموعه متمایز فقط یکبار صدا زده می‌شود).
+        on_result(delivered_chat_ids, failed_chat_ids, alerts_in_message) برای هر گروه یکبار و بعد از
+        مشخص شدن نتیجه همه چت‌های آن صدا زده می‌شود (پیام دورریخته‌شده به دلیل پر بودن صف، ناموفق است).
+        """
+        summary = {'subscribers': 0, 'renders': 0, 'messages_queued': 0, 'alerts_queued': 0}
+        if not alerts_by_chat or not self.bot_token:
+            return summary
+
+        queued_alerts = set()
+        for alerts, chat_ids in group_by_filter_result(alerts_by_chat):
+            text = render(alerts)
+            summary['renders'] += 1
+            group = _GroupDelivery(alerts, chat_ids, on_result) if on_result else None
+            for chat_id in chat_ids:
+                summary['subscribers'] += 1
+                callback = (lambda success, chat_id=chat_id, group=group: group.done(chat_id, success)) if group else None
+                if self._enqueue(text, parse_mode="MarkdownV2", chat_id=chat_id, on_result=callback):
+                    summary['messages_queued'] += 1
+                    queued_alerts.update(alert_symbol(alert) for alert in alerts)
+                elif group is not None and self.async_delivery:
+                    # در حالت همگام نتیجه از داخل _deliver ثبت شده است
+                    group.done(chat_id, False)
+        summary['alerts_queued'] = len(queued_alerts)
 
+        with self._stats_lock:
+            self._stats['fanout_renders'] += summary['renders']
+        return summary
 
-    def send_alert(self, alert: dict) -> bool:
+    def send_alert(self, alert: dict, on_result: Optional[Callable[[bool], None]] = None) -> bool:
         """
         پیام هشدار خرید را به تلگرام ارسال می‌کند.
         فیلدهای دیکشنری alert باید مسطح (Flat) باشند (سازگار با analysis_engine.py جدید).
@@ -104,8 +354,8 @@ class TelegramNotifier:
         # متن پیام را برای تلگرام Escaping می‌کنیم
         payload_text = self._md_escape(text)
 
-        # ارسال پیام
-        success = self._send_request(text=payload_text, parse_mode="MarkdownV2")
+        # ثبت پیام در صف ارسال
+        success = self._enqueue(payload_text, parse_mode="MarkdownV2", on_result=on_result)
         if success:
-            logger.info(f"✅ پیام تکی برای {alert.get('symbol_name') or alert.get('symbol_id')} ارسال شد.")
+            logger.info(f"✅ پیام تکی برای {alert.get('symbol_name') or alert.get('symbol_id')} در صف ارسال قرار گرفت.")
         return success
\ No newline at end of file
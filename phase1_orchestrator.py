@@ -1,23 +1,46 @@
 # phase1_orchestrator.py
 # Phase 1 - TSETMC WebAPI Layer & Real-time Caching (Orchestrator)
 
-import pytse_client as tse
 from typing import Dict, Any, List, Optional
 import logging
 import redis
-import json
 import os
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from dotenv import load_dotenv
 
 # --- Import DB Components ---
 # فرض بر این است که db_connector در کنار همین فایل قرار دارد
 from db_connector import (
     get_db_session, 
+    get_phase1_fingerprint,
+    get_phase1_window_cutoffs,
+    ensure_phase1_indexes,
+    WATCHLIST_ACTIVE_STATUS,
     WeeklyWatchlistResult, 
     GoldenKeyResult, 
     PotentialBuyQueueResult, 
     DynamicSupportOpportunity
 )
+from data_sources import LiveDataSource, SymbolUnavailableError, create_data_source
+from metrics import (
+    FETCH_SWEEP_SECONDS, SYMBOL_FETCH_SECONDS, SYMBOLS_FETCHED, SYMBOLS_FAILED, SYMBOLS_SKIPPED,
+    SNAPSHOT_WRITE_SECONDS,
+)
+from realtime_cache import (
+    write_snapshot,
+    write_delta,
+    compute_delta,
+    append_history,
+    REALTIME_HISTORY_ENABLED,
+    REALTIME_DELTA_PUBLISH,
+    REALTIME_WRITE_PER_SYMBOL,
+    REALTIME_CYCLE_STATS_KEY,
+)
+from symbol_circuit_breaker import SymbolCircuitBreaker
+from redis_pool import get_redis_client, pool_stats
 
 logger = logging.getLogger(__name__)
 
@@ -25,26 +48,64 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
-REALTIME_CACHE_KEY = "market:realtime:tickers" 
+REDIS_POOL_NAME = "orchestrator"
+
+# --- تنظیمات واکشی همزمان ---
+# تعداد Thread های همزمان برای واکشی TSETMC (مقدار 1 یعنی همان حالت ترتیبی قدیمی)
+FETCH_MAX_WORKERS = int(os.getenv("FETCH_MAX_WORKERS", 16))
+# حداکثر زمان مجاز برای هر درخواست (ثانیه)؛ بودجه کل Sweep از روی همین عدد محاسبه می‌شود
+FETCH_REQUEST_TIMEOUT_SECONDS = float(os.getenv("FETCH_REQUEST_TIMEOUT_SECONDS", 8))
+# حداکثر عمر رکورد یک نماد در Snapshot وقتی در سیکل‌های اخیر واکشی نشده باشد (مثلاً Tier سرد)
+SNAPSHOT_MAX_AGE_SECONDS = float(os.getenv("SNAPSHOT_MAX_AGE_SECONDS", 120))
 
 class Phase1Orchestrator:
     """
     این کلاس به عنوان Orchestrator عمل می‌کند و وظایف زیر را انجام می‌دهد:
     1. دریافت لیست نمادها از دیتابیس Backend (چهار جدول اصلی).
-    2. دریافت داده‌های کاملاً لحظه‌ای از TSETMC (شامل حقیقی/حقوقی لحظه‌ای).
+    2. دریافت داده‌های کاملاً لحظه‌ای از منبع داده (TSETMC زنده یا بازپخش جلسه ضبط‌شده).
     3. ذخیره داده‌های یکپارچه‌شده در Redis برای مصرف فازهای بعدی.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        request_timeout: Optional[float] = None,
+        data_source: Optional[LiveDataSource] = None,
+    ):
+        # 0. تنظیمات واکشی همزمان
+        self.max_workers = max(1, max_workers or FETCH_MAX_WORKERS)
+        self.request_timeout = request_timeout or FETCH_REQUEST_TIMEOUT_SECONDS
+        # Pool یکبار ساخته می‌شود و Thread ها بین سیکل‌ها بازاستفاده می‌شوند
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tse-fetch")
+        # منبع داده لحظه‌ای (TSETMC زنده، ضبط یا بازپخش جلسه) بر اساس DATA_SOURCE / RECORD_SESSION
+        self.data_source = data_source or create_data_source()
+        # کش لیست نمادها (Universe) به همراه Fingerprint جداول فاز ۱
+        self._universe_cache: Optional[List[str]] = None
+        self._universe_fingerprint: Optional[tuple] = None
+        self._universe_sources: Dict[str, set] = {}
+        # آخرین مقدار نوشته‌شده هر نماد در Redis (برای محاسبه Delta) و زمان آخرین واکشی موفق آن
+        self._last_written: Dict[str, Dict[str, Any]] = {}
+        self._fetched_at: Dict[str, float] = {}
+        # ایندکس‌های لازم برای فیلتر پنجره زمانی (در صورت نبود) ساخته می‌شوند
+        ensure_phase1_indexes()
+
         # 1. اتصال به Redis
         try:
-            self.redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True, socket_timeout=5)
+            # Pool ماندگار مخصوص Orchestrator (decode_responses=False: مقادیر ممکن است با کدک باینری نوشته شوند)
+            self.redis_client = get_redis_client(REDIS_POOL_NAME, socket_timeout=5)
             self.redis_client.ping()
             logger.info(f"📡 Redis connection successful: {REDIS_HOST}:{REDIS_PORT}")
         except redis.exceptions.ConnectionError as e:
             logger.error(f"❌ Could not connect to Redis: {e}. Caching feature will be disabled.")
             self.redis_client = None
 
+        # 2. Circuit Breaker نمادهای متوقف/قدیمی (وضعیت در Redis نگه داشته می‌شود)
+        self.circuit_breaker = SymbolCircuitBreaker(self.redis_client)
+        # آمار آخرین سیکل واکشی (requested / skipped / fetched / failed)
+        self.last_cycle_stats: Dict[str, Any] = {}
+        # زمان آخرین نوشتن موفق Snapshot (epoch) برای متریک سن Snapshot
+        self.last_snapshot_written_at: Optional[float] = None
+
     # ---------------------------------------------------------
     # 0) واکشی لیست نمادها از دیتابیس (Database Fetcher)
     # ---------------------------------------------------------
@@ -52,44 +113,28 @@ class Phase1Orchestrator:
         """
         این متد نام نمادها (مثلاً 'شپلی'، 'فولاد') را از دیتابیس می‌گیرد.
         چون pytse-client با نام نماد کار می‌کند، نه با کد عددی (TSETMC ID).
+
+        💡 جداول فاز ۱ روزی یکبار توسط Backend نوشته می‌شوند؛ بنابراین لیست نمادها در حافظه کش شده
+        و هر سیکل فقط با یک کوئری ارزان (Fingerprint) اعتبارسنجی می‌شود.
+        کوئری کامل فقط وقتی اجرا می‌شود که Fingerprint تغییر کرده باشد.
         """
+        # منبع داده بازپخش، لیست نمادهای ضبط‌شده را خودش تعیین می‌کند
+        source_universe = self.data_source.universe()
+        if source_universe is not None:
+            return list(source_universe)
+
         session = get_db_session()
-        unique_names = set() # استفاده از Set برای حذف تکراری‌ها
         
         try:
-            logger.info("🗄️ Querying database for watchlist symbol NAMES...")
-            
+            fingerprint = get_phase1_fingerprint(session)
+            if self._universe_cache is not None and fingerprint == self._universe_fingerprint:
+                logger.debug(f"♻️ Watchlist unchanged. Using cached universe ({len(self._universe_cache)} symbols).")
+                return list(self._universe_cache)
 
-            weekly = session.query(WeeklyWatchlistResult.symbol_name).all()
-            for r in weekly: 
-                if r.symbol_name: unique_names.add(r.symbol_name)
-            
-
-            # اعمال فیلتر: GoldenKeyResult.score > 24
-            golden = (
-                session.query(GoldenKeyResult.symbol_name)
-                .filter(GoldenKeyResult.score > 26)
-                .all()
-            )
+            unique_names = self._query_unique_symbols(session)
 
-            for r in golden: 
-                # توجه: اگر symbol_name تنها فیلد در کوئری باشد، r یک تاپل یا یک شیء تک‌عضوی است.
-                # برای دسترسی به مقدار آن، بهتر است از r[0] یا r.symbol_name استفاده کنید.
-                # r.symbol_name در حالت .all() درست است اگر یک شیء result برگردانده شود.
-                if r.symbol_name:
-                    unique_names.add(r.symbol_name)
-            
-            # 3. Potential Buy Queue
-            buy_queue = session.query(PotentialBuyQueueResult.symbol_name).all()
-            for r in buy_queue: 
-                if r.symbol_name: unique_names.add(r.symbol_name)
-            
-            # 4. Dynamic Support
-            dynamic = session.query(DynamicSupportOpportunity.symbol_name).all()
-            for r in dynamic: 
-                if r.symbol_name: unique_names.add(r.symbol_name)
-            
-            logger.info(f"✅ Found {len(unique_names)} unique symbol names (e.g., 'شپلی') to monitor.")
+            self._universe_cache = unique_names
+            self._universe_fingerprint = fingerprint
             return list(unique_names)
             
         except AttributeError as e:
@@ -97,113 +142,201 @@ class Phase1Orchestrator:
             return []
         except Exception as e:
             logger.error(f"❌ Database Query Error: {e}")
+            # در صورت خطای موقت (مثلاً database is locked) آخرین لیست معتبر استفاده می‌شود
+            if self._universe_cache is not None:
+                logger.warning("⚠️ Falling back to the last known watchlist universe.")
+                return list(self._universe_cache)
             return []
         finally:
             session.close()
 
-    # ---------------------------------------------------------
-    # تابع کمکی جدید: دریافت مطمئن داده‌های حقیقی/حقوقی
-    # ---------------------------------------------------------
-    def _safe_get_trade_summary(self, rt_data, summary_type: str) -> Dict[str, Any]:
+    def _query_unique_symbols(self, session) -> List[str]:
         """
-        💡 اصلاح شده: اطمینان حاصل می‌کند که مقادیر همیشه float یا int هستند تا خطای NoneType در عملیات ریاضی رخ ندهد.
+        کوئری کامل چهار جدول فاز ۱ (فقط در صورت تغییر Fingerprint اجرا می‌شود).
+        فقط سطرهای داخل پنجره زمانی (PHASE1_LOOKBACK_DAYS) و واچ‌لیست‌های فعال در نظر گرفته می‌شوند.
         """
-        attr_name = f'{summary_type}_trade_summary'
-        summary = getattr(rt_data, attr_name, None)
-    
-        # مقادیر پیش‌فرض را به صورت Dictionary آماده می‌کنیم
-        default_values = {
-            f'{summary_type}_buy_vol': 0.0,
-            f'{summary_type}_buy_count': 0,
-            f'{summary_type}_sell_vol': 0.0,
-            f'{summary_type}_sell_count': 0,
-        }
-    
-        # بررسی می‌کنیم که summary وجود داشته باشد و attributeهای لازم را داشته باشد.
-        if summary and hasattr(summary, 'buy_vol') and hasattr(summary, 'sell_vol'):
-            # ❗ تبدیل صریح به float و int برای اطمینان از نوع داده
-            # از float() و int() استفاده می‌کنیم تا هر مقدار غیر عددی (مثل None) که با or 0.0 به صفر تبدیل شده، 
-            # به نوع درستی تبدیل شود.
-            buy_vol = float(summary.buy_vol or 0.0)
-            buy_count = int(summary.buy_count or 0)
-            sell_vol = float(summary.sell_vol or 0.0)
-            sell_count = int(summary.sell_count or 0)
+        unique_names = set() # استفاده از Set برای حذف تکراری‌ها
+        sources: Dict[str, set] = {}
+
+        logger.info("🗄️ Querying database for watchlist symbol NAMES...")
+        cutoffs = get_phase1_window_cutoffs(session)
+
+        # 1. Weekly Watchlist (فقط وضعیت فعال)
+        weekly_query = (
+            session.query(WeeklyWatchlistResult.symbol_name)
+            .filter(WeeklyWatchlistResult.status == WATCHLIST_ACTIVE_STATUS)
+        )
+        if cutoffs['weekly'] is not None:
+            weekly_query = weekly_query.filter(WeeklyWatchlistResult.jentry_date >= cutoffs['weekly'])
+        weekly = weekly_query.all()
+        for r in weekly: 
+            if r.symbol_name:
+                unique_names.add(r.symbol_name)
+                sources.setdefault(r.symbol_name, set()).add('Watchlist')
         
-            return {
-                f'{summary_type}_buy_vol': buy_vol, 
-                f'{summary_type}_buy_count': buy_count,
-                f'{summary_type}_sell_vol': sell_vol,
-                f'{summary_type}_sell_count': sell_count,
-            }
-        else:
-            # در صورت عدم وجود آبجکت summary، مقادیر پیش‌فرض را برمی‌گرداند.
-            return default_values
+
+        # اعمال فیلتر: GoldenKeyResult.score > 24
+        golden_query = (
+            session.query(GoldenKeyResult.symbol_name)
+            .filter(GoldenKeyResult.score > 26)
+        )
+        if cutoffs['golden'] is not None:
+            golden_query = golden_query.filter(GoldenKeyResult.jdate >= cutoffs['golden'])
+        golden = golden_query.all()
+
+        for r in golden: 
+            # توجه: اگر symbol_name تنها فیلد در کوئری باشد، r یک تاپل یا یک شیء تک‌عضوی است.
+            # برای دسترسی به مقدار آن، بهتر است از r[0] یا r.symbol_name استفاده کنید.
+            # r.symbol_name در حالت .all() درست است اگر یک شیء result برگردانده شود.
+            if r.symbol_name:
+                unique_names.add(r.symbol_name)
+                sources.setdefault(r.symbol_name, set()).add('GoldenKey')
+        
+        # 3. Potential Buy Queue
+        buy_queue_query = session.query(PotentialBuyQueueResult.symbol_name)
+        if cutoffs['buy_queue'] is not None:
+            buy_queue_query = buy_queue_query.filter(PotentialBuyQueueResult.jdate >= cutoffs['buy_queue'])
+        buy_queue = buy_queue_query.all()
+        for r in buy_queue: 
+            if r.symbol_name:
+                unique_names.add(r.symbol_name)
+                sources.setdefault(r.symbol_name, set()).add('BuyQueue')
+        
+        # 4. Dynamic Support
+        dynamic_query = session.query(DynamicSupportOpportunity.symbol_name)
+        if cutoffs['dynamic'] is not None:
+            dynamic_query = dynamic_query.filter(DynamicSupportOpportunity.analysis_date >= cutoffs['dynamic'])
+        dynamic = dynamic_query.all()
+        for r in dynamic: 
+            if r.symbol_name:
+                unique_names.add(r.symbol_name)
+                sources.setdefault(r.symbol_name, set()).add('DynamicSupport')
+        
+        # جدول(های) منبع هر نماد برای اولویت‌بندی در زمان‌بند تطبیقی نگه داشته می‌شود
+        self._universe_sources = sources
+
+        logger.info(f"✅ Found {len(unique_names)} unique symbol names (e.g., 'شپلی') to monitor.")
+        return list(unique_names)
+
+    def get_symbol_sources(self) -> Dict[str, set]:
+        """جداول فاز ۱ که هر نماد از آن‌ها آمده است (مثلاً {'فولاد': {'GoldenKey', 'BuyQueue'}})."""
+        return dict(self._universe_sources)
 
     # ---------------------------------------------------------
-    # 1) یکپارچه‌سازی داده‌های لحظه‌ای (Live Data Mapper)
+    # 2) واکشی همزمان نمادها (Concurrent Fetch Engine)
     # ---------------------------------------------------------
-    def _map_live_data(self, ticker: tse.Ticker) -> Optional[Dict[str, Any]]:
+    def _fetch_single_symbol(self, symbol: str) -> Optional[Dict[str, Any]]:
         """
-        داده‌های لحظه‌ای را با استفاده از متد get_ticker_real_time_info_response استخراج می‌کند 
-        و مقادیر Null را ایمن‌سازی می‌کند.
+        واکشی و نگاشت داده لحظه‌ای یک نماد. این متد داخل Thread Pool اجرا می‌شود
+        و هیچ استثنایی را به بیرون پرتاب نمی‌کند.
         """
+        started = time.perf_counter()
         try:
-            # طبق مستندات: دریافت آبجکت لحظه‌ای
-            rt_data = ticker.get_ticker_real_time_info_response()
-            
-            # بررسی وضعیت مجاز/ممنوع (State)
-            # معمولاً state یه استرینگ است. اگر نیاز به فیلتر وضعیت دارید اینجا اضافه کنید.
-            
-            result = {
-                'symbol': ticker.symbol,  # نام نماد (مثل فولاد)
-                'symbol_name': ticker.title, # نام کامل شرکت
-                
-                # --- قیمت‌ها و حجم‌های اصلی: با استفاده از 'or 0.0' ایمن‌سازی می‌شوند ---
-                'last_price': rt_data.last_price or 0.0,      # قیمت آخرین معامله
-                'adj_close': rt_data.adj_close or 0.0,        # قیمت پایانی
-                'open_price': rt_data.open_price or 0.0,
-                'yesterday_price': rt_data.yesterday_price or 0.0,
-                'high_price': rt_data.high_price or 0.0,
-                'low_price': rt_data.low_price or 0.0,
-                'volume': rt_data.volume or 0,               # حجم معاملات لحظه‌ای
-                'value': rt_data.value or 0.0,                 # ارزش معاملات
-                'base_volume': ticker.base_volume or 0,      # حجم مبنا از آبجکت اصلی ticker گرفته می‌شود
-                'count': rt_data.count or 0,                 # تعداد معاملات
-                
-                # --- اطلاعات تابلوخوانی (بهترین عرضه و تقاضا) ---
-                'best_demand_price': rt_data.best_demand_price or 0.0, # قیمت بهترین خرید (سرخط)
-                'best_demand_vol': rt_data.best_demand_vol or 0,       # حجم بهترین خرید
-                'best_supply_price': rt_data.best_supply_price or 0.0, # قیمت بهترین فروش
-                'best_supply_vol': rt_data.best_supply_vol or 0,       # حجم بهترین فروش
-                
-                # --- حقیقی / حقوقی (با استفاده از تابع کمکی ایمن) ---
-                # طبق مستندات، این آبجکت‌ها داخل individual_trade_summary و corporate_trade_summary هستند
-            }
-            
-            # نگاشت داده‌های حقیقی (Individual)
-            result.update(self._safe_get_trade_summary(rt_data, 'individual'))
-
-            # نگاشت داده‌های حقوقی (Corporate)
-            result.update(self._safe_get_trade_summary(rt_data, 'corporate'))
-
-            # محاسبه قدرت خریدار حقیقی (Optional - محاسبه در لحظه)
-            # اگر بخواهید همینجا محاسبه کنید:
-            # buy_power = (ind_buy_vol / ind_buy_count) if ind_buy_count > 0 else 0
-            
-            return result
+            live_mapped_data = self.data_source.fetch(symbol)
+            if live_mapped_data:
+                self.circuit_breaker.record_success(symbol)
+            return live_mapped_data
 
-        except RuntimeError:
-            # این ارور طبق مستندات یعنی دیتای لحظه‌ای موجود نیست (نماد بسته یا قدیمی)
-            logger.warning(f"⚠️ Real-time data not available for {ticker.symbol} (Stopped or Old).")
+        except SymbolUnavailableError:
+            # نماد متوقف/قدیمی: شکست برای Circuit Breaker ثبت می‌شود
+            self.circuit_breaker.record_failure(symbol)
             return None
         except Exception as e:
-            # خطای 'unsupported operand type(s) for *: 'NoneType' and 'float'' دیگر نباید اینجا رخ دهد، 
-            # بلکه در مراحل بعدی تحلیل (فاز 2) که از این داده‌ها استفاده می‌کند، رخ می‌دهد.
-            logger.error(f"❌ Error mapping data for {ticker.symbol}: {e}")
+            logger.error(f"❌ Unexpected error processing {symbol}: {e}")
             return None
+        finally:
+            # درخواست‌های ناموفق و کند هم در Histogram تأخیر ثبت می‌شوند
+            SYMBOL_FETCH_SECONDS.observe(time.perf_counter() - started)
+
+    def _fetch_symbols_concurrently(
+        self,
+        symbol_list: List[str],
+        budget_seconds: Optional[float] = None,
+        executor: Optional[ThreadPoolExecutor] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        نمادها را با حداکثر max_workers درخواست همزمان واکشی می‌کند.
+        ترتیب خروجی همان ترتیب symbol_list است (مثل حالت ترتیبی قدیمی).
+
+        چون درخواست‌های pytse-client قابل لغو نیستند، Timeout به صورت بودجه کل Sweep اعمال می‌شود:
+        request_timeout * تعداد موج‌ها (ceil(n / max_workers)). نمادهایی که تا آن لحظه
+        تمام نشده باشند در این سیکل کنار گذاشته می‌شوند.
+        اگر budget_seconds داده شود، بودجه Sweep از آن بیشتر نخواهد شد.
+        executor: Pool جایگزین (مثلاً Pool جداگانه Tier های Warm/Cold در زمان‌بند تطبیقی)؛
+        پیش‌فرض Pool اصلی Orchestrator است.
+        """
+        executor = executor or self._executor
+        started_at = time.monotonic()
+
+        # نمادهایی که Circuit Breaker آن‌ها باز است در این سیکل درخواست شبکه ندارند
+        requested_count = len(symbol_list)
+        symbol_list, skipped = self.circuit_breaker.filter(symbol_list)
+        logger.info(f"📡 Starting real-time fetch for {len(symbol_list)} symbols ({len(skipped)} skipped by circuit breaker)...")
+
+        waves = max(1, math.ceil(len(symbol_list) / self.max_workers))
+        sweep_budget = self.request_timeout * waves
+        if budget_seconds is not None:
+            sweep_budget = min(sweep_budget, max(0.0, budget_seconds))
+
+        futures = [executor.submit(self._fetch_single_symbol, symbol) for symbol in symbol_list]
+        done, not_done = wait(futures, timeout=sweep_budget)
+        # کش متادیتا / بافر ضبط منبع داده در پایان هر سیکل ذخیره می‌شود
+        self.data_source.flush()
+
+        # درخواست‌هایی که هنوز شروع نشده‌اند لغو می‌شوند تا سیکل بعدی معطل نماند
+        for future in not_done:
+            future.cancel()
+
+        all_tickers_data = []
+        for future in futures:
+            if future in done and not future.cancelled():
+                live_mapped_data = future.result()
+                if live_mapped_data:
+                    all_tickers_data.append(live_mapped_data)
+
+        elapsed = time.monotonic() - started_at
+        self.circuit_breaker.flush()
+        FETCH_SWEEP_SECONDS.observe(elapsed)
+        SYMBOLS_FETCHED.inc(len(all_tickers_data))
+        SYMBOLS_FAILED.inc(len(symbol_list) - len(all_tickers_data))
+        SYMBOLS_SKIPPED.inc(len(skipped))
+        self._record_cycle_stats(
+            requested=requested_count,
+            skipped=len(skipped),
+            fetched=len(all_tickers_data),
+            failed=len(symbol_list) - len(all_tickers_data),
+            timed_out=len(not_done),
+            duration_seconds=round(elapsed, 3),
+        )
+
+        if not_done:
+            logger.warning(
+                f"⏱️ {len(not_done)} symbols exceeded the sweep budget ({sweep_budget:.1f}s) and were skipped this cycle."
+            )
+        logger.info(
+            f"⏱️ Fetch sweep finished in {elapsed:.2f}s: {len(all_tickers_data)}/{len(symbol_list)} symbols "
+            f"(workers={self.max_workers})."
+        )
+        return all_tickers_data
+
+    def _record_cycle_stats(self, **stats):
+        """آمار هر Sweep را نگه داشته و برای پایش در Redis می‌نویسد."""
+        stats['open_circuits'] = self.circuit_breaker.open_count()
+        stats['redis_pool'] = pool_stats().get(REDIS_POOL_NAME)
+        stats['timestamp'] = time.time()
+        self.last_cycle_stats = stats
+        logger.info(
+            f"📊 Cycle stats: fetched={stats['fetched']} failed={stats['failed']} "
+            f"skipped={stats['skipped']} open_circuits={stats['open_circuits']}"
+        )
+        if self.redis_client:
+            try:
+                self.redis_client.set(REALTIME_CYCLE_STATS_KEY, json.dumps(stats))
+            except Exception as e:
+                logger.warning(f"⚠️ Could not write cycle stats to Redis: {e}")
 
     # ---------------------------------------------------------
-    # 2) واکشی و ذخیره داده‌های لحظه‌ای (Main Loop)
+    # 3) واکشی و ذخیره داده‌های لحظه‌ای (Main Loop)
     # ---------------------------------------------------------
     def fetch_and_cache_all_realtime(self):
         """
@@ -223,38 +356,90 @@ class Phase1Orchestrator:
             logger.warning("⚠️ Watchlist is empty. No symbols to fetch.")
             return
 
-        all_tickers_data = []
-        logger.info(f"📡 Starting real-time fetch for {len(symbol_list)} symbols...")
+        # ب) و ج) دریافت دیتای لحظه‌ای (همزمان) و ذخیره در Redis
+        self.fetch_and_cache_symbols(symbol_list, universe=symbol_list)
 
-        # ب) دریافت دیتای لحظه‌ای
-        for symbol in symbol_list:
-            try:
-                # ساخت آبجکت Ticker
-                ticker = tse.Ticker(symbol)
-                
-                # واکشی دیتای مپ شده
-                live_mapped_data = self._map_live_data(ticker)
-                
-                if live_mapped_data:
-                    all_tickers_data.append(live_mapped_data)
+    def fetch_and_cache_symbols(
+        self,
+        symbol_list: List[str],
+        universe: Optional[List[str]] = None,
+        budget_seconds: Optional[float] = None,
+        executor: Optional[ThreadPoolExecutor] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        بخشی از نمادها را واکشی کرده و با آخرین Snapshot ادغام می‌کند (مثلاً یک Tier از زمان‌بند تطبیقی).
+        نمادهایی که در این فراخوانی واکشی نشده‌اند، تا SNAPSHOT_MAX_AGE_SECONDS با آخرین مقدار خود باقی می‌مانند.
 
-            except Exception as e:
-                logger.error(f"❌ Unexpected error processing {symbol}: {e}")
-                continue
+        universe: لیست کامل نمادهای فعلی؛ نمادهای خارج از آن از Snapshot حذف می‌شوند.
+        budget_seconds: سقف زمانی این Sweep (برای زمان‌بند تطبیقی).
+        executor: Pool اجرای درخواست‌ها (پیش‌فرض: Pool اصلی Orchestrator).
+        خروجی: رکوردهای واکشی‌شده در همین فراخوانی.
+        """
+        if not self.redis_client:
+            logger.error("❌ Caching failed: Redis client not initialized.")
+            return []
+
+        all_tickers_data = self._fetch_symbols_concurrently(symbol_list, budget_seconds, executor)
+
+        if not all_tickers_data:
+            logger.warning("⚠️ No valid live data was collected to cache.")
+            return []
+
+        now = time.time()
+        for record in all_tickers_data:
+            self._fetched_at[record['symbol']] = now
+
+        # ادغام با آخرین Snapshot نوشته‌شده (حذف نمادهای خارج از Universe یا قدیمی‌تر از حد مجاز)
+        allowed = set(universe) if universe is not None else None
+        snapshot = {
+            symbol: record for symbol, record in self._last_written.items()
+            if (allowed is None or symbol in allowed)
+            and now - self._fetched_at.get(symbol, 0) <= SNAPSHOT_MAX_AGE_SECONDS
+        }
+        snapshot.update({r['symbol']: r for r in all_tickers_data if r.get('symbol')})
+
+        self._write_snapshot_to_redis(list(snapshot.values()))
+        return all_tickers_data
+
+    def get_last_snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """آخرین رکورد نوشته‌شده هر نماد در Redis (کلید: نام نماد)."""
+        return dict(self._last_written)
+
+    def _write_snapshot_to_redis(self, records: List[Dict[str, Any]]):
+        """Snapshot ادغام‌شده را (به صورت Delta یا کامل) در Redis ذخیره می‌کند."""
+        changed, unchanged = compute_delta(self._last_written, records)
+        started = time.perf_counter()
+        try:
+            if REALTIME_DELTA_PUBLISH and REALTIME_WRITE_PER_SYMBOL:
+                # فقط نمادهای تغییر کرده نوشته و منتشر می‌شوند
+                version = write_delta(self.redis_client, records, changed, unchanged)
+                logger.info(
+                    f"✅ Cached real-time data: {len(changed)} changed / {len(unchanged)} unchanged symbols "
+                    f"(version {version if version is not None else 'unchanged'})."
+                )
+            else:
+                # نوشتن کلیدهای تک‌نماد و/یا کلید قدیمی در یک Pipeline (قالب در realtime_cache تعیین می‌شود)
+                version = write_snapshot(self.redis_client, records)
+                logger.info(f"✅ Successfully cached real-time data for {len(records)} symbols in Redis (version {version}).")
 
-        # ج) ذخیره در Redis
-        if all_tickers_data:
+            # فقط بعد از نوشتن موفق، مبنای مقایسه سیکل بعد به‌روز می‌شود
+            self._last_written = {r['symbol']: r for r in records if r.get('symbol')}
+            self.last_snapshot_written_at = time.time()
+            SNAPSHOT_WRITE_SECONDS.observe(time.perf_counter() - started)
+        except Exception as e:
+            logger.error(f"❌ Failed to write data to Redis: {e}")
+            return
+
+        # تاریخچه درون‌روزی: Snapshot بدون تغییر اطلاعات جدیدی ندارد، پس فقط نمادهای تغییر کرده اضافه می‌شوند
+        if REALTIME_HISTORY_ENABLED and changed:
             try:
-                # ذخیره با فرمت JSON
-                self.redis_client.set(REALTIME_CACHE_KEY, json.dumps(all_tickers_data))
-                # می‌توانیم Expiration هم بگذاریم که دیتا بیات نشود (مثلا 2 دقیقه)
-                self.redis_client.expire(REALTIME_CACHE_KEY, 300) 
-                
-                logger.info(f"✅ Successfully cached real-time data for {len(all_tickers_data)} symbols in Redis.")
+                append_history(self.redis_client, changed)
             except Exception as e:
-                logger.error(f"❌ Failed to write data to Redis: {e}")
-        else:
-            logger.warning("⚠️ No valid live data was collected to cache.")
+                logger.warning(f"⚠️ Failed to append intraday history: {e}")
+
+    def close(self):
+        """Pool واکشی را می‌بندد (درخواست‌های در صف لغو می‌شوند)؛ بعد از آن Orchestrator قابل استفاده نیست."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
 
 # --- (بخش تست دستی) ---
 if __name__ == "__main__":
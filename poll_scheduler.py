@@ -0,0 +1,249 @@
+# poll_scheduler.py
+# وظیفه: زمان‌بندی تطبیقی واکشی نمادها بر اساس اولویت (Hot / Warm / Cold)
+
+import os
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from phase1_orchestrator import Phase1Orchestrator
+from realtime_cache import read_analysis_scores, REALTIME_FRESHNESS_KEY
+
+logger = logging.getLogger(__name__)
+
+# --- تنظیمات Tier ها ---
+TIERS = ('hot', 'warm', 'cold')
+TIER_INTERVALS_SECONDS = {
+    'hot': float(os.getenv("POLL_HOT_INTERVAL_SECONDS", 5)),
+    'warm': float(os.getenv("POLL_WARM_INTERVAL_SECONDS", 15)),
+    'cold': float(os.getenv("POLL_COLD_INTERVAL_SECONDS", 60)),
+}
+# سقف زمانی هر سیکل؛ نمادهای Hot همیشه اول واکشی می‌شوند و Warm/Cold فقط از باقیمانده بودجه استفاده می‌کنند
+POLL_CYCLE_BUDGET_SECONDS = float(os.getenv("POLL_CYCLE_BUDGET_SECONDS", 4))
+# تعداد Thread های جداگانه Warm/Cold (0 یعنی نصف FETCH_MAX_WORKERS)؛ درخواست‌های کند این Tier ها
+# که بعد از پایان بودجه هنوز در حال اجرا هستند، Thread های Pool اصلی (Hot) را اشغال نمی‌کنند
+POLL_BACKGROUND_WORKERS = int(os.getenv("POLL_BACKGROUND_WORKERS", 0))
+
+# --- معیارهای اولویت ---
+HOT_SCORE_THRESHOLD = float(os.getenv("HOT_SCORE_THRESHOLD", 4.0))     # امتیاز آخرین /run
+WARM_SCORE_THRESHOLD = float(os.getenv("WARM_SCORE_THRESHOLD", 2.0))
+HOT_CHANGE_PERCENT = float(os.getenv("HOT_CHANGE_PERCENT", 4.0))       # نزدیک به سقف دامنه (صف خرید)
+WARM_CHANGE_PERCENT = float(os.getenv("WARM_CHANGE_PERCENT", 2.0))
+
+
+class TieredPollScheduler:
+    """
+    به جای واکشی همه نمادها با فاصله ثابت ۵ ثانیه:
+    1. نمادها را بر اساس نزدیکی به صف خرید و امتیاز آخرین /run در سه Tier دسته‌بندی می‌کند.
+    2. هر Tier را با فاصله زمانی خودش واکشی می‌کند.
+    3. با بودجه زمانی هر سیکل تضمین می‌کند که Sweep کند نمادهای سرد، نمادهای داغ را معطل نکند.
+    4. تازگی داده هر Tier را گزارش می‌کند.
+    """
+
+    def __init__(
+        self,
+        orchestrator: Phase1Orchestrator,
+        cycle_budget: float = POLL_CYCLE_BUDGET_SECONDS,
+        background_workers: int = POLL_BACKGROUND_WORKERS,
+    ):
+        self.orchestrator = orchestrator
+        self.cycle_budget = cycle_budget
+        # Hot روی Pool اصلی Orchestrator و Warm/Cold روی این Pool اجرا می‌شوند
+        self.background_workers = max(1, background_workers or orchestrator.max_workers // 2)
+        self._background_executor = ThreadPoolExecutor(
+            max_workers=self.background_workers, thread_name_prefix="tse-fetch-bg"
+        )
+
+        self._last_attempt: Dict[str, float] = {}
+        self._last_success: Dict[str, float] = {}
+        # تخمین میانگین زمان هر درخواست (برای تعیین ظرفیت Warm/Cold در باقیمانده بودجه)
+        self._request_latency_ema = 1.0
+        # نمادهای Hot آخرین سیکل (برای محاسبه زمان سیکل بعد)
+        self._hot_symbols: List[str] = []
+        self._cycle_started_at = 0.0
+
+    # ---------------------------------------------------------
+    # دسته‌بندی نمادها
+    # ---------------------------------------------------------
+    @staticmethod
+    def _percent_change(record: Optional[Dict[str, Any]]) -> float:
+        if not record:
+            return 0.0
+        last_price = record.get('last_price') or 0.0
+        yesterday = record.get('yesterday_price') or 0.0
+        return ((last_price - yesterday) / yesterday) * 100 if yesterday > 0 else 0.0
+
+    @staticmethod
+    def _has_buy_queue(record: Optional[Dict[str, Any]]) -> bool:
+        """صف خرید: تقاضا وجود دارد ولی عرضه‌ای در سرخط نیست."""
+        if not record:
+            return False
+        return (record.get('best_demand_vol') or 0) > 0 and (record.get('best_supply_vol') or 0) == 0
+
+    def classify(
+        self,
+        universe: List[str],
+        sources: Dict[str, set],
+        snapshot: Dict[str, Dict[str, Any]],
+        scores: Dict[str, float],
+    ) -> Dict[str, str]:
+        """Tier هر نماد را برمی‌گرداند: {'فولاد': 'hot', ...}"""
+        tiers = {}
+        for symbol in universe:
+            record = snapshot.get(symbol)
+            score = scores.get(symbol, 0.0)
+            change = self._percent_change(record)
+            symbol_sources = sources.get(symbol, set())
+
+            if (
+                'BuyQueue' in symbol_sources
+                or self._has_buy_queue(record)
+                or change >= HOT_CHANGE_PERCENT
+                or score >= HOT_SCORE_THRESHOLD
+            ):
+                tiers[symbol] = 'hot'
+            elif (
+                'GoldenKey' in symbol_sources
+                or change >= WARM_CHANGE_PERCENT
+                or score >= WARM_SCORE_THRESHOLD
+            ):
+                tiers[symbol] = 'warm'
+            else:
+                tiers[symbol] = 'cold'
+        return tiers
+
+    def _read_scores(self) -> Dict[str, float]:
+        try:
+            return read_analysis_scores(self.orchestrator.redis_client)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not read analysis scores from Redis: {e}")
+            return {}
+
+    # ---------------------------------------------------------
+    # اجرای یک سیکل
+    # ---------------------------------------------------------
+    def _due_symbols(self, symbols: List[str], tier: str, now: float) -> List[str]:
+        """نمادهایی که زمان واکشی‌شان رسیده، به ترتیب قدیمی‌ترین تلاش."""
+        interval = TIER_INTERVALS_SECONDS[tier]
+        due = [s for s in symbols if now - self._last_attempt.get(s, 0) >= interval]
+        return sorted(due, key=lambda s: self._last_attempt.get(s, 0))
+
+    def _fetch(
+        self,
+        symbols: List[str],
+        universe: List[str],
+        budget: float,
+        executor: Optional[ThreadPoolExecutor] = None,
+        workers: Optional[int] = None,
+    ) -> int:
+        if not symbols or budget <= 0:
+            return 0
+
+        # زمان تلاش = شروع Sweep؛ تا فاصله هر Tier از شروع واکشی قبلی حساب شود نه از پایان آن
+        attempted_at = time.time()
+        started_at = time.monotonic()
+        records = self.orchestrator.fetch_and_cache_symbols(
+            symbols, universe=universe, budget_seconds=budget, executor=executor
+        )
+        elapsed = time.monotonic() - started_at
+
+        now = time.time()
+        for symbol in symbols:
+            self._last_attempt[symbol] = attempted_at
+        for record in records:
+            self._last_success[record['symbol']] = now
+
+        waves = max(1, -(-len(symbols) // (workers or self.orchestrator.max_workers)))
+        self._request_latency_ema = 0.8 * self._request_latency_ema + 0.2 * (elapsed / waves)
+        return len(records)
+
+    def run_cycle(self):
+        """یک سیکل زمان‌بند: Hot کامل، سپس Warm و Cold تا جایی که بودجه اجازه دهد."""
+        cycle_started = time.monotonic()
+        self._cycle_started_at = cycle_started
+
+        universe = self.orchestrator.get_unique_symbols_from_db()
+        if not universe:
+            # نمادهای Hot سیکل قبل دیگر معتبر نیستند (وگرنه seconds_until_due صفر می‌شود و حلقه Writer می‌چرخد)
+            self._hot_symbols = []
+            logger.warning("⚠️ Watchlist is empty. No symbols to fetch.")
+            return
+
+        tiers = self.classify(
+            universe,
+            self.orchestrator.get_symbol_sources(),
+            self.orchestrator.get_last_snapshot(),
+            self._read_scores(),
+        )
+        by_tier = {tier: [s for s, t in tiers.items() if t == tier] for tier in TIERS}
+        self._hot_symbols = by_tier['hot']
+        now = time.time()
+
+        # 1. Hot: همیشه اول و با کل بودجه
+        hot_due = self._due_symbols(by_tier['hot'], 'hot', now)
+        self._fetch(hot_due, universe, self.cycle_budget)
+
+        # 2. Warm و Cold: فقط به اندازه ظرفیت باقیمانده بودجه (بقیه به سیکل بعد منتقل می‌شوند)؛
+        # هر دو Tier به ترتیب قدیمی‌ترین تلاش ادغام می‌شوند تا زیر بار مداوم، Cold پشت Warm گرسنه نماند
+        remaining = self.cycle_budget - (time.monotonic() - cycle_started)
+        capacity = int(self.background_workers * max(0.0, remaining) / max(self._request_latency_ema, 0.05))
+        background_due = sorted(
+            self._due_symbols(by_tier['warm'], 'warm', now) + self._due_symbols(by_tier['cold'], 'cold', now),
+            key=lambda s: self._last_attempt.get(s, 0),
+        )
+        deferred = max(0, len(background_due) - capacity)
+        background_due = background_due[:capacity]
+        self._fetch(background_due, universe, remaining, self._background_executor, self.background_workers)
+
+        self._report_freshness(by_tier, deferred=deferred)
+        logger.info(
+            f"⏱️ Tiered cycle finished in {time.monotonic() - cycle_started:.2f}s "
+            f"(hot {len(hot_due)}/{len(by_tier['hot'])}, background {len(background_due)} requested, {deferred} deferred)."
+        )
+
+    def seconds_until_due(self) -> float:
+        """
+        زمان باقیمانده تا سررسید اولین نماد Hot (برای خواب حلقه Writer بین سیکل‌ها).
+        اگر نماد Hot وجود نداشته باشد، سیکل بعد یک بازه Hot بعد از شروع سیکل فعلی است.
+        """
+        interval = TIER_INTERVALS_SECONDS['hot']
+        if self._hot_symbols:
+            next_due = min(self._last_attempt.get(s, 0) for s in self._hot_symbols) + interval
+            return max(0.0, next_due - time.time())
+        return max(0.0, self._cycle_started_at + interval - time.monotonic())
+
+    def close(self):
+        """Pool جداگانه Warm/Cold را می‌بندد (درخواست‌های در صف لغو می‌شوند)."""
+        self._background_executor.shutdown(wait=False, cancel_futures=True)
+
+    # ---------------------------------------------------------
+    # گزارش تازگی داده‌ها
+    # ---------------------------------------------------------
+    def _report_freshness(self, by_tier: Dict[str, List[str]], deferred: int = 0):
+        """حداکثر و میانگین عمر داده هر Tier را لاگ کرده و در Redis ثبت می‌کند."""
+        now = time.time()
+        report = {}
+        for tier in TIERS:
+            ages = [now - self._last_success[s] for s in by_tier[tier] if s in self._last_success]
+            report[tier] = {
+                'symbols': len(by_tier[tier]),
+                'never_fetched': len(by_tier[tier]) - len(ages),
+                'max_age_seconds': round(max(ages), 1) if ages else None,
+                'avg_age_seconds': round(sum(ages) / len(ages), 1) if ages else None,
+                'interval_seconds': TIER_INTERVALS_SECONDS[tier],
+            }
+        report['updated_at'] = now
+
+        logger.info(
+            "📊 Freshness: " + " | ".join(
+                f"{tier}: n={report[tier]['symbols']} max={report[tier]['max_age_seconds']}s"
+                for tier in TIERS
+            ) + (f" ({deferred} background symbols deferred)" if deferred else "")
+        )
+
+        try:
+            self.orchestrator.redis_client.set(REALTIME_FRESHNESS_KEY, json.dumps(report))
+        except Exception as e:
+            logger.warning(f"⚠️ Could not write freshness report to Redis: {e}")
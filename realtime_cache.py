@@ -0,0 +1,551 @@
+# realtime_cache.py
+# وظیفه: قالب ذخیره‌سازی داده‌های لحظه‌ای در Redis (مشترک بین Orchestrator و main.py)
+
+import os
+import json
+import time
+import struct
+import logging
+from typing import Dict, Any, List, Optional, Iterable, Tuple, Union
+
+from dotenv import load_dotenv
+
+try:
+    import msgpack
+except ImportError:  # وابستگی اختیاری؛ در نبود آن کدک JSON استفاده می‌شود
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# --- کلیدهای Redis ---
+# قالب قدیمی: کل Snapshot بازار به صورت یک رشته JSON
+REALTIME_CACHE_KEY = "market:realtime:tickers"
+# قالب جدید: یک کلید برای هر نماد (قابل خواندن گزینشی با MGET)
+REALTIME_SYMBOL_KEY_PREFIX = "market:realtime:ticker:"
+# مجموعه (SET) نمادهای موجود در آخرین Snapshot
+REALTIME_INDEX_KEY = "market:realtime:index"
+# شماره نسخه Snapshot (در هر نوشتن یک واحد افزایش می‌یابد)
+REALTIME_VERSION_KEY = "market:realtime:version"
+# زمان آخرین نوشتن (Unix timestamp)
+REALTIME_UPDATED_AT_KEY = "market:realtime:updated_at"
+
+# Stream تغییرات (Delta) هر سیکل و کانال اعلان Snapshot جدید
+REALTIME_DELTA_STREAM_KEY = "market:realtime:deltas"
+REALTIME_UPDATES_CHANNEL = "market:realtime:updates"
+REALTIME_DELTA_STREAM_MAXLEN = int(os.getenv("REALTIME_DELTA_STREAM_MAXLEN", 2000))
+
+# آمار آخرین Sweep واکشی (تعداد واکشی‌شده، ناموفق و ردشده توسط Circuit Breaker)
+REALTIME_CYCLE_STATS_KEY = "market:realtime:cycle_stats"
+# تازگی داده هر Tier در زمان‌بند تطبیقی (realtime_writer)
+REALTIME_FRESHNESS_KEY = "market:realtime:freshness"
+# امتیاز هر نماد در آخرین اجرای /run (برای اولویت‌بندی Tier ها)
+ANALYSIS_SCORES_KEY = "analysis:scores"
+ANALYSIS_SCORES_TTL_SECONDS = 1800
+# کاندیدهای فاز ۱ (نتیجه کوئری سنگین main.py) به همراه Fingerprint جداول منبع
+ANALYSIS_CANDIDATES_KEY = "analysis:candidates"
+ANALYSIS_CANDIDATES_TTL_SECONDS = int(os.getenv("ANALYSIS_CANDIDATES_TTL_SECONDS", 6 * 3600))
+# نتیجه خلاصه آخرین اجرای تحلیل (main.py -> حالت زنده داشبورد)
+ANALYSIS_LATEST_RUN_KEY = "analysis:latest_run"
+ANALYSIS_LATEST_RUN_TTL_SECONDS = 6 * 3600
+
+# تاریخچه درون‌روزی هر نماد: یک Stream برای هر نماد با حذف زمان‌محور (MINID)
+REALTIME_HISTORY_KEY_PREFIX = "market:history:"
+REALTIME_HISTORY_ENABLED = os.getenv("REALTIME_HISTORY_ENABLED", "1") == "1"
+REALTIME_HISTORY_RETENTION_MINUTES = int(os.getenv("REALTIME_HISTORY_RETENTION_MINUTES", 420))
+
+REALTIME_TTL_SECONDS = 300
+
+# --- انتخاب قالب ---
+# نوشتن کلید قدیمی برای سازگاری با مصرف‌کننده‌های فعلی
+REALTIME_WRITE_BLOB = os.getenv("REALTIME_WRITE_BLOB", "1") == "1"
+# نوشتن کلیدهای تک‌نماد
+REALTIME_WRITE_PER_SYMBOL = os.getenv("REALTIME_WRITE_PER_SYMBOL", "1") == "1"
+# قالب خواندن در main.py: 'symbol' (کلیدهای تک‌نماد) یا 'blob' (کلید قدیمی)
+REALTIME_READ_LAYOUT = os.getenv("REALTIME_READ_LAYOUT", "symbol")
+# فقط نمادهای تغییر کرده نوشته و منتشر شوند (نیازمند قالب تک‌نماد)
+REALTIME_DELTA_PUBLISH = os.getenv("REALTIME_DELTA_PUBLISH", "1") == "1"
+# کدک نوشتن: 'json' (پیش‌فرض)، 'msgpack' یا 'struct'. خواندن همیشه کدک را از روی Header تشخیص می‌دهد.
+REALTIME_CODEC = os.getenv("REALTIME_CODEC", "json")
+
+
+# =========================================================
+# کدک فشرده (Compact Codec)
+# =========================================================
+# ترتیب ثابت فیلدها (همان خروجی Phase1Orchestrator._map_live_data).
+# با هر تغییر در این لیست، SNAPSHOT_SCHEMA_VERSION باید افزایش یابد.
+SNAPSHOT_SCHEMA_VERSION = 1
+SNAPSHOT_FIELDS: List[Tuple[str, str]] = [
+    ('symbol', 'str'),
+    ('symbol_name', 'str'),
+    ('last_price', 'float'),
+    ('adj_close', 'float'),
+    ('open_price', 'float'),
+    ('yesterday_price', 'float'),
+    ('high_price', 'float'),
+    ('low_price', 'float'),
+    ('volume', 'int'),
+    ('value', 'float'),
+    ('base_volume', 'int'),
+    ('count', 'int'),
+    ('best_demand_price', 'float'),
+    ('best_demand_vol', 'int'),
+    ('best_supply_price', 'float'),
+    ('best_supply_vol', 'int'),
+    ('individual_buy_vol', 'float'),
+    ('individual_buy_count', 'int'),
+    ('individual_sell_vol', 'float'),
+    ('individual_sell_count', 'int'),
+    ('corporate_buy_vol', 'float'),
+    ('corporate_buy_count', 'int'),
+    ('corporate_sell_vol', 'float'),
+    ('corporate_sell_count', 'int'),
+]
+_FIELD_NAMES = [name for name, _ in SNAPSHOT_FIELDS]
+_STR_FIELDS = [name for name, kind in SNAPSHOT_FIELDS if kind == 'str']
+_NUM_FIELDS = [(name, kind) for name, kind in SNAPSHOT_FIELDS if kind != 'str']
+_NUM_STRUCT = struct.Struct('<' + ''.join('q' if kind == 'int' else 'd' for _, kind in _NUM_FIELDS))
+
+# Header باینری: MAGIC (2 بایت) + شناسه کدک (1 بایت) + نسخه Schema (1 بایت) + تعداد رکورد (4 بایت)
+CODEC_MAGIC = b"TK"
+_CODEC_IDS = {'msgpack': 1, 'struct': 2}
+_HEADER = struct.Struct('<2sBBI')
+_STR_LEN = struct.Struct('<H')
+
+
+def _active_codec() -> str:
+    if REALTIME_CODEC == 'msgpack' and msgpack is None:
+        logger.warning("⚠️ REALTIME_CODEC=msgpack but msgpack is not installed. Falling back to JSON.")
+        return 'json'
+    if REALTIME_CODEC not in ('json', 'msgpack', 'struct'):
+        logger.warning(f"⚠️ Unknown REALTIME_CODEC '{REALTIME_CODEC}'. Falling back to JSON.")
+        return 'json'
+    return REALTIME_CODEC
+
+
+def normalize_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    رکورد را به انواع تعریف‌شده در Schema تبدیل می‌کند (خروجی کدک struct همیشه همین شکل را دارد).
+    فیلدهای خارج از Schema حذف و مقادیر None صفر می‌شوند.
+    """
+    normalized = {}
+    for name, kind in SNAPSHOT_FIELDS:
+        value = record.get(name)
+        if kind == 'str':
+            normalized[name] = value or ''
+        elif kind == 'int':
+            normalized[name] = int(value or 0)
+        else:
+            normalized[name] = float(value or 0.0)
+    return normalized
+
+
+def encode_records(records: List[Dict[str, Any]], codec: Optional[str] = None) -> Union[str, bytes]:
+    """لیست رکوردها را با کدک انتخابی (پیش‌فرض REALTIME_CODEC) سریال می‌کند."""
+    codec = codec or _active_codec()
+    if codec == 'json':
+        return json.dumps(records)
+
+    header = _HEADER.pack(CODEC_MAGIC, _CODEC_IDS[codec], SNAPSHOT_SCHEMA_VERSION, len(records))
+
+    if codec == 'msgpack':
+        # آرایه مقادیر به ترتیب ثابت فیلدها (بدون تکرار نام کلیدها)
+        rows = [[record.get(name) for name in _FIELD_NAMES] for record in records]
+        return header + msgpack.packb(rows, use_bin_type=True)
+
+    # codec == 'struct'
+    parts = [header]
+    for record in records:
+        record = normalize_record(record)
+        for name in _STR_FIELDS:
+            raw = record[name].encode('utf-8')
+            parts.append(_STR_LEN.pack(len(raw)))
+            parts.append(raw)
+        parts.append(_NUM_STRUCT.pack(*(record[name] for name, _ in _NUM_FIELDS)))
+    return b''.join(parts)
+
+
+def decode_records(payload: Union[str, bytes]) -> List[Dict[str, Any]]:
+    """
+    Payload نوشته‌شده با هر یک از کدک‌ها را به لیست دیکشنری برمی‌گرداند.
+    کدک از روی Header تشخیص داده می‌شود؛ Payload بدون Header همان JSON قدیمی است.
+    """
+    if isinstance(payload, bytes) and payload[:2] == CODEC_MAGIC:
+        _magic, codec_id, schema_version, count = _HEADER.unpack_from(payload)
+        if schema_version != SNAPSHOT_SCHEMA_VERSION:
+            raise ValueError(f"Unsupported snapshot schema version {schema_version} (expected {SNAPSHOT_SCHEMA_VERSION})")
+        body_offset = _HEADER.size
+
+        if codec_id == _CODEC_IDS['msgpack']:
+            if msgpack is None:
+                raise RuntimeError("msgpack payload found in Redis but msgpack is not installed")
+            rows = msgpack.unpackb(payload[body_offset:], raw=False)
+            return [dict(zip(_FIELD_NAMES, row)) for row in rows]
+
+        if codec_id == _CODEC_IDS['struct']:
+            records = []
+            offset = body_offset
+            for _ in range(count):
+                record = {}
+                for name in _STR_FIELDS:
+                    (length,) = _STR_LEN.unpack_from(payload, offset)
+                    offset += _STR_LEN.size
+                    record[name] = payload[offset:offset + length].decode('utf-8')
+                    offset += length
+                values = _NUM_STRUCT.unpack_from(payload, offset)
+                offset += _NUM_STRUCT.size
+                record.update(zip((name for name, _ in _NUM_FIELDS), values))
+                records.append({name: record[name] for name in _FIELD_NAMES})
+            return records
+
+        raise ValueError(f"Unknown snapshot codec id {codec_id}")
+
+    data = json.loads(payload)
+    return [data] if isinstance(data, dict) else data
+
+
+def _to_str(value: Union[str, bytes]) -> str:
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def symbol_key(symbol: str) -> str:
+    """کلید Redis مربوط به یک نماد."""
+    return f"{REALTIME_SYMBOL_KEY_PREFIX}{symbol}"
+
+
+# ---------------------------------------------------------
+# نوشتن (Orchestrator)
+# ---------------------------------------------------------
+def write_snapshot(client, records: List[Dict[str, Any]]) -> Optional[int]:
+    """
+    Snapshot کامل را در یک Pipeline (تراکنش MULTI/EXEC) در Redis می‌نویسد،
+    نسخه جدید را در کانال اعلان منتشر می‌کند و شماره آن را برمی‌گرداند.
+    """
+    pipe = client.pipeline()
+
+    if REALTIME_WRITE_PER_SYMBOL:
+        symbols = []
+        for record in records:
+            symbol = record.get('symbol')
+            if not symbol:
+                continue
+            symbols.append(symbol)
+            pipe.set(symbol_key(symbol), encode_records([record]), ex=REALTIME_TTL_SECONDS)
+
+        # ایندکس نمادها جایگزین می‌شود تا نمادهای حذف‌شده از واچ‌لیست در آن باقی نمانند
+        pipe.delete(REALTIME_INDEX_KEY)
+        if symbols:
+            pipe.sadd(REALTIME_INDEX_KEY, *symbols)
+            pipe.expire(REALTIME_INDEX_KEY, REALTIME_TTL_SECONDS)
+
+    if REALTIME_WRITE_BLOB:
+        pipe.set(REALTIME_CACHE_KEY, encode_records(records), ex=REALTIME_TTL_SECONDS)
+
+    pipe.set(REALTIME_UPDATED_AT_KEY, time.time())
+    pipe.incr(REALTIME_VERSION_KEY)
+
+    results = pipe.execute()
+    # آخرین فرمان Pipeline همان INCR است
+    version = int(results[-1])
+    # اعلان بعد از EXEC ارسال می‌شود تا مشترک‌ها همیشه داده نسخه جدید را بخوانند
+    client.publish(REALTIME_UPDATES_CHANNEL, json.dumps({'seq': version, 'changed': len(records)}))
+    return version
+
+
+def read_updated_at(client) -> Optional[float]:
+    """زمان آخرین نوشتن Snapshot (epoch) یا None."""
+    updated_at = client.get(REALTIME_UPDATED_AT_KEY)
+    return float(updated_at) if updated_at else None
+
+
+def read_version(client) -> int:
+    """شماره نسخه فعلی Snapshot (صفر اگر هنوز چیزی نوشته نشده باشد)."""
+    raw = client.get(REALTIME_VERSION_KEY)
+    return int(raw) if raw else 0
+
+
+def compute_delta(previous: Dict[str, Dict[str, Any]], records: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    رکوردهای جدید را با آخرین مقدار نوشته‌شده مقایسه می‌کند.
+    خروجی: (رکوردهای تغییر کرده، نام نمادهای بدون تغییر)
+    """
+    changed = []
+    unchanged = []
+    for record in records:
+        symbol = record.get('symbol')
+        if not symbol:
+            continue
+        if previous.get(symbol) == record:
+            unchanged.append(symbol)
+        else:
+            changed.append(record)
+    return changed, unchanged
+
+
+def write_delta(client, records: List[Dict[str, Any]], changed: List[Dict[str, Any]], unchanged: List[str]) -> Optional[int]:
+    """
+    فقط نمادهای تغییر کرده را می‌نویسد و برای بقیه فقط TTL را تمدید می‌کند.
+    سپس تغییرات را با شماره ترتیبی (همان نسخه Snapshot) در Stream ثبت و در کانال اعلان منتشر می‌کند.
+
+    records: کل Snapshot این سیکل (برای ایندکس و کلید قدیمی)
+    خروجی: شماره نسخه جدید، یا None اگر چیزی تغییر نکرده باشد.
+    """
+    pipe = client.pipeline()
+    for record in changed:
+        pipe.set(symbol_key(record['symbol']), encode_records([record]), ex=REALTIME_TTL_SECONDS)
+    for symbol in unchanged:
+        pipe.expire(symbol_key(symbol), REALTIME_TTL_SECONDS)
+    results = pipe.execute()
+
+    # اگر کلید یک نماد بدون تغییر در Redis نباشد (مثلاً ری‌استارت Redis)، دوباره نوشته می‌شود
+    expire_results = results[len(changed):]
+    by_symbol = {r['symbol']: r for r in records if r.get('symbol')}
+    missing = [symbol for symbol, ok in zip(unchanged, expire_results) if not ok]
+    if missing:
+        logger.info(f"♻️ {len(missing)} unchanged symbols were missing in Redis. Rewriting them.")
+        changed = changed + [by_symbol[s] for s in missing]
+        pipe = client.pipeline()
+        for symbol in missing:
+            pipe.set(symbol_key(symbol), encode_records([by_symbol[symbol]]), ex=REALTIME_TTL_SECONDS)
+        pipe.execute()
+
+    pipe = client.pipeline()
+    pipe.delete(REALTIME_INDEX_KEY)
+    if by_symbol:
+        pipe.sadd(REALTIME_INDEX_KEY, *by_symbol.keys())
+        pipe.expire(REALTIME_INDEX_KEY, REALTIME_TTL_SECONDS)
+    if REALTIME_WRITE_BLOB:
+        pipe.set(REALTIME_CACHE_KEY, encode_records(records), ex=REALTIME_TTL_SECONDS)
+    pipe.set(REALTIME_UPDATED_AT_KEY, time.time())
+    if changed:
+        pipe.incr(REALTIME_VERSION_KEY)
+    results = pipe.execute()
+
+    if not changed:
+        return None
+
+    # نسخه Snapshot همان شماره ترتیبی Delta است (همیشه صعودی)
+    seq = int(results[-1])
+    pipe = client.pipeline(transaction=False)
+    pipe.xadd(
+        REALTIME_DELTA_STREAM_KEY,
+        {'seq': seq, 'data': encode_records(changed)},
+        maxlen=REALTIME_DELTA_STREAM_MAXLEN,
+        approximate=True,
+    )
+    pipe.publish(REALTIME_UPDATES_CHANNEL, json.dumps({'seq': seq, 'changed': len(changed)}))
+    pipe.execute()
+    return seq
+
+
+# ---------------------------------------------------------
+# تاریخچه درون‌روزی (Intraday History)
+# ---------------------------------------------------------
+def history_key(symbol: str) -> str:
+    """کلید Stream تاریخچه یک نماد."""
+    return f"{REALTIME_HISTORY_KEY_PREFIX}{symbol}"
+
+
+def append_history(client, records: List[Dict[str, Any]], now: Optional[float] = None):
+    """
+    Snapshot هر نماد را به Stream تاریخچه آن اضافه می‌کند (شناسه Stream همان زمان بر حسب میلی‌ثانیه است).
+    ورودی‌های قدیمی‌تر از REALTIME_HISTORY_RETENTION_MINUTES با MINID حذف می‌شوند و کلید نمادی که
+    دیگر به‌روز نمی‌شود بعد از همین مدت منقضی می‌شود؛ بنابراین حافظه مصرفی محدود می‌ماند.
+    """
+    if not records:
+        return
+    now = now or time.time()
+    retention_seconds = REALTIME_HISTORY_RETENTION_MINUTES * 60
+    min_id = int((now - retention_seconds) * 1000)
+
+    pipe = client.pipeline(transaction=False)
+    for record in records:
+        symbol = record.get('symbol')
+        if not symbol:
+            continue
+        key = history_key(symbol)
+        pipe.xadd(key, {'d': encode_records([record])}, minid=min_id, approximate=True)
+        pipe.expire(key, retention_seconds)
+    pipe.execute()
+
+
+def read_history(client, symbols: Iterable[str], minutes: float) -> Dict[str, List[Tuple[float, Dict[str, Any]]]]:
+    """
+    تاریخچه N دقیقه اخیر لیستی از نمادها را در یک رفت‌وبرگشت (Pipeline) می‌خواند.
+    خروجی: {'فولاد': [(timestamp, record), ...]} به ترتیب زمانی.
+    """
+    symbols = list(symbols)
+    start_id = int((time.time() - minutes * 60) * 1000)
+
+    pipe = client.pipeline(transaction=False)
+    for symbol in symbols:
+        pipe.xrange(history_key(symbol), min=start_id, max='+')
+    responses = pipe.execute()
+
+    history = {}
+    for symbol, entries in zip(symbols, responses):
+        points = []
+        for entry_id, fields in entries or []:
+            fields = {_to_str(k): v for k, v in fields.items()}
+            timestamp_ms = int(_to_str(entry_id).split('-')[0])
+            points.append((timestamp_ms / 1000, decode_records(fields['d'])[0]))
+        history[symbol] = points
+    return history
+
+
+# ---------------------------------------------------------
+# امتیازهای آخرین تحلیل (main.py -> realtime_writer)
+# ---------------------------------------------------------
+def write_analysis_scores(client, scores: Dict[str, float]):
+    """امتیاز نمادها در آخرین اجرای تحلیل را (جایگزین مقادیر قبلی) ذخیره می‌کند."""
+    pipe = client.pipeline()
+    pipe.delete(ANALYSIS_SCORES_KEY)
+    if scores:
+        pipe.hset(ANALYSIS_SCORES_KEY, mapping=scores)
+        pipe.expire(ANALYSIS_SCORES_KEY, ANALYSIS_SCORES_TTL_SECONDS)
+    pipe.execute()
+
+
+def read_analysis_scores(client) -> Dict[str, float]:
+    """امتیاز نمادها در آخرین اجرای تحلیل (کلید: نام نماد)."""
+    raw = client.hgetall(ANALYSIS_SCORES_KEY) or {}
+    return {_to_str(k): float(v) for k, v in raw.items()}
+
+
+# ---------------------------------------------------------
+# آخرین اجرای تحلیل (main.py -> داشبورد زنده)
+# ---------------------------------------------------------
+def write_analysis_run(client, payload: str):
+    """رکورد JSON آخرین اجرای تحلیل (alert_store.build_run_record) را جایگزین قبلی می‌کند."""
+    client.set(ANALYSIS_LATEST_RUN_KEY, payload, ex=ANALYSIS_LATEST_RUN_TTL_SECONDS)
+
+
+def read_live_state(client) -> Tuple[Optional[bytes], Optional[float]]:
+    """
+    با یک MGET: (JSON خام آخرین اجرای تحلیل، زمان آخرین نوشتن Snapshot بازار به صورت epoch).
+    JSON خام برگردانده می‌شود تا مصرف‌کننده فقط در صورت تغییر آن را Parse کند.
+    """
+    raw_run, updated_at = client.mget(ANALYSIS_LATEST_RUN_KEY, REALTIME_UPDATED_AT_KEY)
+    return raw_run, (float(updated_at) if updated_at else None)
+
+
+# ---------------------------------------------------------
+# کش کاندیدهای فاز ۱ (مشترک بین Worker های main.py)
+# ---------------------------------------------------------
+def write_candidates(client, fingerprint: str, candidates: Dict[str, Dict[str, Any]]):
+    """نتیجه کوئری کاندیدها را همراه با Fingerprint داده‌های منبع ذخیره می‌کند."""
+    payload = json.dumps({'fingerprint': fingerprint, 'candidates': candidates}, ensure_ascii=False, default=str)
+    client.set(ANALYSIS_CANDIDATES_KEY, payload, ex=ANALYSIS_CANDIDATES_TTL_SECONDS)
+
+
+def read_candidates(client, fingerprint: str) -> Optional[Dict[str, Dict[str, Any]]]:
+    """کاندیدهای ذخیره‌شده را فقط اگر Fingerprint آن‌ها با داده‌های فعلی یکی باشد برمی‌گرداند."""
+    raw = client.get(ANALYSIS_CANDIDATES_KEY)
+    if not raw:
+        return None
+    data = json.loads(raw)
+    if data.get('fingerprint') != fingerprint:
+        return None
+    return data.get('candidates')
+
+
+# ---------------------------------------------------------
+# خواندن (main.py)
+# ---------------------------------------------------------
+def read_snapshot(client, symbols: Optional[Iterable[str]] = None) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    داده‌های لحظه‌ای را از Redis می‌خواند.
+    خروجی: دیکشنری که کلید آن 'نام نماد' (فارسی) است، یا None اگر کش خالی باشد.
+
+    اگر symbols داده شود و قالب 'symbol' فعال باشد، فقط همان نمادها با یک MGET خوانده می‌شوند.
+    """
+    if REALTIME_READ_LAYOUT == 'blob':
+        return _read_blob(client, symbols)
+
+    if symbols is None:
+        symbols = client.smembers(REALTIME_INDEX_KEY)
+    symbols = [_to_str(s) for s in symbols if s]
+    if not symbols:
+        return None
+
+    raw_values = client.mget([symbol_key(s) for s in symbols])
+    snapshot = {}
+    for raw in raw_values:
+        if not raw:
+            continue
+        for item in decode_records(raw):
+            if item.get('symbol'):
+                snapshot[item['symbol']] = item
+    return snapshot or None
+
+
+def _read_blob(client, symbols: Optional[Iterable[str]] = None) -> Optional[Dict[str, Dict[str, Any]]]:
+    """خواندن از کلید قدیمی (کل Snapshot در یک JSON)."""
+    raw_data = client.get(REALTIME_CACHE_KEY)
+    if not raw_data:
+        return None
+
+    data_list = decode_records(raw_data)
+    # تبدیل لیست به دیکشنری با کلید نام نماد (مثلاً 'فولاد')
+    snapshot = {item['symbol']: item for item in data_list if item.get('symbol')}
+    if symbols is not None:
+        wanted = set(symbols)
+        snapshot = {k: v for k, v in snapshot.items() if k in wanted}
+    return snapshot
+
+
+def read_deltas(client, last_id: str = '0-0', count: int = 100, block_ms: Optional[int] = None) -> Tuple[str, List[Tuple[int, List[Dict[str, Any]]]]]:
+    """
+    Delta های ثبت‌شده بعد از last_id را از Stream می‌خواند.
+    خروجی: (آخرین id خوانده‌شده، لیست (seq، رکوردهای تغییر کرده))
+
+    مصرف‌کننده می‌تواند Snapshot محلی خود را با snapshot[record['symbol']] = record به‌روز نگه دارد.
+    """
+    response = client.xread({REALTIME_DELTA_STREAM_KEY: last_id}, count=count, block=block_ms)
+    deltas = []
+    for _stream, entries in response or []:
+        for entry_id, fields in entries:
+            fields = {_to_str(k): v for k, v in fields.items()}
+            deltas.append((int(fields['seq']), decode_records(fields['data'])))
+            last_id = _to_str(entry_id)
+    return last_id, deltas
+
+
+# --- (بخش تست دستی: صحت رفت‌وبرگشت و مقایسه حجم/سرعت کدک‌ها) ---
+if __name__ == "__main__":
+    import random
+
+    rng = random.Random(42)
+
+    def _sample_record(i: int) -> Dict[str, Any]:
+        price = float(rng.randint(1_000, 50_000))
+        record = {'symbol': f"نماد{i}", 'symbol_name': f"شرکت نمونه شماره {i}"}
+        for name, kind in SNAPSHOT_FIELDS[2:]:
+            record[name] = rng.randint(0, 10_000_000) if kind == 'int' else round(price * rng.uniform(0.95, 1.05), 1)
+        return record
+
+    sample = [_sample_record(i) for i in range(300)]
+    rounds = 200
+
+    for codec_name in ('json', 'msgpack', 'struct'):
+        if codec_name == 'msgpack' and msgpack is None:
+            print("msgpack   : skipped (not installed)")
+            continue
+
+        encoded = encode_records(sample, codec=codec_name)
+        payload = encoded.encode('utf-8') if isinstance(encoded, str) else encoded
+        expected = [normalize_record(r) for r in sample] if codec_name == 'struct' else sample
+        assert decode_records(payload) == expected, f"round-trip mismatch for {codec_name}"
+
+        started = time.perf_counter()
+        for _ in range(rounds):
+            encode_records(sample, codec=codec_name)
+        encode_ms = (time.perf_counter() - started) * 1000 / rounds
+
+        started = time.perf_counter()
+        for _ in range(rounds):
+            decode_records(payload)
+        decode_ms = (time.perf_counter() - started) * 1000 / rounds
+
+        print(f"{codec_name:<10}: {len(payload):>7} bytes | encode {encode_ms:6.2f} ms | decode {decode_ms:6.2f} ms (300 symbols)")
@@ -2,12 +2,15 @@
 # وظیفه: اجرای مداوم Orchestrator برای به‌روزرسانی Cache (Redis)
 # این فایل فقط مسئول زمان‌بندی است و منطق دیتابیس را به Orchestrator می‌سپارد.
 
+import os
 import time
 import logging
 import sys
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from phase1_orchestrator import Phase1Orchestrator
+from poll_scheduler import TieredPollScheduler
+from metrics import SNAPSHOT_AGE_SECONDS, WRITER_METRICS_PORT, start_metrics_server, track_age
 
 # --- تنظیمات ---
 TEHRAN_TZ = ZoneInfo("Asia/Tehran")
@@ -16,6 +19,8 @@ MARKET_START_HOUR = 8          # معمولاً بازار از ۸:۴۵ سفار
 MARKET_START_MINUTE = 55
 MARKET_END_HOUR = 16
 MARKET_END_MINUTE = 0         # کمی بعد از ۱۲:۳۰ برای اطمینان از دریافت قیمت‌های پایانی
+# زمان‌بند تطبیقی (Hot/Warm/Cold)؛ با مقدار 0 همه نمادها مثل قبل در هر سیکل واکشی می‌شوند
+ADAPTIVE_POLLING = os.getenv("ADAPTIVE_POLLING", "1") == "1"
 
 # --- تنظیمات لاگ ---
 logger = logging.getLogger(__name__)
@@ -57,6 +62,15 @@ def run_orchestrator_writer():
     
     # ایجاد نمونه از کلاس اصلی (اتصال به ردیس اینجا برقرار می‌شود)
     orchestrator = Phase1Orchestrator()
+    data_source = orchestrator.data_source
+    # در بازپخش جلسه ضبط‌شده، همه نمادها در هر سیکل خوانده می‌شوند (بدون درخواست شبکه)
+    scheduler = TieredPollScheduler(orchestrator) if ADAPTIVE_POLLING and data_source.is_live else None
+    if not data_source.is_live:
+        logger.info("🎞️ Replay data source active: market-hours check is bypassed.")
+
+    # اندپوینت /metrics این پردازه (مدت Sweep، تأخیر هر نماد، شمارنده‌های واکشی و سن Snapshot)
+    track_age(SNAPSHOT_AGE_SECONDS, lambda: orchestrator.last_snapshot_written_at)
+    start_metrics_server(WRITER_METRICS_PORT)
     
     logger.info("🟢 Service Started. Waiting for market hours or checking immediate tasks...")
 
@@ -64,17 +78,27 @@ def run_orchestrator_writer():
         try:
             now = datetime.now(TEHRAN_TZ)
             
-            # بررسی زمان بازار
-            if is_market_time():
+            # پایان فایل ضبط‌شده در حالت بازپخش
+            if data_source.exhausted:
+                logger.info("🏁 Replay finished: recorded session is exhausted.")
+                break
+
+            # بررسی زمان بازار (منبع بازپخش به ساعت بازار وابسته نیست)
+            if not data_source.is_live or is_market_time():
                 logger.info(f"⚡ Market Open ({now.strftime('%H:%M:%S')}). Syncing data...")
                 
                 # --- فراخوانی اصلی ---
                 # نکته مهم: اینجا هیچ لیست نمادی پاس نمی‌دهیم.
                 # خودِ ارکستریتور می‌رود و لیست را از دیتابیس (فیلدهای symbol_name) می‌خواند.
-                orchestrator.fetch_and_cache_all_realtime()
-                
-                # خواب کوتاه بین هر آپدیت
-                time.sleep(POLL_INTERVAL_SECONDS)
+                if scheduler:
+                    # فقط نمادهایی که زمان واکشی Tier آن‌ها رسیده (Hot همیشه اول)
+                    scheduler.run_cycle()
+                    # خواب فقط تا سررسید بعدی Tier داغ (نه فاصله ثابت بعد از پایان سیکل)
+                    time.sleep(scheduler.seconds_until_due())
+                else:
+                    orchestrator.fetch_and_cache_all_realtime()
+                    # خواب کوتاه بین هر آپدیت (در بازپخش سریع به نسبت سرعت کوتاه‌تر می‌شود)
+                    time.sleep(POLL_INTERVAL_SECONDS * data_source.poll_interval_scale)
                 
             else:
                 # خارج از ساعت بازار
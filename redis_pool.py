@@ -0,0 +1,150 @@
+# redis_pool.py
+# وظیفه: Connection Pool مشترک و ماندگار Redis برای main.py و Orchestrator (به همراه آمار Pool)
+
+import os
+import time
+import logging
+import threading
+from typing import Dict, Any
+
+import redis
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# --- تنظیمات ---
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+# حداکثر اتصال همزمان هر Pool؛ درخواست اضافه تا REDIS_POOL_TIMEOUT_SECONDS منتظر اتصال آزاد می‌ماند
+REDIS_POOL_MAX_CONNECTIONS = int(os.getenv("REDIS_POOL_MAX_CONNECTIONS", 20))
+REDIS_POOL_TIMEOUT_SECONDS = float(os.getenv("REDIS_POOL_TIMEOUT_SECONDS", 5))
+# اتصال‌هایی که بیش از این مدت بیکار بوده‌اند قبل از استفاده PING می‌شوند
+REDIS_HEALTH_CHECK_INTERVAL_SECONDS = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL_SECONDS", 30))
+REDIS_SOCKET_TIMEOUT_SECONDS = float(os.getenv("REDIS_SOCKET_TIMEOUT_SECONDS", 2))
+REDIS_SOCKET_CONNECT_TIMEOUT_SECONDS = float(os.getenv("REDIS_SOCKET_CONNECT_TIMEOUT_SECONDS", 2))
+
+
+class InstrumentedConnectionPool(redis.BlockingConnectionPool):
+    """
+    BlockingConnectionPool به همراه شمارنده‌های ساده برای تنظیم اندازه Pool زیر بار:
+    تعداد اتصال ساخته‌شده، در حال استفاده، دفعات انتظار برای اتصال آزاد و مجموع زمان انتظار.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._stats_lock = threading.Lock()
+        self.created_connections = 0
+        self.in_use_connections = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        super().__init__(*args, **kwargs)
+
+    def make_connection(self):
+        connection = super().make_connection()
+        with self._stats_lock:
+            self.created_connections += 1
+        return connection
+
+    def get_connection(self, *args, **kwargs):
+        # اگر صف خالی باشد (همه اتصال‌ها در حال استفاده‌اند) این درخواست منتظر می‌ماند
+        must_wait = self.pool.empty()
+        started_at = time.monotonic()
+        connection = super().get_connection(*args, **kwargs)
+        with self._stats_lock:
+            self.checkouts += 1
+            self.in_use_connections += 1
+            if must_wait:
+                self.waits += 1
+                self.wait_seconds += time.monotonic() - started_at
+        return connection
+
+    def release(self, connection):
+        with self._stats_lock:
+            self.in_use_connections = max(0, self.in_use_connections - 1)
+        super().release(connection)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                'max_connections': self.max_connections,
+                'created': self.created_connections,
+                'in_use': self.in_use_connections,
+                'idle': max(0, self.created_connections - self.in_use_connections),
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_ms_total': round(self.wait_seconds * 1000, 1),
+            }
+
+
+# ---------------------------------------------------------
+# Pool های نام‌دار (یکی برای هر مصرف‌کننده در هر پردازه)
+# ---------------------------------------------------------
+_pools_lock = threading.Lock()
+_pools: Dict[str, InstrumentedConnectionPool] = {}
+_clients: Dict[str, redis.Redis] = {}
+# پارامترهای اضافه اتصال (مثلاً connection_class جایگزین در load_test.py)
+_connection_overrides: Dict[str, Any] = {}
+# نشانگر «socket_timeout داده نشده»؛ None خودش یعنی بدون Timeout (مثلاً Pool مشترک Pub/Sub)
+_DEFAULT_TIMEOUT = object()
+
+
+def configure_pools(**connection_kwargs):
+    """
+    پارامترهای اتصال همه Pool های بعدی را تغییر می‌دهد و Pool های فعلی را می‌بندد.
+    برای تست (مثلاً connection_class=fakeredis.FakeConnection, server=...) استفاده می‌شود.
+    """
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.disconnect()
+        _pools.clear()
+        _clients.clear()
+        _connection_overrides.clear()
+        _connection_overrides.update(connection_kwargs)
+
+
+def get_redis_client(name: str = "default", socket_timeout: Any = _DEFAULT_TIMEOUT) -> redis.Redis:
+    """
+    کلاینت Redis متصل به Pool نام‌دار را برمی‌گرداند (ساخت Pool فقط یکبار در هر پردازه).
+    کلاینت‌ها Thread-safe هستند و می‌توانند بین Thread های Flask مشترک باشند.
+    مقادیر به صورت bytes برگردانده می‌شوند (decode_responses=False)؛ Payload ممکن است باینری باشد.
+
+    socket_timeout فقط هنگام ساخت Pool اعمال می‌شود (پیش‌فرض REDIS_SOCKET_TIMEOUT_SECONDS، None یعنی بدون Timeout)؛
+    درخواست مقدار متفاوت برای Pool ساخته‌شده ValueError می‌دهد.
+    """
+    with _pools_lock:
+        client = _clients.get(name)
+        if client is not None:
+            current = _pools[name].connection_kwargs.get('socket_timeout')
+            if socket_timeout is not _DEFAULT_TIMEOUT and socket_timeout != current:
+                raise ValueError(
+                    f"Redis pool '{name}' already exists with socket_timeout={current}; "
+                    f"requested socket_timeout={socket_timeout}."
+                )
+            return client
+
+        if socket_timeout is _DEFAULT_TIMEOUT:
+            socket_timeout = REDIS_SOCKET_TIMEOUT_SECONDS
+
+        pool = InstrumentedConnectionPool(
+            max_connections=REDIS_POOL_MAX_CONNECTIONS,
+            timeout=REDIS_POOL_TIMEOUT_SECONDS,
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=REDIS_SOCKET_CONNECT_TIMEOUT_SECONDS,
+            health_check_interval=REDIS_HEALTH_CHECK_INTERVAL_SECONDS,
+            **_connection_overrides,
+        )
+        client = redis.Redis(connection_pool=pool)
+        _pools[name] = pool
+        _clients[name] = client
+        logger.info(f"🔌 Redis pool '{name}' created ({REDIS_HOST}:{REDIS_PORT}, max {REDIS_POOL_MAX_CONNECTIONS} connections).")
+        return client
+
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    """آمار همه Pool های این پردازه: {'main': {'in_use': ..., 'created': ..., 'waits': ...}}"""
+    with _pools_lock:
+        return {name: pool.stats() for name, pool in _pools.items()}
@@ -0,0 +1,167 @@
+# snapshot_trigger.py
+# وظیفه: اجرای تحلیل به محض انتشار نسخه جدید Snapshot توسط Orchestrator (به جای Polling زمانی)
+
+import os
+import json
+import time
+import logging
+import threading
+from typing import Callable, Optional
+
+from dotenv import load_dotenv
+
+from realtime_cache import REALTIME_UPDATES_CHANNEL, read_version
+from redis_pool import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# --- تنظیمات ---
+# Pool جداگانه اشتراک (هر PubSub یک اتصال را تا پایان اشتراک نگه می‌دارد و نباید Timeout خواندن داشته باشد)
+REDIS_POOL_NAME = "pubsub"
+# فعال/غیرفعال کردن اجرای رویدادمحور در main.py (زمان‌بند assistant_scheduler همچنان پشتیبان است)
+EVENT_TRIGGER_ENABLED = os.getenv("EVENT_TRIGGER_ENABLED", "1") == "1"
+# اگر تا این مدت اعلان جدیدی نرسد، تحلیل اجرا می‌شود (چند اعلان پشت سر هم = یک اجرا)
+EVENT_DEBOUNCE_SECONDS = float(os.getenv("EVENT_DEBOUNCE_SECONDS", 1.0))
+# سقف تأخیر از اولین اعلان؛ اعلان‌های مداوم نباید تحلیل را برای همیشه عقب بیندازند
+EVENT_MAX_DELAY_SECONDS = float(os.getenv("EVENT_MAX_DELAY_SECONDS", 5.0))
+# فاصله تلاش مجدد اتصال به Redis
+EVENT_RECONNECT_SECONDS = 5
+
+
+class SnapshotUpdateTrigger:
+    """
+    در یک Thread پس‌زمینه در کانال REALTIME_UPDATES_CHANNEL مشترک می‌شود و با رسیدن نسخه جدید
+    (بعد از Debounce) تابع on_update را با شماره نسخه صدا می‌زند.
+    - نسخه‌هایی که قبلاً پردازش شده‌اند (last_processed_version) نادیده گرفته می‌شوند.
+    - چون Pub/Sub پیام‌های زمان قطعی را نگه نمی‌دارد، بعد از هر اتصال نسخه فعلی از Redis خوانده می‌شود.
+    """
+
+    def __init__(
+        self,
+        on_update: Callable[[int], None],
+        last_processed_version: Callable[[], int],
+        debounce_seconds: float = EVENT_DEBOUNCE_SECONDS,
+        max_delay_seconds: float = EVENT_MAX_DELAY_SECONDS,
+    ):
+        self.on_update = on_update
+        self.last_processed_version = last_processed_version
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # بزرگترین نسخه اعلام‌شده که هنوز تحلیل نشده، و زمان اولین/آخرین اعلان آن
+        self._pending_version = 0
+        self._first_seen: Optional[float] = None
+        self._last_seen: Optional[float] = None
+        # نسخه‌ای که یک بار دیگر اجرا شده (تا تحلیل ناموفق در هر Debounce تکرار نشود)
+        self._refired_version = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="snapshot-trigger", daemon=True)
+        self._thread.start()
+        logger.info(f"🔔 Event trigger subscribed to '{REALTIME_UPDATES_CHANNEL}' (debounce {self.debounce_seconds}s).")
+
+    def stop(self):
+        self._stop.set()
+
+    # ---------------------------------------------------------
+    # حلقه اشتراک
+    # ---------------------------------------------------------
+    def _run(self):
+        while not self._stop.is_set():
+            pubsub = None
+            try:
+                client = get_redis_client(REDIS_POOL_NAME, socket_timeout=None)
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(REALTIME_UPDATES_CHANNEL)
+                # نسخه‌ای که در زمان قطع اتصال منتشر شده باشد از دست نمی‌رود
+                self._note_version(read_version(client))
+                self._listen(pubsub)
+            except Exception as e:
+                logger.warning(f"⚠️ Event trigger lost Redis connection: {e}. Retrying in {EVENT_RECONNECT_SECONDS}s...")
+                self._stop.wait(EVENT_RECONNECT_SECONDS)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    def _listen(self, pubsub):
+        while not self._stop.is_set():
+            message = pubsub.get_message(timeout=self._wait_timeout())
+            if message and message.get('type') == 'message':
+                try:
+                    self._note_version(int(json.loads(message['data'])['seq']))
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"⚠️ Ignoring malformed snapshot notification: {e}")
+            if self._is_due():
+                self._fire()
+
+    # ---------------------------------------------------------
+    # Debounce و حذف نسخه‌های تکراری
+    # ---------------------------------------------------------
+    def _note_version(self, version: int):
+        if version <= max(self._pending_version, self.last_processed_version()):
+            return
+        now = time.monotonic()
+        self._pending_version = version
+        self._first_seen = self._first_seen or now
+        self._last_seen = now
+
+    def _wait_timeout(self) -> float:
+        """تا زمان اجرای بعدی صبر می‌کند (یا یک ثانیه اگر اعلانی در انتظار نباشد)."""
+        if self._last_seen is None:
+            return 1.0
+        now = time.monotonic()
+        due_at = min(self._last_seen + self.debounce_seconds, self._first_seen + self.max_delay_seconds)
+        return max(0.0, due_at - now)
+
+    def _is_due(self) -> bool:
+        if self._last_seen is None:
+            return False
+        now = time.monotonic()
+        return (
+            now - self._last_seen >= self.debounce_seconds
+            or now - self._first_seen >= self.max_delay_seconds
+        )
+
+    def _fire(self):
+        version = self._pending_version
+        self._first_seen = self._last_seen = None
+        if version <= self.last_processed_version():
+            return
+        try:
+            logger.info(f"🔔 Snapshot version {version} published. Triggering analysis...")
+            self.on_update(version)
+        except Exception as e:
+            logger.error(f"❌ Event-triggered analysis failed: {e}")
+            return
+
+        # اگر اجرا به Job در حال اجرایی متصل شده باشد که نسخه قدیمی‌تری را خوانده، این نسخه هنوز تحلیل نشده است؛
+        # یک بار دیگر (بعد از Debounce) اجرا می‌شود تا منتظر اعلان بعدی (که بعد از پایان بازار نمی‌آید) نماند
+        if self.last_processed_version() < version and self._refired_version != version:
+            self._refired_version = version
+            logger.info(f"🔁 Snapshot version {version} is still unanalyzed (joined an older run). Re-arming trigger...")
+            self._first_seen = self._last_seen = time.monotonic()
+
+
+# --- (بخش تست دستی) ---
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    processed = {'version': 0}
+
+    def _print_update(version: int):
+        print(f"analysis would run for snapshot version {version}")
+        processed['version'] = version
+
+    trigger = SnapshotUpdateTrigger(_print_update, lambda: processed['version'])
+    trigger.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        trigger.stop()
@@ -0,0 +1,147 @@
+# subscribers.py
+# وظیفه: فهرست مشترکین تلگرام (چت‌ها) و فیلتر سیگنال‌های هر مشترک
+
+import os
+import json
+import logging
+import threading
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# --- تنظیمات ---
+# فایل JSON مشترکین؛ نمونه:
+# [
+#   {"chat_id": "-1001", "name": "desk-a", "min_score": 7.5},
+#   {"chat_id": "-1002", "name": "desk-b", "source_tables": ["GoldenKey", "BuyQueue"], "symbols_deny": ["خودرو"]},
+#   {"chat_id": "-1003", "symbols_allow": ["فولاد", "شستا"]}
+# ]
+# اگر فایل وجود نداشته باشد، فقط TELEGRAM_CHAT_ID (بدون فیلتر) مشترک است.
+TELEGRAM_SUBSCRIBERS_FILE = os.getenv("TELEGRAM_SUBSCRIBERS_FILE", "subscribers.json")
+
+
+class Subscriber:
+    """یک چت تلگرام به همراه فیلتر سیگنال‌ها (حداقل امتیاز، جدول منبع فاز ۱، لیست مجاز/ممنوع نمادها)."""
+
+    def __init__(
+        self,
+        chat_id: str,
+        name: Optional[str] = None,
+        min_score: float = 0.0,
+        source_tables: Optional[Iterable[str]] = None,
+        symbols_allow: Optional[Iterable[str]] = None,
+        symbols_deny: Optional[Iterable[str]] = None,
+    ):
+        self.chat_id = str(chat_id)
+        self.name = name or self.chat_id
+        self.min_score = float(min_score or 0.0)
+        # مجموعه خالی / None یعنی بدون محدودیت
+        self.source_tables = frozenset(source_tables or ())
+        self.symbols_allow = frozenset(symbols_allow or ())
+        self.symbols_deny = frozenset(symbols_deny or ())
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Subscriber":
+        return cls(
+            chat_id=data['chat_id'],
+            name=data.get('name'),
+            min_score=data.get('min_score', 0.0),
+            source_tables=data.get('source_tables'),
+            symbols_allow=data.get('symbols_allow'),
+            symbols_deny=data.get('symbols_deny'),
+        )
+
+    def matches(self, alert: Dict[str, Any]) -> bool:
+        symbol = alert.get('symbol_name')
+        if float(alert.get('score') or 0) < self.min_score:
+            return False
+        if self.source_tables and alert.get('source_table') not in self.source_tables:
+            return False
+        if self.symbols_allow and symbol not in self.symbols_allow:
+            return False
+        return symbol not in self.symbols_deny
+
+    def __repr__(self):
+        return f"Subscriber({self.name}, chat_id={self.chat_id})"
+
+
+class SubscriberRegistry:
+    """
+    مشترکین را از فایل JSON می‌خواند و با تغییر فایل (mtime) دوباره بارگذاری می‌کند؛
+    بنابراین اضافه/حذف مشترک نیاز به راه‌اندازی مجدد سرور ندارد.
+    """
+
+    def __init__(self, path: str = TELEGRAM_SUBSCRIBERS_FILE, default_chat_id: Optional[str] = None):
+        self.path = path
+        self.default_chat_id = default_chat_id
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._subscribers: List[Subscriber] = self._default()
+
+    def _default(self) -> List[Subscriber]:
+        return [Subscriber(self.default_chat_id, name="default")] if self.default_chat_id else []
+
+    def get(self) -> List[Subscriber]:
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+
+        with self._lock:
+            if mtime != self._mtime:
+                self._mtime = mtime
+                self._subscribers = self._load() if mtime is not None else self._default()
+            return list(self._subscribers)
+
+    def _load(self) -> List[Subscriber]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"❌ Failed to read subscribers file {self.path}: {e}. Keeping previous subscribers.")
+            return self._subscribers
+
+        subscribers = []
+        for entry in entries:
+            try:
+                subscribers.append(Subscriber.from_dict(entry))
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"⚠️ Skipping invalid subscriber entry {entry!r}: {e}")
+        logger.info(f"👥 Loaded {len(subscribers)} Telegram subscribers from {self.path}.")
+        return subscribers
+
+
+def alert_symbol(alert: Dict[str, Any]) -> str:
+    """شناسه هشدار در یک اجرا (هر نماد حداکثر یک هشدار دارد)."""
+    return str(alert.get('symbol_name') or alert.get('symbol_id'))
+
+
+def match_subscribers(subscribers: List[Subscriber], alerts: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    هشدارهای منطبق با فیلتر هر چت: {chat_id: [هشدارها به ترتیب ورودی]}.
+    اگر یک چت چند بار در فهرست آمده باشد، هشداری که با هر کدام از فیلترهایش منطبق باشد ارسال می‌شود.
+    چت‌هایی که هیچ هشداری برایشان منطبق نیست حذف می‌شوند.
+    """
+    by_chat: Dict[str, List[Subscriber]] = {}
+    for subscriber in subscribers:
+        by_chat.setdefault(subscriber.chat_id, []).append(subscriber)
+
+    matches = {}
+    for chat_id, chat_subscribers in by_chat.items():
+        matched = [alert for alert in alerts if any(s.matches(alert) for s in chat_subscribers)]
+        if matched:
+            matches[chat_id] = matched
+    return matches
+
+
+def group_by_filter_result(alerts_by_chat: Dict[str, List[Dict[str, Any]]]) -> List[Tuple[List[Dict[str, Any]], List[str]]]:
+    """
+    چت‌هایی که مجموعه هشدار یکسانی دارند گروه‌بندی می‌شوند: [(هشدارها، [chat_id ها])] —
+    پیام هر گروه فقط یکبار ساخته می‌شود.
+    """
+    groups: Dict[tuple, Tuple[List[Dict[str, Any]], List[str]]] = {}
+    for chat_id, alerts in alerts_by_chat.items():
+        if alerts:
+            key = tuple(alert_symbol(alert) for alert in alerts)
+            groups.setdefault(key, (alerts, []))[1].append(chat_id)
+    return list(groups.values())
@@ -0,0 +1,129 @@
+# symbol_circuit_breaker.py
+# وظیفه: Circuit Breaker برای هر نماد (نمادهای متوقف یا بدون داده لحظه‌ای)
+
+import os
+import json
+import time
+import logging
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# --- تنظیمات ---
+# وضعیت Breaker ها در یک Hash نگه داشته می‌شود تا بعد از ری‌استارت هم باقی بماند
+BREAKER_REDIS_KEY = "market:realtime:breaker"
+BREAKER_STATE_TTL_SECONDS = 24 * 3600
+# تعداد شکست متوالی تا باز شدن Breaker
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 2))
+# Backoff نمایی: base * 2^(n) تا سقف max
+BREAKER_BASE_BACKOFF_SECONDS = float(os.getenv("BREAKER_BASE_BACKOFF_SECONDS", 30))
+BREAKER_MAX_BACKOFF_SECONDS = float(os.getenv("BREAKER_MAX_BACKOFF_SECONDS", 1800))
+# اگر نتیجه درخواست آزمایشی (Half-Open) تا این زمان نرسد، درخواست آزمایشی بعدی مجاز است
+BREAKER_PROBE_TIMEOUT_SECONDS = 60
+
+
+class SymbolCircuitBreaker:
+    """
+    نمادی که پشت سر هم داده لحظه‌ای ندارد (متوقف یا قدیمی) به حالت باز (Open) می‌رود و
+    تا پایان Backoff واکشی نمی‌شود. بعد از آن یک درخواست آزمایشی (Half-Open) ارسال می‌شود:
+    موفقیت Breaker را می‌بندد و شکست، Backoff را دو برابر می‌کند.
+    """
+
+    def __init__(self, redis_client=None):
+        self.redis_client = redis_client
+        self._lock = threading.Lock()
+        self._states: Dict[str, Dict[str, Any]] = {}
+        self._dirty: set = set()
+        self._load()
+
+    def _load(self):
+        if not self.redis_client:
+            return
+        try:
+            raw = self.redis_client.hgetall(BREAKER_REDIS_KEY) or {}
+        except Exception as e:
+            logger.warning(f"⚠️ Could not load circuit breaker state from Redis: {e}")
+            return
+
+        for symbol, value in raw.items():
+            symbol = symbol.decode('utf-8') if isinstance(symbol, bytes) else symbol
+            self._states[symbol] = json.loads(value)
+        if self._states:
+            logger.info(f"♻️ Restored circuit breaker state for {len(self._states)} symbols.")
+
+    # ---------------------------------------------------------
+    # تصمیم‌گیری
+    # ---------------------------------------------------------
+    def allow(self, symbol: str, now: Optional[float] = None) -> bool:
+        """آیا این نماد در این سیکل واکشی شود؟"""
+        now = now or time.time()
+        with self._lock:
+            state = self._states.get(symbol)
+            if not state or state['failures'] < BREAKER_FAILURE_THRESHOLD:
+                return True
+            if now < state['open_until']:
+                return False
+
+            # Half-Open: فقط یک درخواست آزمایشی در هر بازه
+            probing_since = state.get('probing_since')
+            if probing_since and now - probing_since < BREAKER_PROBE_TIMEOUT_SECONDS:
+                return False
+            state['probing_since'] = now
+            return True
+
+    def filter(self, symbols: List[str]) -> Tuple[List[str], List[str]]:
+        """لیست نمادها را به (مجاز، ردشده) تقسیم می‌کند."""
+        now = time.time()
+        allowed, skipped = [], []
+        for symbol in symbols:
+            (allowed if self.allow(symbol, now) else skipped).append(symbol)
+        return allowed, skipped
+
+    def record_success(self, symbol: str):
+        with self._lock:
+            if self._states.pop(symbol, None) is not None:
+                self._dirty.add(symbol)
+                logger.info(f"✅ Circuit closed for {symbol}: real-time data is available again.")
+
+    def record_failure(self, symbol: str, now: Optional[float] = None):
+        now = now or time.time()
+        with self._lock:
+            state = self._states.setdefault(symbol, {'failures': 0, 'open_until': 0.0})
+            state['failures'] += 1
+            state.pop('probing_since', None)
+
+            if state['failures'] >= BREAKER_FAILURE_THRESHOLD:
+                exponent = state['failures'] - BREAKER_FAILURE_THRESHOLD
+                backoff = min(BREAKER_BASE_BACKOFF_SECONDS * (2 ** exponent), BREAKER_MAX_BACKOFF_SECONDS)
+                state['open_until'] = now + backoff
+                logger.info(f"🔌 Circuit open for {symbol} ({state['failures']} failures). Next probe in {backoff:.0f}s.")
+            self._dirty.add(symbol)
+
+    def open_count(self) -> int:
+        with self._lock:
+            return sum(1 for s in self._states.values() if s['failures'] >= BREAKER_FAILURE_THRESHOLD)
+
+    # ---------------------------------------------------------
+    # ذخیره در Redis (یکبار در پایان هر سیکل)
+    # ---------------------------------------------------------
+    def flush(self):
+        if not self.redis_client:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            updates = {s: json.dumps(self._states[s]) for s in self._dirty if s in self._states}
+            removed = [s for s in self._dirty if s not in self._states]
+            self._dirty.clear()
+
+        try:
+            pipe = self.redis_client.pipeline()
+            if updates:
+                pipe.hset(BREAKER_REDIS_KEY, mapping=updates)
+            if removed:
+                pipe.hdel(BREAKER_REDIS_KEY, *removed)
+            pipe.expire(BREAKER_REDIS_KEY, BREAKER_STATE_TTL_SECONDS)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"⚠️ Could not persist circuit breaker state: {e}")
@@ -0,0 +1,131 @@
+# ticker_metadata_cache.py
+# وظیفه: کش روزانه اطلاعات ایستای نمادها (عنوان، حجم مبنا) و بازاستفاده از آبجکت‌های Ticker
+
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from typing import Dict, Any, Optional
+
+import pytse_client as tse
+
+logger = logging.getLogger(__name__)
+
+# --- تنظیمات ---
+TEHRAN_TZ = ZoneInfo("Asia/Tehran")
+TICKER_CACHE_DIR = os.getenv("TICKER_CACHE_DIR", "cache")
+TICKER_METADATA_FILE = "ticker_metadata.json"
+
+
+class TickerMetadataCache:
+    """
+    فیلدهایی مثل ticker.title و ticker.base_volume حداکثر روزی یکبار تغییر می‌کنند،
+    اما هر دسترسی به آن‌ها در pytse-client یک درخواست شبکه جداگانه است.
+    این کلاس:
+    1. آبجکت‌های Ticker را بین سیکل‌ها نگه می‌دارد (بدون ساخت مجدد هر ۵ ثانیه).
+    2. متادیتای هر نماد را فقط یکبار در هر روز معاملاتی واکشی می‌کند.
+    3. متادیتا را در فایل محلی ذخیره می‌کند تا بعد از ری‌استارت، کش گرم باشد.
+    """
+
+    def __init__(self, cache_dir: str = TICKER_CACHE_DIR):
+        self.cache_path = os.path.join(cache_dir, TICKER_METADATA_FILE)
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._tickers: Dict[str, tse.Ticker] = {}
+        self._metadata: Dict[str, Dict[str, Any]] = {}
+        self._trade_date: Optional[str] = None
+        self._dirty = False
+
+        self._load()
+
+    # ---------------------------------------------------------
+    # مدیریت روز معاملاتی و فایل کش
+    # ---------------------------------------------------------
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(TEHRAN_TZ).strftime('%Y-%m-%d')
+
+    def _load(self):
+        """متادیتای ذخیره‌شده را فقط اگر متعلق به امروز باشد بارگذاری می‌کند."""
+        self._trade_date = self._today()
+        if not os.path.exists(self.cache_path):
+            return
+
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not read ticker metadata cache ({self.cache_path}): {e}")
+            return
+
+        if data.get('trade_date') != self._trade_date:
+            logger.info("🗓️ Ticker metadata cache belongs to a previous day. Starting cold.")
+            return
+
+        self._metadata = data.get('symbols', {})
+        logger.info(f"♻️ Loaded metadata for {len(self._metadata)} symbols from {self.cache_path}.")
+
+    def _roll_day_if_needed(self):
+        """با شروع روز معاملاتی جدید، کش متادیتا و آبجکت‌های Ticker خالی می‌شوند."""
+        today = self._today()
+        if today != self._trade_date:
+            logger.info(f"🗓️ New trading day ({today}). Resetting ticker metadata cache.")
+            self._trade_date = today
+            self._tickers.clear()
+            self._metadata.clear()
+            self._dirty = True
+
+    def flush(self):
+        """در صورت تغییر، کش را به صورت اتمیک روی دیسک می‌نویسد (یکبار در پایان هر سیکل)."""
+        with self._lock:
+            if not self._dirty:
+                return
+            payload = {'trade_date': self._trade_date, 'symbols': dict(self._metadata)}
+            self._dirty = False
+
+        tmp_path = f"{self.cache_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            logger.error(f"❌ Failed to persist ticker metadata cache: {e}")
+
+    # ---------------------------------------------------------
+    # دسترسی به Ticker و متادیتا
+    # ---------------------------------------------------------
+    def get_ticker(self, symbol: str) -> tse.Ticker:
+        """آبجکت Ticker نماد را برمی‌گرداند (در صورت نبود، یکبار ساخته می‌شود)."""
+        with self._lock:
+            self._roll_day_if_needed()
+            ticker = self._tickers.get(symbol)
+        if ticker is not None:
+            return ticker
+
+        ticker = tse.Ticker(symbol)
+        with self._lock:
+            # اگر Thread دیگری زودتر ساخته باشد، همان را نگه می‌داریم
+            return self._tickers.setdefault(symbol, ticker)
+
+    def get_metadata(self, ticker: tse.Ticker) -> Dict[str, Any]:
+        """
+        متادیتای ایستای نماد را برمی‌گرداند:
+        {'title': ..., 'base_volume': ...}
+        """
+        with self._lock:
+            metadata = self._metadata.get(ticker.symbol)
+        if metadata is not None:
+            return metadata
+
+        # واکشی از TSETMC (فقط یکبار در روز برای هر نماد)
+        metadata = {
+            'title': ticker.title,
+            'base_volume': ticker.base_volume or 0,
+        }
+        with self._lock:
+            self._metadata[ticker.symbol] = metadata
+            self._dirty = True
+        return metadata